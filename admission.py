@@ -0,0 +1,109 @@
+"""
+Admission control: refuse new jobs while the service or a tenant is over capacity
+"""
+import math
+import os
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from database import Job, JobStatus
+from tenant_scheduler import DEFAULT_TENANT
+
+# New jobs are refused while the backlog, overall or of their tenant, or the
+# free upload space is over these limits; 0 disables a limit. The default
+# tenant, shared by every client without a tenant, only has the overall limits.
+ADMISSION_MAX_QUEUED_JOBS = int(os.getenv("ADMISSION_MAX_QUEUED_JOBS", "1000"))
+ADMISSION_MAX_PENDING_FILES = int(os.getenv("ADMISSION_MAX_PENDING_FILES", "200000"))
+ADMISSION_TENANT_MAX_QUEUED_JOBS = int(os.getenv("ADMISSION_TENANT_MAX_QUEUED_JOBS", "100"))
+ADMISSION_TENANT_MAX_PENDING_FILES = int(os.getenv("ADMISSION_TENANT_MAX_PENDING_FILES", "50000"))
+ADMISSION_MIN_FREE_BYTES = int(os.getenv("ADMISSION_MIN_FREE_BYTES", str(10 * 1024 ** 3)))
+ADMISSION_RETRY_AFTER_MAX_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_MAX_SECONDS", "300"))
+
+UPLOAD_ROOT = "/app/uploads"
+
+# Retry delays assume the backlog drains at the rate jobs finished over this window
+DRAIN_WINDOW_SECONDS = 300
+
+
+class AdmissionRejected(Exception):
+    """A new job was refused; tenant_limited if the tenant's own limits refused it"""
+
+    def __init__(self, message: str, retry_after_seconds: int, tenant_limited: bool):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+        self.tenant_limited = tenant_limited
+
+
+def check_admission(db: Session, tenant_id: Optional[str]):
+    """Raise AdmissionRejected if a new job of the tenant must wait"""
+    if ADMISSION_MIN_FREE_BYTES > 0 and _free_space(UPLOAD_ROOT) < ADMISSION_MIN_FREE_BYTES:
+        raise AdmissionRejected(
+            "Not enough free space for uploads", ADMISSION_RETRY_AFTER_MAX_SECONDS, tenant_limited=False
+        )
+    if ADMISSION_MAX_QUEUED_JOBS > 0 or ADMISSION_MAX_PENDING_FILES > 0:
+        _check(db, None, ADMISSION_MAX_QUEUED_JOBS, ADMISSION_MAX_PENDING_FILES)
+    if (tenant_id and tenant_id != DEFAULT_TENANT and
+            (ADMISSION_TENANT_MAX_QUEUED_JOBS > 0 or ADMISSION_TENANT_MAX_PENDING_FILES > 0)):
+        _check(db, tenant_id, ADMISSION_TENANT_MAX_QUEUED_JOBS, ADMISSION_TENANT_MAX_PENDING_FILES)
+
+
+def _check(db: Session, tenant_id: Optional[str], max_queued_jobs: int, max_pending_files: int):
+    queued_jobs, pending_files = _backlog(db, tenant_id)
+    # How far the backlog has to drain before a new job fits
+    excess_jobs = queued_jobs - max_queued_jobs + 1 if max_queued_jobs > 0 else 0
+    excess_files = pending_files - max_pending_files + 1 if max_pending_files > 0 else 0
+    if excess_jobs <= 0 and excess_files <= 0:
+        return
+
+    drained_jobs, drained_files = _finished_since(
+        db, datetime.utcnow() - timedelta(seconds=DRAIN_WINDOW_SECONDS), tenant_id
+    )
+    retry_after = max(_drain_seconds(excess_jobs, drained_jobs), _drain_seconds(excess_files, drained_files))
+    subject = f"Tenant {tenant_id} has" if tenant_id else "The service has"
+    raise AdmissionRejected(
+        f"{subject} too many jobs waiting ({queued_jobs} jobs, {pending_files} files)",
+        retry_after, tenant_limited=tenant_id is not None
+    )
+
+
+def _backlog(db: Session, tenant_id: Optional[str]) -> Tuple[int, int]:
+    """Queued jobs and the files of unfinished jobs not yet converted"""
+    query = db.query(
+        func.coalesce(func.sum(case((Job.status == JobStatus.PENDING, 1), else_=0)), 0),
+        func.coalesce(func.sum(Job.file_count - Job.completed_count - Job.failed_count), 0)
+    ).filter(Job.status.in_([JobStatus.PENDING, JobStatus.IN_PROGRESS]))
+    if tenant_id is not None:
+        query = query.filter(Job.tenant_id == tenant_id)
+    return tuple(query.one())
+
+
+def _finished_since(db: Session, since: datetime, tenant_id: Optional[str]) -> Tuple[int, int]:
+    query = db.query(
+        func.count(Job.id),
+        func.coalesce(func.sum(Job.file_count), 0)
+    ).filter(Job.status.in_([JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED]), Job.updated_at >= since)
+    if tenant_id is not None:
+        query = query.filter(Job.tenant_id == tenant_id)
+    return tuple(query.one())
+
+
+def _drain_seconds(excess: int, drained: int) -> int:
+    if excess <= 0:
+        return 0
+    if drained <= 0:
+        return ADMISSION_RETRY_AFTER_MAX_SECONDS
+    seconds = math.ceil(excess * DRAIN_WINDOW_SECONDS / drained)
+    return max(1, min(ADMISSION_RETRY_AFTER_MAX_SECONDS, seconds))
+
+
+def _free_space(directory_path: str) -> int:
+    """Bytes available on the filesystem holding the directory, or its nearest existing parent"""
+    path = Path(directory_path)
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    return shutil.disk_usage(path).free
@@ -1,13 +1,133 @@
 """
 Dependency injection container for the application
 """
+import os
 from typing import Dict, Any
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from ..infrastructure.database.models import DATABASE_URL
+from ..infrastructure.database.async_engine import create_async_db_engine
 from ..infrastructure.database.repositories import SQLAlchemyJobRepository, SQLAlchemyFileRepository
+from ..infrastructure.database.async_repositories import (
+    AsyncSQLAlchemyJobRepository, AsyncSQLAlchemyFileRepository
+)
 from ..infrastructure.services.file_converter import LibreOfficeFileConverter
+from ..infrastructure.services.libreoffice_pool import LibreOfficeProcessPool, LibreOfficePoolFileConverter
+from ..infrastructure.services.conversion_cache import CachingFileConverter
+from ..infrastructure.services.quarantine import RedisDocumentQuarantine, QuarantiningFileConverter
 from ..infrastructure.services.file_validator import DocxFileValidator
 from ..infrastructure.services.file_storage import LocalFileStorage
 from ..infrastructure.services.job_queue import CeleryJobQueue
-from .use_cases import CreateJobUseCase, GetJobStatusUseCase, ProcessJobUseCase
+from ..infrastructure.services.job_cancellation import RedisJobCancellation
+from ..infrastructure.services.tenant_scheduler import RedisTenantScheduler, DEFAULT_TENANT, parse_tenant_weights
+from ..domain.value_objects import AdmissionLimits, ConversionTimeoutPolicy, RetryPolicy
+from ..infrastructure.services.status_cache import (
+    RedisJobStatusCache, StatusCachingJobRepository, StatusCachingFileRepository
+)
+from .use_cases import (
+    CreateJobUseCase, GetJobStatusUseCase, ProcessJobUseCase,
+    ConvertFilesUseCase, FinalizeJobUseCase, DownloadJobResultsUseCase,
+    StreamJobEventsUseCase, ListJobFilesUseCase, ReapStaleJobsUseCase,
+    InspectQuarantineUseCase, ClearQuarantineUseCase, CancelJobUseCase
+)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Connection pool of the API's async database engine
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Server-side limit on a single statement of the API; 0 keeps the server's default
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+# Lifetime of the Redis job status projection after its last write; 0 disables it
+STATUS_CACHE_TTL_SECONDS = int(os.getenv("STATUS_CACHE_TTL_SECONDS", "3600"))
+
+# Largest accepted ZIP upload
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(4 * 1024 ** 3)))
+
+# New jobs are refused while the backlog, overall or of their tenant, or the
+# free upload space is over these limits; 0 disables a limit
+ADMISSION_MAX_QUEUED_JOBS = int(os.getenv("ADMISSION_MAX_QUEUED_JOBS", "1000"))
+ADMISSION_MAX_PENDING_FILES = int(os.getenv("ADMISSION_MAX_PENDING_FILES", "200000"))
+ADMISSION_TENANT_MAX_QUEUED_JOBS = int(os.getenv("ADMISSION_TENANT_MAX_QUEUED_JOBS", "100"))
+ADMISSION_TENANT_MAX_PENDING_FILES = int(os.getenv("ADMISSION_TENANT_MAX_PENDING_FILES", "50000"))
+ADMISSION_MIN_FREE_BYTES = int(os.getenv("ADMISSION_MIN_FREE_BYTES", str(10 * 1024 ** 3)))
+ADMISSION_RETRY_AFTER_MAX_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_MAX_SECONDS", "300"))
+
+# "fast" checks the DOCX package structure only, "deep" also parses it with python-docx
+DOCX_VALIDATION_MODE = os.getenv("DOCX_VALIDATION_MODE", "fast")
+
+# Number of files of a single job converted at the same time
+CONVERSION_CONCURRENCY = int(os.getenv("CONVERSION_CONCURRENCY", str(os.cpu_count() or 1)))
+
+# "subprocess" starts soffice per file, "pool" keeps warm soffice instances per worker
+CONVERTER_BACKEND = os.getenv("CONVERTER_BACKEND", "subprocess")
+SOFFICE_POOL_SIZE = int(os.getenv("SOFFICE_POOL_SIZE", str(CONVERSION_CONCURRENCY)))
+SOFFICE_MAX_CONVERSIONS = int(os.getenv("SOFFICE_MAX_CONVERSIONS", "200"))
+SOFFICE_BINARY = os.getenv("SOFFICE_BINARY", "soffice")
+UNO_PYTHON = os.getenv("UNO_PYTHON", "/usr/bin/python3")
+
+# A file may convert for CONVERSION_TIMEOUT_FACTOR times its predicted cost,
+# kept within the min and max seconds
+CONVERSION_TIMEOUT_FACTOR = float(os.getenv("CONVERSION_TIMEOUT_FACTOR", "10"))
+CONVERSION_TIMEOUT_MIN_SECONDS = float(os.getenv("CONVERSION_TIMEOUT_MIN_SECONDS", "60"))
+CONVERSION_TIMEOUT_MAX_SECONDS = float(os.getenv("CONVERSION_TIMEOUT_MAX_SECONDS", "1800"))
+
+# Small files are converted together, one soffice run per batch of at most
+# this many bytes and files (subprocess backend); 0 bytes disables batching
+CONVERSION_BATCH_MAX_BYTES = int(os.getenv("CONVERSION_BATCH_MAX_BYTES", "0"))
+CONVERSION_BATCH_MAX_FILES = int(os.getenv("CONVERSION_BATCH_MAX_FILES", "20"))
+
+# Attempts a file gets when its conversion crashes or fails around the
+# converter, and when it times out; retries back off exponentially from the
+# base delay up to the max delay
+CONVERSION_MAX_ATTEMPTS = int(os.getenv("CONVERSION_MAX_ATTEMPTS", "3"))
+CONVERSION_TIMEOUT_MAX_ATTEMPTS = int(os.getenv("CONVERSION_TIMEOUT_MAX_ATTEMPTS", "2"))
+CONVERSION_RETRY_BASE_DELAY_SECONDS = float(os.getenv("CONVERSION_RETRY_BASE_DELAY_SECONDS", "2"))
+CONVERSION_RETRY_MAX_DELAY_SECONDS = float(os.getenv("CONVERSION_RETRY_MAX_DELAY_SECONDS", "60"))
+
+# Content-addressed PDF cache in front of the converter; 0 disables it
+CONVERSION_CACHE_DIR = os.getenv("CONVERSION_CACHE_DIR", "/app/cache/conversions")
+CONVERSION_CACHE_MAX_BYTES = int(os.getenv("CONVERSION_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+
+# Documents that time out or crash the converter more than this many times are
+# failed right away until QUARANTINE_TTL_SECONDS after their last failure; 0 disables it
+QUARANTINE_MAX_FAILURES = int(os.getenv("QUARANTINE_MAX_FAILURES", "2"))
+QUARANTINE_TTL_SECONDS = int(os.getenv("QUARANTINE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Required in the X-Admin-Token header of /api/v1/admin endpoints; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# File status writes are batched every N ms or N files; an interval of 0 writes through
+STATUS_FLUSH_INTERVAL_MS = int(os.getenv("STATUS_FLUSH_INTERVAL_MS", "500"))
+STATUS_FLUSH_MAX_BATCH = int(os.getenv("STATUS_FLUSH_MAX_BATCH", "200"))
+
+# 0 runs a job as one task; N > 0 fans it out into tasks of N files each
+JOB_FANOUT_CHUNK_SIZE = int(os.getenv("JOB_FANOUT_CHUNK_SIZE", "0"))
+
+# Jobs of at most this many files are queued on the fast lane, bigger ones on the bulk lane
+FAST_LANE_MAX_FILES = int(os.getenv("FAST_LANE_MAX_FILES", "50"))
+# Lanes a worker consumes and how strongly it favours each, e.g. "fast:3,bulk:1"
+WORKER_LANES = os.getenv("WORKER_LANES", "fast:3,bulk:1")
+
+# Deficit round-robin across tenants: files a tenant may start per round (times its
+# weight, e.g. "acme:3,globex:2"), and jobs it may run at once (0 for no cap; the
+# default tenant has none)
+TENANT_QUANTUM_FILES = int(os.getenv("TENANT_QUANTUM_FILES", "100"))
+TENANT_WEIGHTS = os.getenv("TENANT_WEIGHTS", "")
+TENANT_MAX_RUNNING_JOBS = int(os.getenv("TENANT_MAX_RUNNING_JOBS", "2"))
+# How long a dispatch waits before retrying when every queued tenant is at its cap
+TENANT_RETRY_SECONDS = float(os.getenv("TENANT_RETRY_SECONDS", "5"))
+
+# A running job renews its lease every third of this; the reaper requeues
+# jobs whose lease expired, checking every LEASE_REAPER_INTERVAL_SECONDS
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+LEASE_REAPER_INTERVAL_SECONDS = float(os.getenv("LEASE_REAPER_INTERVAL_SECONDS", "60"))
+# Workers running a job check this often whether it was cancelled
+JOB_CANCEL_POLL_SECONDS = float(os.getenv("JOB_CANCEL_POLL_SECONDS", "1"))
+# Unacknowledged tasks are redelivered after this long; keep it above the longest job
+TASK_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("TASK_VISIBILITY_TIMEOUT_SECONDS", str(6 * 3600)))
 
 
 class Container:
@@ -22,21 +142,122 @@ class Container:
         """Get a service from the container"""
         return self._services.get(name)
 
+    def create_async_session_factory(self):
+        """Create the API's async session factory, sharing one pooled engine"""
+        session_factory = self.get("async_session_factory")
+        if session_factory is None:
+            engine = create_async_db_engine(
+                DATABASE_URL,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+                pool_pre_ping=DB_POOL_PRE_PING,
+                statement_timeout_ms=DB_STATEMENT_TIMEOUT_MS
+            )
+            session_factory = async_sessionmaker(engine, expire_on_commit=False)
+            self.register("async_engine", engine)
+            self.register("async_session_factory", session_factory)
+        return session_factory
+
+    async def dispose_async_engine(self):
+        """Close the pooled connections of the async engine, if it was created"""
+        engine = self.get("async_engine")
+        if engine is not None:
+            await engine.dispose()
+            self.register("async_engine", None)
+            self.register("async_session_factory", None)
+
     def create_job_repository(self, db_session):
-        """Create job repository with database session"""
-        return SQLAlchemyJobRepository(db_session)
+        """Create job repository with database session, sync or async"""
+        if isinstance(db_session, AsyncSession):
+            repository = AsyncSQLAlchemyJobRepository(db_session)
+        else:
+            repository = SQLAlchemyJobRepository(db_session)
+        status_cache = self.create_status_cache()
+        if status_cache:
+            repository = StatusCachingJobRepository(repository, status_cache)
+        return repository
 
     def create_file_repository(self, db_session):
-        """Create file repository with database session"""
-        return SQLAlchemyFileRepository(db_session)
+        """Create file repository with database session, sync or async"""
+        if isinstance(db_session, AsyncSession):
+            repository = AsyncSQLAlchemyFileRepository(db_session)
+        else:
+            repository = SQLAlchemyFileRepository(db_session)
+        status_cache = self.create_status_cache()
+        if status_cache:
+            repository = StatusCachingFileRepository(repository, status_cache)
+        return repository
+
+    def create_status_cache(self):
+        """Create the Redis job status projection, or None when it is disabled"""
+        if STATUS_CACHE_TTL_SECONDS <= 0:
+            return None
+        status_cache = self.get("status_cache")
+        if status_cache is None:
+            status_cache = RedisJobStatusCache(REDIS_URL, ttl_seconds=STATUS_CACHE_TTL_SECONDS)
+            self.register("status_cache", status_cache)
+        return status_cache
 
     def create_file_converter(self):
         """Create file converter service"""
-        return LibreOfficeFileConverter()
+        # The pool and cache hold per-process state, so share one converter per worker process
+        converter = self.get("file_converter")
+        if converter is None:
+            if CONVERTER_BACKEND == "pool":
+                pool = LibreOfficeProcessPool(
+                    size=SOFFICE_POOL_SIZE,
+                    max_conversions=SOFFICE_MAX_CONVERSIONS,
+                    soffice_binary=SOFFICE_BINARY,
+                    uno_python=UNO_PYTHON
+                )
+                converter = LibreOfficePoolFileConverter(pool)
+            else:
+                converter = LibreOfficeFileConverter()
+            if CONVERSION_CACHE_MAX_BYTES > 0:
+                converter = CachingFileConverter(
+                    converter,
+                    cache_dir=CONVERSION_CACHE_DIR,
+                    max_bytes=CONVERSION_CACHE_MAX_BYTES
+                )
+            quarantine = self.create_document_quarantine()
+            if quarantine is not None:
+                converter = QuarantiningFileConverter(
+                    converter, quarantine, max_failures=QUARANTINE_MAX_FAILURES
+                )
+            self.register("file_converter", converter)
+        return converter
+
+    def create_timeout_policy(self):
+        """Create the per-file conversion timeout policy"""
+        return ConversionTimeoutPolicy(
+            factor=CONVERSION_TIMEOUT_FACTOR,
+            min_seconds=CONVERSION_TIMEOUT_MIN_SECONDS,
+            max_seconds=CONVERSION_TIMEOUT_MAX_SECONDS
+        )
+
+    def create_retry_policy(self):
+        """Create the policy for retrying failed conversions"""
+        return RetryPolicy(
+            max_attempts=CONVERSION_MAX_ATTEMPTS,
+            timeout_max_attempts=CONVERSION_TIMEOUT_MAX_ATTEMPTS,
+            base_delay_seconds=CONVERSION_RETRY_BASE_DELAY_SECONDS,
+            max_delay_seconds=CONVERSION_RETRY_MAX_DELAY_SECONDS
+        )
+
+    def create_document_quarantine(self):
+        """Create the quarantine of poison documents, or None when it is disabled"""
+        if QUARANTINE_MAX_FAILURES <= 0:
+            return None
+        quarantine = self.get("document_quarantine")
+        if quarantine is None:
+            quarantine = RedisDocumentQuarantine(REDIS_URL, ttl_seconds=QUARANTINE_TTL_SECONDS)
+            self.register("document_quarantine", quarantine)
+        return quarantine
 
     def create_file_validator(self):
         """Create file validator service"""
-        return DocxFileValidator()
+        return DocxFileValidator(mode=DOCX_VALIDATION_MODE)
 
     def create_file_storage(self):
         """Create file storage service"""
@@ -44,7 +265,32 @@ class Container:
 
     def create_job_queue(self):
         """Create job queue service"""
-        return CeleryJobQueue()
+        return CeleryJobQueue(
+            fanout_chunk_size=JOB_FANOUT_CHUNK_SIZE,
+            fast_lane_max_files=FAST_LANE_MAX_FILES,
+            tenant_scheduler=self.create_tenant_scheduler()
+        )
+
+    def create_tenant_scheduler(self):
+        """Create the per-tenant fair scheduler of queued jobs"""
+        tenant_scheduler = self.get("tenant_scheduler")
+        if tenant_scheduler is None:
+            tenant_scheduler = RedisTenantScheduler(
+                REDIS_URL,
+                quantum_files=TENANT_QUANTUM_FILES,
+                max_running_jobs=TENANT_MAX_RUNNING_JOBS,
+                weights=parse_tenant_weights(TENANT_WEIGHTS)
+            )
+            self.register("tenant_scheduler", tenant_scheduler)
+        return tenant_scheduler
+
+    def create_job_cancellation(self):
+        """Create the store of job cancellation requests"""
+        job_cancellation = self.get("job_cancellation")
+        if job_cancellation is None:
+            job_cancellation = RedisJobCancellation(REDIS_URL)
+            self.register("job_cancellation", job_cancellation)
+        return job_cancellation
 
     def create_create_job_use_case(self, db_session):
         """Create the create job use case with all dependencies"""
@@ -53,22 +299,126 @@ class Container:
             file_repository=self.create_file_repository(db_session),
             file_validator=self.create_file_validator(),
             file_storage=self.create_file_storage(),
-            job_queue=self.create_job_queue()
+            job_queue=self.create_job_queue(),
+            max_upload_bytes=MAX_UPLOAD_BYTES,
+            admission_limits=AdmissionLimits(
+                max_queued_jobs=ADMISSION_MAX_QUEUED_JOBS,
+                max_pending_files=ADMISSION_MAX_PENDING_FILES,
+                tenant_max_queued_jobs=ADMISSION_TENANT_MAX_QUEUED_JOBS,
+                tenant_max_pending_files=ADMISSION_TENANT_MAX_PENDING_FILES,
+                min_free_bytes=ADMISSION_MIN_FREE_BYTES,
+                retry_after_max_seconds=ADMISSION_RETRY_AFTER_MAX_SECONDS,
+                shared_tenant_id=DEFAULT_TENANT
+            )
         )
 
     def create_get_job_status_use_case(self, db_session):
         """Create the get job status use case with all dependencies"""
         return GetJobStatusUseCase(
+            job_repository=self.create_job_repository(db_session),
+            file_repository=self.create_file_repository(db_session),
+            status_cache=self.create_status_cache()
+        )
+
+    def create_list_job_files_use_case(self, db_session):
+        """Create the list job files use case with all dependencies"""
+        return ListJobFilesUseCase(
             job_repository=self.create_job_repository(db_session),
             file_repository=self.create_file_repository(db_session)
         )
 
+    def create_stream_job_events_use_case(self, db_session):
+        """Create the job events use case, or None when the status cache is disabled"""
+        status_cache = self.create_status_cache()
+        if status_cache is None:
+            return None
+        return StreamJobEventsUseCase(
+            job_repository=self.create_job_repository(db_session),
+            file_repository=self.create_file_repository(db_session),
+            status_cache=status_cache
+        )
+
+    def create_download_job_results_use_case(self, db_session):
+        """Create the download job results use case with all dependencies"""
+        return DownloadJobResultsUseCase(
+            job_repository=self.create_job_repository(db_session),
+            file_repository=self.create_file_repository(db_session),
+            file_storage=self.create_file_storage()
+        )
+
     def create_process_job_use_case(self, db_session):
         """Create the process job use case with all dependencies"""
         return ProcessJobUseCase(
             job_repository=self.create_job_repository(db_session),
             file_repository=self.create_file_repository(db_session),
             file_converter=self.create_file_converter(),
+            file_storage=self.create_file_storage(),
+            max_concurrency=CONVERSION_CONCURRENCY,
+            status_flush_interval_ms=STATUS_FLUSH_INTERVAL_MS,
+            status_flush_max_batch=STATUS_FLUSH_MAX_BATCH,
+            job_queue=self.create_job_queue(),
+            lease_seconds=JOB_LEASE_SECONDS,
+            timeout_policy=self.create_timeout_policy(),
+            batch_max_bytes=CONVERSION_BATCH_MAX_BYTES,
+            batch_max_files=CONVERSION_BATCH_MAX_FILES,
+            retry_policy=self.create_retry_policy(),
+            job_cancellation=self.create_job_cancellation(),
+            cancel_poll_seconds=JOB_CANCEL_POLL_SECONDS
+        )
+
+    def create_cancel_job_use_case(self, db_session):
+        """Create the cancel job use case with all dependencies"""
+        return CancelJobUseCase(
+            job_repository=self.create_job_repository(db_session),
+            file_repository=self.create_file_repository(db_session),
+            file_storage=self.create_file_storage(),
+            job_queue=self.create_job_queue(),
+            job_cancellation=self.create_job_cancellation(),
+            lease_seconds=JOB_LEASE_SECONDS
+        )
+
+    def create_reap_stale_jobs_use_case(self, db_session):
+        """Create the use case that requeues or settles jobs of dead workers"""
+        return ReapStaleJobsUseCase(
+            job_repository=self.create_job_repository(db_session),
+            file_repository=self.create_file_repository(db_session),
+            job_queue=self.create_job_queue(),
+            file_storage=self.create_file_storage()
+        )
+
+    def create_convert_files_use_case(self, db_session):
+        """Create the convert files use case with all dependencies"""
+        return ConvertFilesUseCase(
+            job_repository=self.create_job_repository(db_session),
+            file_repository=self.create_file_repository(db_session),
+            file_converter=self.create_file_converter(),
+            file_storage=self.create_file_storage(),
+            max_concurrency=CONVERSION_CONCURRENCY,
+            status_flush_interval_ms=STATUS_FLUSH_INTERVAL_MS,
+            status_flush_max_batch=STATUS_FLUSH_MAX_BATCH,
+            timeout_policy=self.create_timeout_policy(),
+            batch_max_bytes=CONVERSION_BATCH_MAX_BYTES,
+            batch_max_files=CONVERSION_BATCH_MAX_FILES,
+            retry_policy=self.create_retry_policy(),
+            job_cancellation=self.create_job_cancellation(),
+            cancel_poll_seconds=JOB_CANCEL_POLL_SECONDS
+        )
+
+    def create_inspect_quarantine_use_case(self):
+        """Create the use case listing quarantined documents, or None when the quarantine is disabled"""
+        quarantine = self.create_document_quarantine()
+        return InspectQuarantineUseCase(quarantine) if quarantine else None
+
+    def create_clear_quarantine_use_case(self):
+        """Create the use case releasing quarantined documents, or None when the quarantine is disabled"""
+        quarantine = self.create_document_quarantine()
+        return ClearQuarantineUseCase(quarantine) if quarantine else None
+
+    def create_finalize_job_use_case(self, db_session):
+        """Create the finalize job use case with all dependencies"""
+        return FinalizeJobUseCase(
+            job_repository=self.create_job_repository(db_session),
+            file_repository=self.create_file_repository(db_session),
             file_storage=self.create_file_storage()
         )
 
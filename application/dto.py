@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 from ..domain.entities import JobStatus, FileStatus
 
@@ -15,8 +15,21 @@ class JobResponseDto(BaseModel):
     status: JobStatus
     created_at: datetime
     download_url: Optional[str] = None
-    files: List[FileInfoDto]
+    # Omitted from summary responses (include_files=false)
+    files: Optional[List[FileInfoDto]] = None
     file_count: int
+    file_counts: Dict[FileStatus, int] = {}
+
+
+class FileListItemDto(FileInfoDto):
+    id: int
+
+
+class FilePageDto(BaseModel):
+    job_id: str
+    files: List[FileListItemDto]
+    # Pass as after_id to fetch the next page; None on the last page
+    next_after_id: Optional[int] = None
 
 
 class JobCreateResponseDto(BaseModel):
@@ -24,5 +37,16 @@ class JobCreateResponseDto(BaseModel):
     file_count: int
 
 
+class QuarantineEntryDto(BaseModel):
+    content_hash: str
+    failures: int
+    # Whether new conversions of the document are failed right away
+    quarantined: bool
+    error_message: str
+    filename: Optional[str] = None
+    last_failed_at: Optional[datetime] = None
+    expires_in_seconds: Optional[int] = None
+
+
 class ErrorResponseDto(BaseModel):
     detail: str
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from dataclasses import replace
+from typing import Dict, Optional
+
+from ..domain.entities import FileEntity
+from ..domain.repositories import FileRepository
+
+logger = logging.getLogger(__name__)
+
+
+class FileStatusFlusher:
+    """
+    Write-behind buffer for file status transitions.
+
+    Transitions are coalesced per file and written with one
+    `update_batch` every `interval_ms` milliseconds, or as soon as
+    `max_batch` files are waiting. An interval of 0 writes every
+    transition through immediately.
+    """
+
+    def __init__(self, file_repository: FileRepository, interval_ms: int = 500, max_batch: int = 200):
+        self.file_repository = file_repository
+        self.interval_ms = max(0, interval_ms)
+        self.max_batch = max(1, max_batch)
+        self._pending: Dict[int, FileEntity] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the periodic flush loop"""
+        if self.interval_ms > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def record(self, file_entity: FileEntity):
+        """Buffer the current state of a file; only its latest state is written"""
+        # Snapshot so later transitions don't race with a flush in progress
+        self._pending[file_entity.id] = replace(file_entity)
+        if self.interval_ms == 0 or len(self._pending) >= self.max_batch:
+            await self.flush()
+
+    async def flush(self):
+        """Write all buffered transitions in one batch"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                await self.file_repository.update_batch(list(batch.values()))
+            except Exception:
+                # Put the batch back without overwriting newer transitions
+                for file_id, file_entity in batch.items():
+                    self._pending.setdefault(file_id, file_entity)
+                raise
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_ms / 1000)
+            # Shielded so stop() never cancels a batch halfway through
+            await asyncio.shield(self._periodic_flush())
+
+    async def _periodic_flush(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing file statuses: {str(e)}")
@@ -1,15 +1,88 @@
-from typing import List, Optional
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+import asyncio
+import math
 import uuid
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from ..domain.entities import JobEntity, FileEntity, JobStatus, FileStatus
-from ..domain.value_objects import JobProcessingResult, ConversionResult
+from ..domain.entities import JobEntity, FileEntity, JobStatus, FileStatus, longest_first
+from ..domain.value_objects import (
+    JobProcessingResult, ConversionResult, JobPriority, AdmissionLimits, Backlog,
+    ConversionTimeoutPolicy, QuarantineEntry, RetryPolicy, FailureKind
+)
+from ..domain.exceptions import AdmissionRejectedError
 from ..domain.repositories import JobRepository, FileRepository
-from ..domain.services import FileConverter, FileValidator, FileStorage, JobQueue
+from ..domain.services import (
+    FileConverter, FileValidator, FileStorage, JobQueue, JobStatusCache, DocumentQuarantine,
+    JobCancellation
+)
+from .status_flusher import FileStatusFlusher
 
 logger = logging.getLogger(__name__)
 
+FINISHED_STATUS_VALUES = (JobStatus.COMPLETED.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value)
+JOB_CANCELLED_MESSAGE = "Job was cancelled"
+
+
+class AdmitJobUseCase:
+    """
+    Refuses new jobs while the backlog or the upload disk is over its limits,
+    overall or for the submitting tenant. The suggested retry delay is the
+    time the backlog over the limit takes to drain at the rate jobs finished
+    during the last DRAIN_WINDOW_SECONDS.
+    """
+
+    DRAIN_WINDOW_SECONDS = 300
+
+    def __init__(self, job_repository: JobRepository, file_storage: FileStorage,
+                 limits: AdmissionLimits, upload_root: str = "/app/uploads"):
+        self.job_repository = job_repository
+        self.file_storage = file_storage
+        self.limits = limits
+        self.upload_root = upload_root
+
+    async def execute(self, tenant_id: Optional[str] = None):
+        limits = self.limits
+        if limits.min_free_bytes > 0 and await self.file_storage.free_space(self.upload_root) < limits.min_free_bytes:
+            raise AdmissionRejectedError(
+                "Not enough free space for uploads", limits.retry_after_max_seconds, tenant_limited=False
+            )
+        if limits.max_queued_jobs > 0 or limits.max_pending_files > 0:
+            await self._check(None, limits.max_queued_jobs, limits.max_pending_files)
+        if (tenant_id and tenant_id != limits.shared_tenant_id and
+                (limits.tenant_max_queued_jobs > 0 or limits.tenant_max_pending_files > 0)):
+            await self._check(tenant_id, limits.tenant_max_queued_jobs, limits.tenant_max_pending_files)
+
+    async def _check(self, tenant_id: Optional[str], max_queued_jobs: int, max_pending_files: int):
+        backlog = await self.job_repository.get_backlog(tenant_id)
+        # How far the backlog has to drain before a new job fits
+        excess = Backlog(
+            jobs=backlog.jobs - max_queued_jobs + 1 if max_queued_jobs > 0 else 0,
+            files=backlog.files - max_pending_files + 1 if max_pending_files > 0 else 0
+        )
+        if excess.jobs <= 0 and excess.files <= 0:
+            return
+        
+        since = datetime.utcnow() - timedelta(seconds=self.DRAIN_WINDOW_SECONDS)
+        drained = await self.job_repository.get_finished_since(since, tenant_id)
+        retry_after = max(
+            self._drain_seconds(excess.jobs, drained.jobs),
+            self._drain_seconds(excess.files, drained.files)
+        )
+        subject = f"Tenant {tenant_id} has" if tenant_id else "The service has"
+        raise AdmissionRejectedError(
+            f"{subject} too many jobs waiting ({backlog.jobs} jobs, {backlog.files} files)",
+            retry_after, tenant_limited=tenant_id is not None
+        )
+
+    def _drain_seconds(self, excess: int, drained: int) -> int:
+        if excess <= 0:
+            return 0
+        if drained <= 0:
+            return self.limits.retry_after_max_seconds
+        seconds = math.ceil(excess * self.DRAIN_WINDOW_SECONDS / drained)
+        return max(1, min(self.limits.retry_after_max_seconds, seconds))
+
 
 class CreateJobUseCase:
     def __init__(
@@ -18,15 +91,24 @@ class CreateJobUseCase:
         file_repository: FileRepository,
         file_validator: FileValidator,
         file_storage: FileStorage,
-        job_queue: JobQueue
+        job_queue: JobQueue,
+        max_upload_bytes: Optional[int] = None,
+        admission_limits: Optional[AdmissionLimits] = None
     ):
         self.job_repository = job_repository
         self.file_repository = file_repository
         self.file_validator = file_validator
         self.file_storage = file_storage
         self.job_queue = job_queue
+        self.max_upload_bytes = max_upload_bytes
+        self.admit_job = AdmitJobUseCase(job_repository, file_storage, admission_limits or AdmissionLimits())
 
-    async def execute(self, zip_content: bytes, zip_filename: str) -> JobEntity:
+    async def execute(self, zip_stream: AsyncIterator[bytes], zip_filename: str,
+                      priority: Optional[JobPriority] = None,
+                      tenant_id: Optional[str] = None) -> JobEntity:
+        # Refuse the job before anything is written to disk
+        await self.admit_job.execute(tenant_id)
+        
         # Generate unique job ID
         job_id = str(uuid.uuid4())
         
@@ -37,21 +119,26 @@ class CreateJobUseCase:
         await self.file_storage.create_directory(job_upload_dir)
         await self.file_storage.create_directory(job_output_dir)
         
-        # Save uploaded zip file
+        # Stream uploaded zip file to disk
         zip_path = f"{job_upload_dir}/uploaded_files.zip"
-        await self.file_storage.save_uploaded_file(zip_content, zip_path)
+        upload = await self.file_storage.save_uploaded_file(
+            zip_stream, zip_path, max_bytes=self.max_upload_bytes
+        )
+        logger.info(f"Stored upload {zip_filename} for job {job_id}: {upload.size} bytes, sha256 {upload.sha256}")
         
         # Extract and validate DOCX files
         extracted_files = await self.file_storage.extract_zip_file(zip_path, job_upload_dir)
+        docx_files = [file_path for file_path in extracted_files if file_path.endswith('.docx')]
+        validation_results = await asyncio.gather(
+            *(self.file_validator.validate_docx_file(file_path) for file_path in docx_files)
+        )
         valid_docx_files = []
         
-        for file_path in extracted_files:
-            if file_path.endswith('.docx'):
-                validation_result = await self.file_validator.validate_docx_file(file_path)
-                if validation_result.is_valid:
-                    valid_docx_files.append(file_path)
-                else:
-                    logger.warning(f"Invalid DOCX file: {file_path}")
+        for file_path, validation_result in zip(docx_files, validation_results):
+            if validation_result.is_valid:
+                valid_docx_files.append(validation_result)
+            else:
+                logger.warning(f"Invalid DOCX file: {file_path}")
         
         if not valid_docx_files:
             raise ValueError("No valid DOCX files found in the ZIP")
@@ -61,60 +148,559 @@ class CreateJobUseCase:
             id=job_id,
             status=JobStatus.PENDING,
             file_count=len(valid_docx_files),
-            created_at=datetime.utcnow()
+            created_at=datetime.utcnow(),
+            tenant_id=tenant_id
         )
         
-        # Create file entities
-        for file_path in valid_docx_files:
-            filename = file_path.split('/')[-1]
+        # Create file entities, keeping the validation verdict for the worker
+        for validation_result in valid_docx_files:
+            filename = validation_result.filename.split('/')[-1]
             file_entity = FileEntity(
                 id=None,
                 job_id=job_id,
                 filename=filename,
                 status=FileStatus.PENDING,
+                validation_mode=validation_result.validation_mode,
+                estimated_cost_seconds=validation_result.estimated_cost_seconds,
                 created_at=datetime.utcnow()
             )
             job.add_file(file_entity)
         
-        # Save to repositories
+        # Save to repositories, inserting all file rows at once
         saved_job = await self.job_repository.create(job)
-        for file_entity in job.files:
-            await self.file_repository.create(file_entity)
+        saved_files = await self.file_repository.create_many(job.files)
+        file_ids = [saved_file.id for saved_file in longest_first(saved_files)]
         
-        # Queue the job for processing
-        await self.job_queue.enqueue_job(job_id)
+        # Queue the job for processing, on the lane of its priority or size
+        await self.job_queue.enqueue_job(job_id, file_ids, priority, tenant_id)
         
         logger.info(f"Created job {job_id} with {len(valid_docx_files)} files")
         return saved_job
 
 
+class DownloadJobResultsUseCase:
+    def __init__(self, job_repository: JobRepository, file_repository: FileRepository,
+                 file_storage: FileStorage):
+        self.job_repository = job_repository
+        self.file_repository = file_repository
+        self.file_storage = file_storage
+
+    async def execute(self, job_id: str) -> Optional[Iterator[bytes]]:
+        """Return a stream of the job's ZIP archive, or None if the job does not exist"""
+        job = await self.job_repository.get_by_id(job_id)
+        if not job:
+            return None
+        if job.status != JobStatus.COMPLETED:
+            raise ValueError("Job is not completed yet")
+        
+        files = await self.file_repository.get_by_job_id(job_id)
+        pdf_files = []
+        for file_entity in files:
+            if file_entity.status != FileStatus.COMPLETED:
+                continue
+            pdf_name = file_entity.filename.replace('.docx', '.pdf')
+            pdf_path = f"/app/outputs/{job_id}/{pdf_name}"
+            if await self.file_storage.file_exists(pdf_path):
+                pdf_files.append((pdf_path, pdf_name))
+        
+        if not pdf_files:
+            raise FileNotFoundError("Download file not found")
+        return self.file_storage.stream_zip_archive(pdf_files)
+
+
 class GetJobStatusUseCase:
-    def __init__(self, job_repository: JobRepository, file_repository: FileRepository):
+    def __init__(
+        self,
+        job_repository: JobRepository,
+        file_repository: FileRepository,
+        status_cache: Optional[JobStatusCache] = None
+    ):
         self.job_repository = job_repository
         self.file_repository = file_repository
+        self.status_cache = status_cache
 
-    async def execute(self, job_id: str) -> Optional[JobEntity]:
+    async def execute(self, job_id: str, include_files: bool = True) -> Optional[JobEntity]:
+        """
+        The job with its per-status file counts, and with its files unless
+        include_files is False
+        """
+        # Serve from the status projection, falling back to the database
+        if self.status_cache:
+            try:
+                if include_files:
+                    cached_job = await self.status_cache.get_job(job_id)
+                    if cached_job:
+                        cached_job.file_counts = cached_job.count_files_by_status()
+                else:
+                    cached_job = await self.status_cache.get_summary(job_id)
+                if cached_job:
+                    return cached_job
+            except Exception as e:
+                logger.warning(f"Could not read cached status of job {job_id}: {str(e)}")
+        
+        # Comes with the job's progress counters, so a summary loads no file rows
         job = await self.job_repository.get_by_id(job_id)
-        if job:
-            files = await self.file_repository.get_by_job_id(job_id)
-            job.files = files
+        if not job or not include_files:
+            return job
+        
+        job.files = await self.file_repository.get_by_job_id(job_id)
+        job.file_counts = job.count_files_by_status()
+        if self.status_cache:
+            await self._backfill_cache(job)
         return job
 
+    async def get_version(self, job_id: str) -> Optional[int]:
+        """Status version of the job, read without loading its files"""
+        if self.status_cache:
+            try:
+                version = await self.status_cache.get_version(job_id)
+                if version is not None:
+                    return version
+            except Exception as e:
+                logger.warning(f"Could not read cached version of job {job_id}: {str(e)}")
+        return await self.job_repository.get_version(job_id)
+
+    async def _backfill_cache(self, job: JobEntity):
+        try:
+            await self.status_cache.store_job(job, only_missing=True)
+            await self.status_cache.store_files(job.id, job.files, only_missing=True)
+        except Exception as e:
+            logger.warning(f"Could not cache status of job {job.id}: {str(e)}")
+
+
+class ListJobFilesUseCase:
+    """Pages through the files of a job, optionally only those in one status"""
+
+    def __init__(self, job_repository: JobRepository, file_repository: FileRepository):
+        self.job_repository = job_repository
+        self.file_repository = file_repository
+
+    async def execute(
+        self,
+        job_id: str,
+        status: Optional[FileStatus] = None,
+        after_id: Optional[int] = None,
+        limit: int = 100
+    ) -> Optional[Tuple[List[FileEntity], Optional[int]]]:
+        """
+        Returns None when the job does not exist, otherwise the page of files
+        and the cursor of the next page (None on the last page)
+        """
+        if await self.job_repository.get_version(job_id) is None:
+            return None
+        
+        # Fetch one extra row to learn whether another page follows
+        files = await self.file_repository.get_page(job_id, status, after_id, limit + 1)
+        if len(files) > limit:
+            files = files[:limit]
+            return files, files[-1].id
+        return files, None
+
+
+class StreamJobEventsUseCase:
+    """Streams a job's current status followed by its live status changes"""
+
+    def __init__(
+        self,
+        job_repository: JobRepository,
+        file_repository: FileRepository,
+        status_cache: JobStatusCache
+    ):
+        self.status_cache = status_cache
+        self.get_job_status = GetJobStatusUseCase(job_repository, file_repository, status_cache)
+
+    async def execute(self, job_id: str) -> Optional[AsyncIterator[Tuple[str, Any]]]:
+        """
+        Returns None when the job does not exist. Otherwise yields
+        ("snapshot", JobEntity) once, then ("file", dict), ("job", dict) and
+        ("heartbeat", None) events, and ends with ("complete", dict) once the
+        job has finished.
+        """
+        # Subscribe before reading the snapshot so no transition falls in between
+        events = self.status_cache.subscribe(job_id)
+        try:
+            await events.__anext__()
+            job = await self.get_job_status.execute(job_id)
+        except BaseException:
+            await events.aclose()
+            raise
+        if not job:
+            await events.aclose()
+            return None
+        return self._stream(job, events)
+
+    async def _stream(self, job: JobEntity, events: AsyncIterator[dict]) -> AsyncIterator[Tuple[str, Any]]:
+        try:
+            yield "snapshot", job
+            if job.is_finished():
+                yield "complete", {
+                    "id": job.id,
+                    "status": job.status.value,
+                    "download_url": job.download_url,
+                    "error_message": job.error_message
+                }
+                return
+            
+            async for event in events:
+                if event["type"] == "heartbeat":
+                    yield "heartbeat", None
+                elif event["type"] == "files":
+                    for file_event in event["files"]:
+                        yield "file", file_event
+                elif event["type"] == "job":
+                    yield "job", event["job"]
+                    if event["job"]["status"] in FINISHED_STATUS_VALUES:
+                        yield "complete", event["job"]
+                        return
+        finally:
+            await events.aclose()
+
+
+class ConvertFilesUseCase:
+    """
+    Converts some or all files of a job without finalizing the job.
+
+    With batch_max_bytes > 0 and a converter that supports batches, small
+    files are converted together in batches of at most batch_max_bytes and
+    batch_max_files each.
+
+    Files whose conversion failed for a reason that may pass, such as a
+    converter crash, are retried with backoff as the retry policy allows;
+    only they are converted again, not the rest of their batch.
+
+    With a job_cancellation, the run checks every cancel_poll_seconds
+    whether the job was cancelled, and then abandons the conversions in
+    flight and deletes the job's files. A chunk of a fanned-out job only
+    settles its own files, leaving the rest to the finalizer.
+    """
 
-class ProcessJobUseCase:
     def __init__(
         self,
         job_repository: JobRepository,
         file_repository: FileRepository,
         file_converter: FileConverter,
-        file_storage: FileStorage
+        file_storage: FileStorage,
+        max_concurrency: int = 1,
+        status_flush_interval_ms: int = 0,
+        status_flush_max_batch: int = 1,
+        timeout_policy: Optional[ConversionTimeoutPolicy] = None,
+        batch_max_bytes: int = 0,
+        batch_max_files: int = 20,
+        retry_policy: Optional[RetryPolicy] = None,
+        job_cancellation: Optional[JobCancellation] = None,
+        cancel_poll_seconds: float = 1.0
     ):
         self.job_repository = job_repository
         self.file_repository = file_repository
         self.file_converter = file_converter
         self.file_storage = file_storage
+        self.max_concurrency = max(1, max_concurrency)
+        self.status_flush_interval_ms = status_flush_interval_ms
+        self.status_flush_max_batch = status_flush_max_batch
+        self.timeout_policy = timeout_policy or ConversionTimeoutPolicy()
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_max_files = max(1, batch_max_files)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.job_cancellation = job_cancellation
+        self.cancel_poll_seconds = cancel_poll_seconds
+
+    async def execute(self, job_id: str, file_ids: Optional[List[int]] = None,
+                      should_stop: Optional[Callable[[], bool]] = None) -> JobProcessingResult:
+        """
+        Convert the files, skipping ones a previous run already converted or failed.
+        Once should_stop returns True no further file is started; the result
+        is then marked interrupted.
+        """
+        job = await self.job_repository.get_by_id(job_id)
+        if not job:
+            logger.error(f"Job {job_id} not found")
+            return JobProcessingResult.failure_result(job_id, "Job not found")
+        if job.status == JobStatus.CANCELLED:
+            logger.info(f"Job {job_id} was cancelled, skipping its files")
+            return await self._abandon(job_id, file_ids)
+        
+        # The first part of a job to run moves it to IN_PROGRESS
+        if job.status == JobStatus.PENDING:
+            job.mark_in_progress()
+            if not await self.job_repository.update_if_unfinished(job):
+                logger.info(f"Job {job_id} was cancelled, skipping its files")
+                return await self._abandon(job_id, file_ids)
+        
+        if file_ids is None:
+            files = await self.file_repository.get_by_job_id(job_id)
+        else:
+            files = await self.file_repository.get_by_ids(file_ids)
+        # The semaphore admits waiters in order, so the longest conversions start first
+        batches = await self._plan_batches(job_id, longest_first(files))
+        
+        # Status transitions are written behind in batches; stop() flushes the
+        # terminal states before anyone gets to finalize the job
+        flusher = FileStatusFlusher(
+            self.file_repository, self.status_flush_interval_ms, self.status_flush_max_batch
+        )
+        await flusher.start()
+        cancelled = asyncio.Event()
+        watcher = None
+        try:
+            # Process batches concurrently, at most max_concurrency at a time
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            conversion = asyncio.gather(
+                *(self._process_batch(job_id, batch, semaphore, flusher, should_stop)
+                  for batch in batches)
+            )
+            if self.job_cancellation:
+                watcher = asyncio.create_task(self._watch_cancellation(job_id, conversion, cancelled))
+            batch_results = await conversion
+        except asyncio.CancelledError:
+            if not cancelled.is_set():
+                raise
+        finally:
+            if watcher:
+                watcher.cancel()
+            await flusher.stop()
+        if cancelled.is_set():
+            return await self._abandon(job_id, file_ids)
+        results = [converted for batch_result in batch_results for converted in batch_result]
+        completed_files = sum(1 for converted in results if converted)
+        failed_files = sum(1 for converted in results if converted is False)
+        
+        if None in results:
+            return JobProcessingResult.interrupted_result(job_id, completed_files, failed_files)
+        return JobProcessingResult.success_result(job_id, completed_files, failed_files)
+
+    async def _watch_cancellation(self, job_id: str, conversion: asyncio.Future, cancelled: asyncio.Event):
+        """Cancel the conversion, killing the converters it runs, once the job is cancelled"""
+        while not conversion.done():
+            await asyncio.sleep(self.cancel_poll_seconds)
+            try:
+                requested = await self.job_cancellation.is_requested(job_id)
+            except Exception as e:
+                logger.warning(f"Could not check whether job {job_id} was cancelled: {str(e)}")
+                continue
+            if requested:
+                logger.info(f"Job {job_id} was cancelled, abandoning its conversions")
+                cancelled.set()
+                conversion.cancel()
+                return
+
+    async def _abandon(self, job_id: str, file_ids: Optional[List[int]] = None) -> JobProcessingResult:
+        """
+        Settle the files of a cancelled job and release its disk space. A
+        chunk settles only its own files: other chunks may still be
+        converting theirs.
+        """
+        await _fail_unfinished_files(self.file_repository, job_id, JOB_CANCELLED_MESSAGE, file_ids)
+        if file_ids is None:
+            await _delete_job_files(self.file_storage, job_id)
+        job = await self.job_repository.get_by_id(job_id)
+        return JobProcessingResult.cancelled_result(
+            job_id, job.file_counts.get(FileStatus.COMPLETED, 0), job.file_counts.get(FileStatus.FAILED, 0)
+        )
+
+    async def _plan_batches(self, job_id: str, files: List[FileEntity]) -> List[List[FileEntity]]:
+        """Group the small files into batches; every other file is a batch of its own"""
+        if self.batch_max_bytes <= 0 or not self.file_converter.supports_batches():
+            return [[file_entity] for file_entity in files]
+        
+        batches = []
+        batch: List[FileEntity] = []
+        batch_bytes = 0
+        for file_entity in files:
+            size = await self.file_storage.file_size(_input_path(job_id, file_entity))
+            if size is None or size > self.batch_max_bytes:
+                batches.append([file_entity])
+                continue
+            if batch and (batch_bytes + size > self.batch_max_bytes or len(batch) >= self.batch_max_files):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(file_entity)
+            batch_bytes += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _process_batch(self, job_id: str, batch: List[FileEntity],
+                             semaphore: asyncio.Semaphore, flusher: FileStatusFlusher,
+                             should_stop: Optional[Callable[[], bool]]) -> List[Optional[bool]]:
+        """
+        Convert a batch of the job's files, returning for each whether it
+        succeeded, or None when it was left for a later run
+        """
+        results: List[Optional[bool]] = [None] * len(batch)
+        pending: Optional[List[int]] = None
+        while True:
+            async with semaphore:
+                if pending is None:
+                    pending = []
+                    for index, file_entity in enumerate(batch):
+                        # Resuming: keep what an earlier run converted, and what
+                        # it gave up on, instead of paying its timeouts again
+                        if (file_entity.status == FileStatus.COMPLETED and
+                                await self.file_storage.file_exists(_output_path(job_id, file_entity))):
+                            results[index] = True
+                        elif file_entity.status == FileStatus.FAILED:
+                            results[index] = False
+                        else:
+                            pending.append(index)
+                if not pending or (should_stop and should_stop()):
+                    return results
+                conversion_results = await self._convert(job_id, [batch[index] for index in pending], flusher)
+            
+            retries = []
+            for index, conversion_result in zip(pending, conversion_results):
+                file_entity = batch[index]
+                error_message = conversion_result.error_message or "Conversion failed"
+                if conversion_result.success:
+                    file_entity.mark_completed()
+                    results[index] = True
+                    logger.info(f"Successfully converted {file_entity.filename}")
+                elif self.retry_policy.should_retry(conversion_result.failure_kind, file_entity.attempts):
+                    file_entity.mark_retrying(error_message)
+                    retries.append(index)
+                    logger.warning(
+                        f"Attempt {file_entity.attempts} to convert {file_entity.filename} failed, "
+                        f"retrying: {error_message}"
+                    )
+                else:
+                    file_entity.mark_failed(error_message)
+                    results[index] = False
+                    logger.error(f"Failed to convert {file_entity.filename}: {error_message}")
+                await flusher.record(file_entity)
+            
+            # Back off outside the semaphore, so other batches use the slot meanwhile
+            if retries:
+                await asyncio.sleep(self.retry_policy.delay_for(max(batch[index].attempts for index in retries)))
+            pending = retries
+
+    async def _convert(self, job_id: str, files: List[FileEntity],
+                       flusher: FileStatusFlusher) -> List[ConversionResult]:
+        """One conversion attempt of the files; errors around the converter fail them all as transient"""
+        conversions = [(_input_path(job_id, f), _output_path(job_id, f)) for f in files]
+        try:
+            # Update file status to IN_PROGRESS
+            for file_entity in files:
+                file_entity.mark_in_progress()
+                await flusher.record(file_entity)
+            
+            # Ensure output directories exist
+            for output_directory in {output_path.rsplit('/', 1)[0] for _, output_path in conversions}:
+                await self.file_storage.create_directory(output_directory)
+            
+            # Convert DOCX to PDF, allowing time in proportion to the predicted cost
+            estimates = [f.estimated_cost_seconds for f in files if f.estimated_cost_seconds is not None]
+            timeout = self.timeout_policy.timeout_for(sum(estimates) if estimates else None)
+            if len(conversions) == 1:
+                return [await self.file_converter.convert_docx_to_pdf(*conversions[0], timeout)]
+            file_timeouts = [self.timeout_policy.timeout_for(f.estimated_cost_seconds) for f in files]
+            return await self.file_converter.convert_batch(conversions, timeout, file_timeouts)
+            
+        except Exception as e:
+            logger.error(f"Error processing {len(files)} files of job {job_id}: {str(e)}")
+            return [
+                ConversionResult.failure_result(
+                    input_path, output_path, str(e), failure_kind=FailureKind.TRANSIENT
+                )
+                for input_path, output_path in conversions
+            ]
+
+
+class FinalizeJobUseCase:
+    """
+    Settles the job as COMPLETED or FAILED once every file is done. A job
+    cancelled meanwhile has the files no run settled failed and, with a
+    file_storage, its uploads and PDFs deleted.
+    """
+
+    def __init__(
+        self,
+        job_repository: JobRepository,
+        file_repository: FileRepository,
+        file_storage: Optional[FileStorage] = None
+    ):
+        self.job_repository = job_repository
+        self.file_repository = file_repository
+        self.file_storage = file_storage
 
     async def execute(self, job_id: str) -> JobProcessingResult:
+        job = await self.job_repository.get_by_id(job_id)
+        if not job:
+            logger.error(f"Job {job_id} not found")
+            return JobProcessingResult.failure_result(job_id, "Job not found")
+        
+        # Read from the job's progress counters instead of its file rows
+        completed_files = job.file_counts[FileStatus.COMPLETED]
+        failed_files = job.file_counts[FileStatus.FAILED]
+        if job.status == JobStatus.CANCELLED:
+            return await self._settle_cancelled(job_id)
+        
+        # The download endpoint streams the archive from the individual PDFs
+        if completed_files > 0:
+            download_url = f"/api/v1/jobs/{job_id}/download"
+            job.mark_completed(download_url)
+        else:
+            job.mark_failed("All files failed to convert")
+        
+        # A cancel that got in first keeps the job CANCELLED
+        if not await self.job_repository.update_if_unfinished(job):
+            logger.info(f"Job {job_id} was cancelled before it could be finalized")
+            return await self._settle_cancelled(job_id)
+        logger.info(f"Job {job_id} completed. Success: {completed_files}, Failed: {failed_files}")
+        
+        return JobProcessingResult.success_result(job_id, completed_files, failed_files)
+
+    async def _settle_cancelled(self, job_id: str) -> JobProcessingResult:
+        # Every run of the job has returned, so nothing converts its files any more
+        await _fail_unfinished_files(self.file_repository, job_id, JOB_CANCELLED_MESSAGE)
+        if self.file_storage:
+            await _delete_job_files(self.file_storage, job_id)
+        job = await self.job_repository.get_by_id(job_id)
+        return JobProcessingResult.cancelled_result(
+            job_id, job.file_counts.get(FileStatus.COMPLETED, 0), job.file_counts.get(FileStatus.FAILED, 0)
+        )
+
+
+class ProcessJobUseCase:
+    """
+    Converts every file of a job and finalizes it in one run.
+
+    The run holds the job's lease and renews it while it works, so the
+    reaper can tell a live run from one whose worker died. A run stopped
+    by should_stop (or that lost its lease) finishes the files in flight
+    and hands the rest of the job back to the queue.
+    """
+
+    def __init__(
+        self,
+        job_repository: JobRepository,
+        file_repository: FileRepository,
+        file_converter: FileConverter,
+        file_storage: FileStorage,
+        max_concurrency: int = 1,
+        status_flush_interval_ms: int = 0,
+        status_flush_max_batch: int = 1,
+        job_queue: Optional[JobQueue] = None,
+        lease_seconds: int = 300,
+        timeout_policy: Optional[ConversionTimeoutPolicy] = None,
+        batch_max_bytes: int = 0,
+        batch_max_files: int = 20,
+        retry_policy: Optional[RetryPolicy] = None,
+        job_cancellation: Optional[JobCancellation] = None,
+        cancel_poll_seconds: float = 1.0
+    ):
+        self.job_repository = job_repository
+        self.file_repository = file_repository
+        self.convert_files = ConvertFilesUseCase(
+            job_repository, file_repository, file_converter, file_storage, max_concurrency,
+            status_flush_interval_ms, status_flush_max_batch, timeout_policy,
+            batch_max_bytes, batch_max_files, retry_policy, job_cancellation, cancel_poll_seconds
+        )
+        self.finalize_job = FinalizeJobUseCase(job_repository, file_repository, file_storage)
+        self.requeue_job = RequeueJobUseCase(file_repository, job_queue) if job_queue else None
+        self.lease_seconds = lease_seconds
+
+    async def execute(self, job_id: str, should_stop: Optional[Callable[[], bool]] = None) -> JobProcessingResult:
+        job = None
+        owner = uuid.uuid4().hex
         try:
             # Get job from repository
             job = await self.job_repository.get_by_id(job_id)
@@ -122,72 +708,220 @@ class ProcessJobUseCase:
                 logger.error(f"Job {job_id} not found")
                 return JobProcessingResult.failure_result(job_id, "Job not found")
             
-            # Update job status to IN_PROGRESS
-            job.mark_in_progress()
-            await self.job_repository.update(job)
+            # A redelivered task of a job that already finished
+            if job.is_finished():
+                logger.info(f"Job {job_id} is already {job.status.value}")
+                return JobProcessingResult.success_result(
+                    job_id, job.file_counts[FileStatus.COMPLETED], job.file_counts[FileStatus.FAILED]
+                )
             
-            # Get all files for this job
-            files = await self.file_repository.get_by_job_id(job_id)
-            job.files = files
-            
-            # Process each file
-            completed_files = 0
-            failed_files = 0
+            if not await self.job_repository.acquire_lease(job_id, owner, self.lease_seconds):
+                logger.info(f"Job {job_id} is being processed by another worker")
+                return JobProcessingResult.failure_result(job_id, "Job is being processed by another worker")
             
-            for file_entity in files:
-                try:
-                    # Update file status to IN_PROGRESS
-                    file_entity.mark_in_progress()
-                    await self.file_repository.update(file_entity)
-                    
-                    # Convert the file
-                    input_path = f"/app/uploads/{job_id}/{file_entity.filename}"
-                    output_path = f"/app/outputs/{job_id}/{file_entity.filename.replace('.docx', '.pdf')}"
-                    
-                    # Ensure output directory exists
-                    await self.file_storage.create_directory(str(output_path).rsplit('/', 1)[0])
-                    
-                    # Convert DOCX to PDF
-                    conversion_result = await self.file_converter.convert_docx_to_pdf(input_path, output_path)
-                    
-                    if conversion_result.success:
-                        file_entity.mark_completed()
-                        completed_files += 1
-                        logger.info(f"Successfully converted {file_entity.filename}")
-                    else:
-                        file_entity.mark_failed(conversion_result.error_message or "Conversion failed")
-                        failed_files += 1
-                        logger.error(f"Failed to convert {file_entity.filename}")
-                    
-                    await self.file_repository.update(file_entity)
-                    
-                except Exception as e:
-                    file_entity.mark_failed(str(e))
-                    failed_files += 1
-                    logger.error(f"Error processing {file_entity.filename}: {str(e)}")
-                    await self.file_repository.update(file_entity)
+            # Update job status to IN_PROGRESS, unless it was cancelled since it was
+            # read; then the run below finds it CANCELLED and settles its files
+            job.mark_in_progress()
+            await self.job_repository.update_if_unfinished(job)
             
-            # Create zip archive if there are completed files
-            if completed_files > 0:
-                zip_path = f"/app/outputs/{job_id}/converted_files.zip"
-                pdf_files = [f"/app/outputs/{job_id}/{f.filename.replace('.docx', '.pdf')}" 
-                           for f in files if f.status == FileStatus.COMPLETED]
-                
-                await self.file_storage.create_zip_archive(pdf_files, zip_path)
-                
-                # Update job with download URL
-                download_url = f"/api/v1/jobs/{job_id}/download"
-                job.mark_completed(download_url)
-            else:
-                job.mark_failed("All files failed to convert")
+            lease_lost = asyncio.Event()
+            heartbeat = asyncio.create_task(self._keep_lease(job_id, owner, lease_lost))
+            try:
+                result = await self.convert_files.execute(
+                    job_id, should_stop=lambda: lease_lost.is_set() or bool(should_stop and should_stop())
+                )
+            finally:
+                heartbeat.cancel()
             
-            await self.job_repository.update(job)
-            logger.info(f"Job {job_id} completed. Success: {completed_files}, Failed: {failed_files}")
+            if result.interrupted:
+                await self._hand_back(job, owner)
+                return result
+            if result.cancelled:
+                await self.job_repository.release_lease(job_id, owner)
+                return result
             
-            return JobProcessingResult.success_result(job_id, completed_files, failed_files)
+            result = await self.finalize_job.execute(job_id)
+            await self.job_repository.release_lease(job_id, owner)
+            return result
             
         except Exception as e:
             logger.error(f"Error processing job {job_id}: {str(e)}")
-            job.mark_failed(str(e))
-            await self.job_repository.update(job)
+            if job:
+                await _fail_unfinished_files(self.file_repository, job_id, str(e))
+                job.mark_failed(str(e))
+                await self.job_repository.update_if_unfinished(job)
+                await self.job_repository.release_lease(job_id, owner)
             return JobProcessingResult.failure_result(job_id, str(e))
+
+    async def _keep_lease(self, job_id: str, owner: str, lease_lost: asyncio.Event):
+        """Renew the lease three times per lease period until cancelled"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await self.job_repository.renew_lease(job_id, owner, self.lease_seconds)
+            except Exception as e:
+                # Keep going; the lease survives a missed renewal
+                logger.warning(f"Could not renew the lease of job {job_id}: {str(e)}")
+                continue
+            if not renewed:
+                logger.warning(f"Job {job_id} lost its lease, stopping after the files in flight")
+                lease_lost.set()
+                return
+
+    async def _hand_back(self, job: JobEntity, owner: str):
+        """Queue the rest of an interrupted job, which stays IN_PROGRESS"""
+        # Unheld, so the reaper leaves it to the queued task however long it waits
+        await self.job_repository.release_lease(job.id, owner)
+        if self.requeue_job:
+            await self.requeue_job.execute(job)
+        logger.info(f"Job {job.id} interrupted, handed back for another worker to resume")
+
+
+class CancelJobUseCase:
+    """
+    Cancels an unfinished job: it is marked CANCELLED, its tasks that have
+    not started are dropped, workers running it are told to stop, and its
+    uploads and PDFs are deleted.
+
+    Whoever holds the job's lease settles its unfinished files: the worker
+    running the job once it stops, otherwise the cancel itself. The reaper
+    settles them if that worker dies. The chunk tasks of a fanned-out job
+    hold no lease; they and its finalizer settle it and delete its files.
+    """
+
+    def __init__(self, job_repository: JobRepository, file_repository: FileRepository,
+                 file_storage: FileStorage, job_queue: JobQueue, job_cancellation: JobCancellation,
+                 lease_seconds: int = 300):
+        self.job_repository = job_repository
+        self.file_repository = file_repository
+        self.file_storage = file_storage
+        self.job_queue = job_queue
+        self.job_cancellation = job_cancellation
+        self.lease_seconds = lease_seconds
+
+    async def execute(self, job_id: str) -> Optional[JobEntity]:
+        """Return the cancelled job, None if it does not exist; ValueError if it already finished"""
+        job = await self.job_repository.get_by_id(job_id)
+        if not job:
+            return None
+        if job.status == JobStatus.CANCELLED:
+            return job
+        
+        job.mark_cancelled()
+        # Conditional, so a job that finished since it was read stays finished
+        if not await self.job_repository.update_if_unfinished(job):
+            job = await self.job_repository.get_by_id(job_id)
+            if job.status == JobStatus.CANCELLED:
+                return job
+            raise ValueError(f"Job is already {job.status.value}")
+        # Workers running the job poll for the request and stop within a poll interval
+        await self.job_cancellation.request(job_id)
+        if await self.job_queue.cancel_job(job_id, job.tenant_id):
+            logger.info(f"Cancelled job {job_id}, leaving its files to its chunk tasks")
+            return await self.job_repository.get_by_id(job_id)
+        owner = uuid.uuid4().hex
+        if await self.job_repository.acquire_lease(job_id, owner, self.lease_seconds):
+            try:
+                await _fail_unfinished_files(self.file_repository, job_id, JOB_CANCELLED_MESSAGE)
+            finally:
+                await self.job_repository.release_lease(job_id, owner)
+        await _delete_job_files(self.file_storage, job_id)
+        logger.info(f"Cancelled job {job_id}")
+        # Reload for the counters of the files failed above
+        return await self.job_repository.get_by_id(job_id)
+
+
+class RequeueJobUseCase:
+    """Queues an unfinished job again, for a worker to resume it"""
+
+    def __init__(self, file_repository: FileRepository, job_queue: JobQueue):
+        self.file_repository = file_repository
+        self.job_queue = job_queue
+
+    async def execute(self, job: JobEntity) -> bool:
+        files = await self.file_repository.get_by_job_id(job.id)
+        return await self.job_queue.enqueue_job(
+            job.id, [file.id for file in longest_first(files)], tenant_id=job.tenant_id
+        )
+
+
+class ReapStaleJobsUseCase:
+    """
+    Requeues IN_PROGRESS jobs whose worker stopped renewing their lease, and
+    settles the files of cancelled ones the worker died before settling
+    """
+
+    def __init__(self, job_repository: JobRepository, file_repository: FileRepository, job_queue: JobQueue,
+                 file_storage: FileStorage):
+        self.job_repository = job_repository
+        self.file_repository = file_repository
+        self.file_storage = file_storage
+        self.requeue_job = RequeueJobUseCase(file_repository, job_queue)
+
+    async def execute(self, limit: int = 100) -> List[str]:
+        # Claiming releases the lease, so the job is queued once until a worker holds it again
+        stale_jobs = await self.job_repository.claim_stale_jobs(limit)
+        for job in stale_jobs:
+            if job.status == JobStatus.CANCELLED:
+                logger.warning(f"Cancelled job {job.id} lost its worker, settling its files")
+                await _fail_unfinished_files(self.file_repository, job.id, JOB_CANCELLED_MESSAGE)
+                await _delete_job_files(self.file_storage, job.id)
+                continue
+            logger.warning(f"Job {job.id} lost its worker, requeueing it")
+            await self.requeue_job.execute(job)
+        return [job.id for job in stale_jobs]
+
+
+class InspectQuarantineUseCase:
+    """Lists the documents that timed out or crashed the converter"""
+
+    def __init__(self, quarantine: DocumentQuarantine):
+        self.quarantine = quarantine
+
+    async def execute(self, limit: int = 100) -> List[QuarantineEntry]:
+        return await self.quarantine.list_entries(limit)
+
+    async def get(self, content_hash: str) -> Optional[QuarantineEntry]:
+        return await self.quarantine.get(content_hash)
+
+
+class ClearQuarantineUseCase:
+    """Releases a document from quarantine, so it is converted again"""
+
+    def __init__(self, quarantine: DocumentQuarantine):
+        self.quarantine = quarantine
+
+    async def execute(self, content_hash: str) -> bool:
+        cleared = await self.quarantine.clear(content_hash)
+        if cleared:
+            logger.info(f"Released document {content_hash} from quarantine")
+        return cleared
+
+
+async def _fail_unfinished_files(file_repository: FileRepository, job_id: str, error_message: str,
+                                 file_ids: Optional[List[int]] = None):
+    """Mark every file, or every one of file_ids, that never reached a final state FAILED in one batch"""
+    try:
+        if file_ids is None:
+            files = await file_repository.get_by_job_id(job_id)
+        else:
+            files = await file_repository.get_by_ids(file_ids)
+        unfinished = [f for f in files if f.status in (FileStatus.PENDING, FileStatus.IN_PROGRESS)]
+        for file_entity in unfinished:
+            file_entity.mark_failed(error_message)
+        await file_repository.update_batch(unfinished)
+    except Exception as e:
+        logger.error(f"Error failing unfinished files of job {job_id}: {str(e)}")
+
+
+async def _delete_job_files(file_storage: FileStorage, job_id: str):
+    await file_storage.delete_directory(f"/app/uploads/{job_id}")
+    await file_storage.delete_directory(f"/app/outputs/{job_id}")
+
+
+def _input_path(job_id: str, file_entity: FileEntity) -> str:
+    return f"/app/uploads/{job_id}/{file_entity.filename}"
+
+
+def _output_path(job_id: str, file_entity: FileEntity) -> str:
+    return f"/app/outputs/{job_id}/{file_entity.filename.replace('.docx', '.pdf')}"
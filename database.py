@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, Text, Enum
+from sqlalchemy import create_engine, Column, String, DateTime, Integer, Float, Text, Enum, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -17,6 +17,7 @@ class JobStatus(str, enum.Enum):
     IN_PROGRESS = "IN_PROGRESS"
     COMPLETED = "COMPLETED"
     FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
 
 
 class FileStatus(str, enum.Enum):
@@ -36,6 +37,24 @@ class Job(Base):
     file_count = Column(Integer, default=0)
     download_url = Column(String, nullable=True)
     error_message = Column(Text, nullable=True)
+    # Tenant (or API key identity) that submitted the job; scheduling is fair across tenants
+    tenant_id = Column(String, nullable=True, index=True)
+    # Bumped on every job or file status change; status ETags derive from it
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Files per status past PENDING, moved in the same transaction as each
+    # file status change; PENDING is file_count minus the three
+    in_progress_count = Column(Integer, nullable=False, default=0, server_default="0")
+    completed_count = Column(Integer, nullable=False, default=0, server_default="0")
+    failed_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Processing lease of an IN_PROGRESS job, renewed by the worker running it;
+    # the reaper requeues jobs whose lease expired
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+
+    __table_args__ = (
+        # Serves the admission checks: unfinished jobs, and jobs finished lately
+        Index("ix_jobs_status_updated_at", "status", "updated_at"),
+    )
 
 
 class File(Base):
@@ -46,9 +65,20 @@ class File(Base):
     filename = Column(String, index=True)
     status = Column(Enum(FileStatus), default=FileStatus.PENDING)
     error_message = Column(Text, nullable=True)
+    validation_mode = Column(String, nullable=True)
+    estimated_cost_seconds = Column(Float, nullable=True)
+    # Conversion attempts started, and the error of the last failed one;
+    # transient failures are retried until the attempts run out
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # Serves keyset pages of a job's files, optionally in one status
+        Index("ix_files_job_status_id", "job_id", "status", "id"),
+    )
+
 
 def get_db():
     db = SessionLocal()
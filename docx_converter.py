@@ -1,77 +1,344 @@
 import subprocess
 import os
+import shutil
+import signal
+import threading
+import zipfile
 import logging
 from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from quarantine import record_conversion_failure
 
 logger = logging.getLogger(__name__)
 
+# Kinds of conversion failure: the worker retries all but permanent ones
+FAILURE_PERMANENT = "permanent"
+FAILURE_TIMEOUT = "timeout"
+FAILURE_CRASH = "crash"
+FAILURE_TRANSIENT = "transient"
+
+# "fast" checks the DOCX package structure only, "deep" also parses it
+DOCX_VALIDATION_MODE = os.getenv("DOCX_VALIDATION_MODE", "fast")
+WORD_MAIN_CONTENT_TYPE = (
+    b"application/vnd.openxmlformats-officedocument."
+    b"wordprocessingml.document.main+xml"
+)
+MAX_CONTENT_TYPES_BYTES = 1024 * 1024
+MAX_DOCUMENT_XML_BYTES = 512 * 1024 * 1024
+
+# LibreOffice processes running per profile directory, so a cancelled job's
+# conversions can be killed; profiles whose conversions were killed, which
+# start no more runs until the mark is cleared
+_running: Dict[str, subprocess.Popen] = {}
+_killed: Set[str] = set()
+_running_lock = threading.Lock()
+
+
+class ConversionFailure(NamedTuple):
+    kind: str
+    message: str
+
+
+_CANCELLED = ConversionFailure(FAILURE_TRANSIENT, "Conversion was cancelled")
 
-def convert_docx_to_pdf(input_path: str, output_path: str) -> bool:
+
+def convert_docx_to_pdf(input_path: str, output_path: str,
+                        profile_dir: Optional[str] = None,
+                        validated: bool = False,
+                        timeout: float = 120) -> bool:
     """
     Convert DOCX file to PDF using LibreOffice
+
+    When `profile_dir` is given, LibreOffice runs with that directory as its
+    user profile and writes into a private output directory below it, so
+    several conversions can run side by side without blocking each other.
+    Pass `validated=True` when the file already passed validation at upload.
+    LibreOffice is killed after `timeout` seconds; timeouts and crashes are
+    counted towards quarantining the document.
     """
+    return convert_docx_file(
+        input_path, output_path, profile_dir=profile_dir, validated=validated, timeout=timeout
+    ) is None
+
+
+def convert_docx_file(input_path: str, output_path: str,
+                      profile_dir: Optional[str] = None,
+                      validated: bool = False,
+                      timeout: float = 120) -> Optional[ConversionFailure]:
+    """Like convert_docx_to_pdf, but return why the conversion failed, None if it succeeded"""
     try:
         # Ensure input file exists
         if not os.path.exists(input_path):
             logger.error(f"Input file does not exist: {input_path}")
-            return False
+            return ConversionFailure(FAILURE_PERMANENT, "Input file does not exist")
         
-        # Validate input file before conversion
-        if not validate_docx_file(input_path):
+        # Validate input file before conversion unless upload already did
+        if not validated and not validate_docx_file(input_path):
             logger.error(f"Input file is not a valid DOCX: {input_path}")
-            return False
+            return ConversionFailure(FAILURE_PERMANENT, "Input file is not a valid DOCX")
         
         # Create output directory if it doesn't exist
         Path(output_path).parent.mkdir(parents=True, exist_ok=True)
         
         # Use LibreOffice to convert DOCX to PDF
-        cmd = [
-            "libreoffice",
+        cmd = ["libreoffice"]
+        if profile_dir:
+            convert_dir = Path(profile_dir) / "output"
+            shutil.rmtree(convert_dir, ignore_errors=True)
+            convert_dir.mkdir(parents=True, exist_ok=True)
+            profile_uri = (Path(profile_dir) / "profile").as_uri()
+            cmd.append(f"-env:UserInstallation={profile_uri}")
+        else:
+            convert_dir = Path(output_path).parent
+        cmd += [
             "--headless",
             "--convert-to", "pdf",
-            "--outdir", str(Path(output_path).parent),
+            "--outdir", str(convert_dir),
             input_path
         ]
         
         logger.info(f"Converting {input_path} to PDF...")
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=120
-        )
+        result = _run_libreoffice(cmd, timeout, profile_dir)
         
+        if result is None:
+            return _CANCELLED
         if result.returncode == 0:
             # LibreOffice creates the file with the same name but .pdf extension
-            expected_pdf = Path(input_path).with_suffix('.pdf')
+            expected_pdf = convert_dir / f"{Path(input_path).stem}.pdf"
             if expected_pdf.exists() and expected_pdf.stat().st_size > 0:
                 # Move to the desired output path
-                expected_pdf.rename(output_path)
+                shutil.move(str(expected_pdf), output_path)
                 logger.info(
                     f"Successfully converted {input_path} to {output_path}"
                 )
-                return True
+                return None
             else:
                 logger.error(
                     f"PDF file was not created or is empty: {expected_pdf}"
                 )
-                return False
+                return ConversionFailure(FAILURE_CRASH, "PDF file was not created")
         else:
             logger.error(f"LibreOffice conversion failed for {input_path}")
             logger.error(f"Return code: {result.returncode}")
             logger.error(f"STDOUT: {result.stdout}")
             logger.error(f"STDERR: {result.stderr}")
-            return False
+            stderr = result.stderr.strip()[:500]
+            message = f"LibreOffice exited with code {result.returncode}" + (f": {stderr}" if stderr else "")
+            record_conversion_failure(input_path, message)
+            return ConversionFailure(FAILURE_CRASH, message)
             
     except subprocess.TimeoutExpired:
         logger.error(f"Conversion timeout for {input_path}")
-        return False
+        message = f"Conversion timed out after {timeout} seconds"
+        record_conversion_failure(input_path, message)
+        return ConversionFailure(FAILURE_TIMEOUT, message)
     except Exception as e:
         logger.error(f"Error converting {input_path}: {str(e)}")
-        return False
+        return ConversionFailure(FAILURE_TRANSIENT, str(e))
 
 
-def validate_docx_file(file_path: str) -> bool:
+def convert_docx_batch_to_pdf(conversions: List[Tuple[str, str]], profile_dir: str,
+                              validated: bool = False, timeout: float = 120,
+                              file_timeouts: Optional[List[float]] = None) -> List[Optional[ConversionFailure]]:
+    """
+    Convert (input_path, output_path) pairs with a single LibreOffice run,
+    paying its startup once, and return why each one failed, None if it
+    was converted
+
+    Files the run leaves unconverted are retried in halves down to single
+    files, so a bad document fails alone instead of with its batch. After a
+    run times out they are converted one at a time instead, each within its
+    own entry of file_timeouts, so a hanging document costs one batch
+    timeout and its own rather than one per halving.
+    """
+    file_timeouts = file_timeouts or [timeout] * len(conversions)
+    results: List[Optional[ConversionFailure]] = [None] * len(conversions)
+    pending = []
+    for index, (input_path, output_path) in enumerate(conversions):
+        if not os.path.exists(input_path):
+            logger.error(f"Input file does not exist: {input_path}")
+            results[index] = ConversionFailure(FAILURE_PERMANENT, "Input file does not exist")
+        elif not validated and not validate_docx_file(input_path):
+            logger.error(f"Input file is not a valid DOCX: {input_path}")
+            results[index] = ConversionFailure(FAILURE_PERMANENT, "Input file is not a valid DOCX")
+        else:
+            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+            pending.append(index)
+    
+    while pending:
+        if _CANCELLED in results:
+            # Killed: the names still waiting are abandoned with the run
+            for index in pending:
+                results[index] = _CANCELLED
+            break
+        # LibreOffice names each PDF after its input, so a repeated name
+        # waits for a later run
+        batch, deferred, names = [], [], set()
+        for index in pending:
+            name = Path(conversions[index][0]).stem
+            (deferred if name in names else batch).append(index)
+            names.add(name)
+        converted = _convert_batch(
+            [conversions[index] for index in batch], [file_timeouts[index] for index in batch], profile_dir, timeout
+        )
+        for index, failure in zip(batch, converted):
+            results[index] = failure
+        pending = deferred
+    return results
+
+
+def _convert_batch(conversions: List[Tuple[str, str]], file_timeouts: List[float], profile_dir: str,
+                   timeout: float) -> List[Optional[ConversionFailure]]:
+    if len(conversions) == 1:
+        input_path, output_path = conversions[0]
+        return [convert_docx_file(
+            input_path, output_path, profile_dir=profile_dir, validated=True, timeout=file_timeouts[0]
+        )]
+    
+    convert_dir = Path(profile_dir) / "output"
+    shutil.rmtree(convert_dir, ignore_errors=True)
+    convert_dir.mkdir(parents=True, exist_ok=True)
+    profile_uri = (Path(profile_dir) / "profile").as_uri()
+    cmd = [
+        "libreoffice",
+        f"-env:UserInstallation={profile_uri}",
+        "--headless",
+        "--convert-to", "pdf",
+        "--outdir", str(convert_dir),
+        *[input_path for input_path, _ in conversions]
+    ]
+    
+    logger.info(f"Converting a batch of {len(conversions)} files to PDF...")
+    timed_out = False
+    try:
+        result = _run_libreoffice(cmd, timeout, profile_dir)
+        if result is None:
+            return [_CANCELLED] * len(conversions)
+        if result.returncode != 0:
+            logger.error(f"LibreOffice batch conversion failed with return code {result.returncode}")
+            logger.error(f"STDERR: {result.stderr}")
+    except subprocess.TimeoutExpired:
+        logger.error(f"Conversion timeout for a batch of {len(conversions)} files")
+        timed_out = True
+    
+    converted = []
+    for input_path, output_path in conversions:
+        expected_pdf = convert_dir / f"{Path(input_path).stem}.pdf"
+        if expected_pdf.exists() and expected_pdf.stat().st_size > 0:
+            shutil.move(str(expected_pdf), output_path)
+            converted.append(True)
+        else:
+            converted.append(False)
+    results: List[Optional[ConversionFailure]] = [None] * len(conversions)
+    
+    # Bisect what the run left unconverted to isolate the bad documents; a
+    # hanging one would time out every half holding it, so after a timeout
+    # the files go one at a time
+    failed = [index for index, success in enumerate(converted) if not success]
+    if timed_out:
+        parts = [[index] for index in failed]
+    else:
+        half = (len(failed) + 1) // 2
+        parts = [part for part in (failed[:half], failed[half:]) if part]
+    if failed:
+        logger.warning(
+            f"{len(failed)} of {len(conversions)} files were not converted in a batch, "
+            f"retrying them {'one at a time' if timed_out else 'in halves'}"
+        )
+    cancelled = False
+    for part in parts:
+        if cancelled:
+            # A killed run ends the bisection
+            part_results = [_CANCELLED] * len(part)
+        else:
+            part_timeouts = [file_timeouts[index] for index in part]
+            part_results = _convert_batch(
+                [conversions[index] for index in part], part_timeouts, profile_dir,
+                min(timeout, sum(part_timeouts))
+            )
+            cancelled = _CANCELLED in part_results
+        for index, failure in zip(part, part_results):
+            results[index] = failure
+    return results
+
+
+def kill_conversion(profile_dir: str):
+    """
+    Kill the LibreOffice run using the profile directory, if any, abandoning
+    its conversions. No further run starts on the profile until
+    clear_killed_conversion, so what is left of the batch is abandoned too.
+    """
+    with _running_lock:
+        _killed.add(profile_dir)
+        process = _running.get(profile_dir)
+        if process is None:
+            return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def clear_killed_conversion(profile_dir: str):
+    """Let the profile directory run conversions again once the killed ones have returned"""
+    with _running_lock:
+        _killed.discard(profile_dir)
+
+
+def _run_libreoffice(cmd: List[str], timeout: float,
+                     profile_dir: Optional[str]) -> Optional[subprocess.CompletedProcess]:
+    """
+    Run LibreOffice like subprocess.run, or return None if kill_conversion
+    killed it or the profile directory's conversions were killed before it
+    started. Raises subprocess.TimeoutExpired once the whole process group
+    is killed after `timeout` seconds.
+    """
+    if profile_dir:
+        # Start it under the lock, so a kill either finds it or stops it starting
+        with _running_lock:
+            if profile_dir in _killed:
+                return None
+            process = _start_libreoffice(cmd)
+            _running[profile_dir] = process
+    else:
+        process = _start_libreoffice(cmd)
+    try:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            process.communicate()
+            raise
+    finally:
+        if profile_dir:
+            with _running_lock:
+                _running.pop(profile_dir, None)
+                killed = profile_dir in _killed
+    if profile_dir and killed:
+        return None
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+def _start_libreoffice(cmd: List[str]) -> subprocess.Popen:
+    # Its own process group, so killing it also kills what it spawned
+    return subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True
+    )
+
+
+def validate_docx_file(file_path: str, mode: Optional[str] = None) -> bool:
     """
     Validate if the file is a valid DOCX file
+
+    The default "fast" mode only inspects the ZIP central directory,
+    [Content_Types].xml and word/document.xml. "deep" mode also loads the
+    document with python-docx.
     """
+    mode = mode or DOCX_VALIDATION_MODE
     try:
         if not os.path.exists(file_path):
             return False
@@ -85,20 +352,27 @@ def validate_docx_file(file_path: str) -> bool:
             return False
         
         # Check if it's a valid ZIP file (DOCX is a ZIP archive)
-        import zipfile
         try:
             with zipfile.ZipFile(file_path, 'r') as zip_file:
-                # Check if it contains the required DOCX structure
-                required_files = ['[Content_Types].xml', 'word/document.xml']
-                if not all(file in zip_file.namelist() for file in required_files):
+                # Check the required DOCX parts from the central directory
+                try:
+                    content_types = zip_file.getinfo('[Content_Types].xml')
+                    document = zip_file.getinfo('word/document.xml')
+                except KeyError:
+                    return False
+                if not 0 < document.file_size <= MAX_DOCUMENT_XML_BYTES:
+                    return False
+                if content_types.file_size > MAX_CONTENT_TYPES_BYTES:
+                    return False
+                if WORD_MAIN_CONTENT_TYPE not in zip_file.read(content_types):
                     return False
         except zipfile.BadZipFile:
             return False
         
-        # Try to open with python-docx to validate
-        from docx import Document
-        Document(file_path)
-        # If we can open it, it's likely a valid DOCX
+        if mode == "deep":
+            # Try to open with python-docx to validate
+            from docx import Document
+            Document(file_path)
         return True
         
     except Exception as e:
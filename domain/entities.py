@@ -1,6 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 from enum import Enum
 
 
@@ -9,6 +9,7 @@ class JobStatus(str, Enum):
     IN_PROGRESS = "IN_PROGRESS"
     COMPLETED = "COMPLETED"
     FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
 
 
 class FileStatus(str, Enum):
@@ -25,11 +26,19 @@ class FileEntity:
     filename: str
     status: FileStatus
     error_message: Optional[str] = None
+    # Validation level ("fast" or "deep") the file passed at upload time
+    validation_mode: Optional[str] = None
+    # Predicted conversion time from the document's shape at upload time
+    estimated_cost_seconds: Optional[float] = None
+    # Conversion attempts started, and the error of the last failed one
+    attempts: int = 0
+    last_error: Optional[str] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
     def mark_in_progress(self):
         self.status = FileStatus.IN_PROGRESS
+        self.attempts += 1
 
     def mark_completed(self):
         self.status = FileStatus.COMPLETED
@@ -37,6 +46,21 @@ class FileEntity:
     def mark_failed(self, error_message: str):
         self.status = FileStatus.FAILED
         self.error_message = error_message
+        self.last_error = error_message
+
+    def mark_retrying(self, error_message: str):
+        """Back to PENDING after a failed attempt that will be retried"""
+        self.status = FileStatus.PENDING
+        self.last_error = error_message
+
+
+def longest_first(files: List[FileEntity]) -> List[FileEntity]:
+    """
+    Files in longest-processing-time-first order, so the most expensive
+    conversions start early instead of trailing behind the rest. Files
+    without a prediction go last, in their original order.
+    """
+    return sorted(files, key=lambda file: -(file.estimated_cost_seconds or 0))
 
 
 @dataclass
@@ -49,6 +73,12 @@ class JobEntity:
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     files: List[FileEntity] = None
+    # Tenant that submitted the job, for fair scheduling
+    tenant_id: Optional[str] = None
+    # Status version, bumped by the repository on every job or file status change
+    version: int = 0
+    # Number of files per status, from the progress counters or the loaded files
+    file_counts: Dict[FileStatus, int] = field(default_factory=dict)
 
     def __post_init__(self):
         if self.files is None:
@@ -65,6 +95,12 @@ class JobEntity:
         self.status = JobStatus.FAILED
         self.error_message = error_message
 
+    def mark_cancelled(self):
+        self.status = JobStatus.CANCELLED
+
+    def is_finished(self) -> bool:
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+
     def add_file(self, file: FileEntity):
         self.files.append(file)
 
@@ -73,3 +109,9 @@ class JobEntity:
 
     def get_failed_files_count(self) -> int:
         return len([f for f in self.files if f.status == FileStatus.FAILED])
+
+    def count_files_by_status(self) -> Dict[FileStatus, int]:
+        counts = {file_status: 0 for file_status in FileStatus}
+        for f in self.files:
+            counts[f.status] += 1
+        return counts
@@ -0,0 +1,16 @@
+class UploadTooLargeError(ValueError):
+    """Raised when an uploaded file exceeds the configured size limit"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Upload exceeds the maximum size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a new job is refused because the service or its tenant is over capacity"""
+
+    def __init__(self, message: str, retry_after_seconds: int, tenant_limited: bool):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+        # The tenant's own limits refused it, rather than the service's
+        self.tenant_limited = tenant_limited
@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 from typing import List, Optional
-from .entities import JobEntity, FileEntity
+from datetime import datetime
+from .entities import JobEntity, FileEntity, FileStatus
+from .value_objects import Backlog
 
 
 class JobRepository(ABC):
@@ -12,24 +14,84 @@ class JobRepository(ABC):
     async def get_by_id(self, job_id: str) -> Optional[JobEntity]:
         pass
 
+    @abstractmethod
+    async def get_version(self, job_id: str) -> Optional[int]:
+        """Status version of the job without loading it, None if it doesn't exist"""
+        pass
+
     @abstractmethod
     async def update(self, job: JobEntity) -> JobEntity:
         pass
 
+    @abstractmethod
+    async def update_if_unfinished(self, job: JobEntity) -> Optional[JobEntity]:
+        """
+        Store the job only while it is still PENDING or IN_PROGRESS, None if it
+        was cancelled or finished meanwhile and so was left as it is
+        """
+        pass
+
     @abstractmethod
     async def delete(self, job_id: str) -> bool:
         pass
 
+    @abstractmethod
+    async def get_backlog(self, tenant_id: Optional[str] = None) -> Backlog:
+        """Jobs still queued and files not yet converted, overall or of one tenant"""
+        pass
+
+    @abstractmethod
+    async def get_finished_since(self, since: datetime, tenant_id: Optional[str] = None) -> Backlog:
+        """Jobs, and their files, that finished since the given time"""
+        pass
+
+    @abstractmethod
+    async def acquire_lease(self, job_id: str, owner: str, lease_seconds: int) -> bool:
+        """Take the job's processing lease unless another owner holds it unexpired"""
+        pass
+
+    @abstractmethod
+    async def renew_lease(self, job_id: str, owner: str, lease_seconds: int) -> bool:
+        """Extend the lease, False if the owner no longer holds it"""
+        pass
+
+    @abstractmethod
+    async def release_lease(self, job_id: str, owner: str):
+        """
+        Give up the lease. A job without a lease holder is left alone by the
+        reaper, so a requeued job may wait in the backlog for as long as it takes.
+        """
+        pass
+
+    @abstractmethod
+    async def claim_stale_jobs(self, limit: int = 100) -> List[JobEntity]:
+        """IN_PROGRESS or CANCELLED jobs whose holder let the lease expire, each with its lease released"""
+        pass
+
 
 class FileRepository(ABC):
     @abstractmethod
     async def create(self, file: FileEntity) -> FileEntity:
         pass
 
+    @abstractmethod
+    async def create_many(self, files: List[FileEntity]) -> List[FileEntity]:
+        pass
+
     @abstractmethod
     async def get_by_job_id(self, job_id: str) -> List[FileEntity]:
         pass
 
+    @abstractmethod
+    async def get_by_ids(self, file_ids: List[int]) -> List[FileEntity]:
+        pass
+
+    @abstractmethod
+    async def get_page(self, job_id: str, status: Optional[FileStatus] = None,
+                       after_id: Optional[int] = None, limit: int = 100) -> List[FileEntity]:
+        """Files of a job ordered by id, starting after `after_id`"""
+        pass
+
     @abstractmethod
     async def update(self, file: FileEntity) -> FileEntity:
         pass
@@ -1,26 +1,49 @@
 from abc import ABC, abstractmethod
-from typing import List
-from .value_objects import ConversionResult, FileValidationResult
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+from .entities import JobEntity, FileEntity
+from .value_objects import ConversionResult, FileValidationResult, JobPriority, QuarantineEntry, StoredUpload
 
 
 class FileConverter(ABC):
     @abstractmethod
-    async def convert_docx_to_pdf(self, input_path: str, 
-                                 output_path: str) -> ConversionResult:
+    async def convert_docx_to_pdf(self, input_path: str, output_path: str,
+                                 timeout: Optional[float] = None) -> ConversionResult:
+        """Convert within timeout seconds, or the converter's default if None"""
         pass
 
+    def settings_fingerprint(self) -> str:
+        """Identifies the converter settings that affect the produced PDF"""
+        return type(self).__name__
+
+    def supports_batches(self) -> bool:
+        """Whether convert_batch converts several files in a single run"""
+        return False
+
+    async def convert_batch(self, conversions: List[Tuple[str, str]], timeout: Optional[float] = None,
+                            file_timeouts: Optional[List[float]] = None) -> List[ConversionResult]:
+        """
+        Convert (input_path, output_path) pairs, returning their results in
+        order; timeout bounds a run of them all, file_timeouts (timeout if
+        None) each file converted on its own. Converts one file at a time
+        unless the converter supports batches.
+        """
+        file_timeouts = file_timeouts or [timeout] * len(conversions)
+        return [
+            await self.convert_docx_to_pdf(input_path, output_path, file_timeout)
+            for (input_path, output_path), file_timeout in zip(conversions, file_timeouts)
+        ]
+
 
 class FileValidator(ABC):
     @abstractmethod
-    async def validate_docx_file(self, file_path: str) -> 
-        FileValidationResult:
+    async def validate_docx_file(self, file_path: str) -> FileValidationResult:
         pass
 
 
 class FileStorage(ABC):
     @abstractmethod
-    async def save_uploaded_file(self, file_content: bytes, 
-                                file_path: str) -> bool:
+    async def save_uploaded_file(self, stream: AsyncIterator[bytes], file_path: str,
+                                max_bytes: Optional[int] = None) -> StoredUpload:
         pass
 
     @abstractmethod
@@ -29,19 +52,118 @@ class FileStorage(ABC):
         pass
 
     @abstractmethod
-    async def create_zip_archive(self, files: List[str], zip_path: str) -> bool:
+    def stream_zip_archive(self, files: List[Tuple[str, str]]) -> Iterator[bytes]:
+        """Yield a ZIP of (file_path, archive_name) pairs without writing it to disk"""
         pass
 
     @abstractmethod
     async def file_exists(self, file_path: str) -> bool:
         pass
 
+    @abstractmethod
+    async def file_size(self, file_path: str) -> Optional[int]:
+        """Size of the file in bytes, or None if it does not exist"""
+        pass
+
     @abstractmethod
     async def create_directory(self, directory_path: str) -> bool:
         pass
 
+    @abstractmethod
+    async def free_space(self, directory_path: str) -> int:
+        """Bytes available on the filesystem holding the directory"""
+        pass
+
+    @abstractmethod
+    async def delete_directory(self, directory_path: str) -> bool:
+        """Remove the directory and everything in it"""
+        pass
+
 
 class JobQueue(ABC):
     @abstractmethod
-    async def enqueue_job(self, job_id: str) -> bool:
+    async def enqueue_job(self, job_id: str, file_ids: Optional[List[int]] = None,
+                          priority: Optional[JobPriority] = None,
+                          tenant_id: Optional[str] = None) -> bool:
+        pass
+
+    @abstractmethod
+    async def cancel_job(self, job_id: str, tenant_id: Optional[str] = None) -> bool:
+        """
+        Drop the job's tasks that have not started yet. True if the job was
+        fanned out into chunk tasks, which are left to run and settle it.
+        """
+        pass
+
+
+class JobCancellation(ABC):
+    """Cancellation requests that running workers poll for"""
+
+    @abstractmethod
+    async def request(self, job_id: str):
+        pass
+
+    @abstractmethod
+    async def is_requested(self, job_id: str) -> bool:
+        pass
+
+
+class DocumentQuarantine(ABC):
+    """Documents that timed out or crashed the converter, by content hash"""
+
+    @abstractmethod
+    async def get(self, content_hash: str) -> Optional[QuarantineEntry]:
+        pass
+
+    @abstractmethod
+    async def record_failure(self, content_hash: str, filename: str, error_message: str) -> QuarantineEntry:
+        """Count one more failure of the document and refresh its expiry"""
+        pass
+
+    @abstractmethod
+    async def list_entries(self, limit: int = 100) -> List[QuarantineEntry]:
+        pass
+
+    @abstractmethod
+    async def clear(self, content_hash: str) -> bool:
+        """Forget the document's failures; False if it had none recorded"""
+        pass
+
+
+class JobStatusCache(ABC):
+    """Read-side projection of job and file statuses"""
+
+    @abstractmethod
+    async def get_job(self, job_id: str) -> Optional[JobEntity]:
+        """Cached job with its files, or None when the projection is missing or incomplete"""
+        pass
+
+    @abstractmethod
+    async def get_summary(self, job_id: str) -> Optional[JobEntity]:
+        """Cached job with its file counts but without files, read in constant time"""
+        pass
+
+    @abstractmethod
+    async def get_version(self, job_id: str) -> Optional[int]:
+        """Cached status version of a job, None when the projection is missing or incomplete"""
+        pass
+
+    @abstractmethod
+    async def store_job(self, job: JobEntity, only_missing: bool = False):
+        pass
+
+    @abstractmethod
+    async def store_files(self, job_id: str, files: List[FileEntity], only_missing: bool = False):
+        pass
+
+    @abstractmethod
+    async def delete_job(self, job_id: str):
+        pass
+
+    @abstractmethod
+    def subscribe(self, job_id: str) -> AsyncIterator[dict]:
+        """
+        Status change events of a job as they are stored. The first item is a
+        "subscribed" event; nothing published after it is missed.
+        """
         pass
@@ -1,13 +1,37 @@
+import random
 from dataclasses import dataclass
+from datetime import datetime
+from enum import Enum
 from typing import Optional
 
 
+class JobPriority(str, Enum):
+    """Explicit lane choice at submission; without one the job's size decides"""
+    HIGH = "high"
+    LOW = "low"
+
+
+class FailureKind(str, Enum):
+    """Why a conversion failed, which decides whether it is retried"""
+    # Invalid, missing or quarantined input; another attempt fails the same way
+    PERMANENT = "permanent"
+    # The converter ran out of time
+    TIMEOUT = "timeout"
+    # The converter crashed or produced no PDF
+    CRASH = "crash"
+    # Trouble around the converter, e.g. a full disk or a locked profile
+    TRANSIENT = "transient"
+
+
 @dataclass
 class ConversionResult:
     success: bool
     input_path: str
     output_path: str
     error_message: Optional[str] = None
+    # The document timed out or crashed the converter, so it may be poison
+    poison_suspect: bool = False
+    failure_kind: FailureKind = FailureKind.PERMANENT
 
     @classmethod
     def success_result(cls, input_path: str, output_path: str) -> 'ConversionResult':
@@ -15,9 +39,23 @@ class ConversionResult:
 
     @classmethod
     def failure_result(cls, input_path: str, output_path: str, 
-                      error_message: str) -> 'ConversionResult':
+                      error_message: str, poison_suspect: bool = False,
+                      failure_kind: FailureKind = FailureKind.PERMANENT) -> 'ConversionResult':
         return cls(success=False, input_path=input_path, 
-                  output_path=output_path, error_message=error_message)
+                  output_path=output_path, error_message=error_message,
+                  poison_suspect=poison_suspect, failure_kind=failure_kind)
+
+
+@dataclass
+class QuarantineEntry:
+    """Conversion failures of a document that timed out or crashed the converter"""
+    content_hash: str
+    failures: int
+    error_message: str
+    filename: Optional[str] = None
+    last_failed_at: Optional[datetime] = None
+    # Seconds until the entry expires, None when unknown
+    expires_in_seconds: Optional[int] = None
 
 
 @dataclass
@@ -27,6 +65,10 @@ class JobProcessingResult:
     failed_files: int
     success: bool
     error_message: Optional[str] = None
+    # The run stopped early and handed the rest of the job back to the queue
+    interrupted: bool = False
+    # The job was cancelled while the run worked on it
+    cancelled: bool = False
 
     @classmethod
     def success_result(cls, job_id: str, completed_files: int, 
@@ -38,6 +80,28 @@ class JobProcessingResult:
             success=True
         )
 
+    @classmethod
+    def interrupted_result(cls, job_id: str, completed_files: int,
+                           failed_files: int) -> 'JobProcessingResult':
+        return cls(
+            job_id=job_id,
+            completed_files=completed_files,
+            failed_files=failed_files,
+            success=True,
+            interrupted=True
+        )
+
+    @classmethod
+    def cancelled_result(cls, job_id: str, completed_files: int,
+                         failed_files: int) -> 'JobProcessingResult':
+        return cls(
+            job_id=job_id,
+            completed_files=completed_files,
+            failed_files=failed_files,
+            success=True,
+            cancelled=True
+        )
+
     @classmethod
     def failure_result(cls, job_id: str, 
                       error_message: str) -> 'JobProcessingResult':
@@ -50,15 +114,91 @@ class JobProcessingResult:
         )
 
 
+@dataclass
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+
+
+@dataclass
+class Backlog:
+    """Jobs and their files, e.g. still waiting or finished within a window"""
+    jobs: int
+    files: int
+
+
+@dataclass
+class AdmissionLimits:
+    """Limits on accepting new jobs; 0 disables a limit"""
+    max_queued_jobs: int = 0
+    max_pending_files: int = 0
+    tenant_max_queued_jobs: int = 0
+    tenant_max_pending_files: int = 0
+    min_free_bytes: int = 0
+    retry_after_max_seconds: int = 300
+    # Tenant shared by every client without one of its own, held only to the
+    # service-wide limits so anonymous clients don't refuse each other
+    shared_tenant_id: Optional[str] = None
+
+
+@dataclass
+class ConversionTimeoutPolicy:
+    """
+    Per-file conversion timeout: `factor` times the predicted cost, kept
+    within [min_seconds, max_seconds]; files without a prediction get
+    min_seconds
+    """
+    factor: float = 10.0
+    min_seconds: float = 60.0
+    max_seconds: float = 1800.0
+
+    def timeout_for(self, estimated_cost_seconds: Optional[float]) -> float:
+        if estimated_cost_seconds is None:
+            return self.min_seconds
+        return max(self.min_seconds, min(self.max_seconds, estimated_cost_seconds * self.factor))
+
+
+@dataclass
+class RetryPolicy:
+    """
+    How many attempts a file gets per kind of failure, and the exponential
+    backoff before each retry: base_delay_seconds doubled per failed
+    attempt, at most max_delay_seconds, with jitter so files that failed
+    together don't retry in lockstep
+    """
+    max_attempts: int = 3
+    timeout_max_attempts: int = 2
+    base_delay_seconds: float = 2.0
+    max_delay_seconds: float = 60.0
+
+    def should_retry(self, failure_kind: FailureKind, attempts: int) -> bool:
+        if failure_kind == FailureKind.PERMANENT:
+            return False
+        if failure_kind == FailureKind.TIMEOUT:
+            return attempts < self.timeout_max_attempts
+        return attempts < self.max_attempts
+
+    def delay_for(self, attempts: int) -> float:
+        """Seconds to wait before retrying a file that failed `attempts` times"""
+        delay = min(self.max_delay_seconds, self.base_delay_seconds * 2 ** max(0, attempts - 1))
+        return random.uniform(delay / 2, delay)
+
+
 @dataclass
 class FileValidationResult:
     is_valid: bool
     filename: str
     error_message: Optional[str] = None
+    validation_mode: Optional[str] = None
+    estimated_cost_seconds: Optional[float] = None
 
     @classmethod
-    def valid_file(cls, filename: str) -> 'FileValidationResult':
-        return cls(is_valid=True, filename=filename)
+    def valid_file(cls, filename: str, 
+                  validation_mode: Optional[str] = None,
+                  estimated_cost_seconds: Optional[float] = None) -> 'FileValidationResult':
+        return cls(is_valid=True, filename=filename, validation_mode=validation_mode,
+                   estimated_cost_seconds=estimated_cost_seconds)
 
     @classmethod
     def invalid_file(cls, filename: str, 
@@ -0,0 +1,52 @@
+"""
+Async SQLAlchemy engine used by the API
+"""
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+# Async driver for each sync database backend
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite"
+}
+
+
+def to_async_url(database_url: str) -> URL:
+    """The database URL with its driver swapped for the async one"""
+    url = make_url(database_url)
+    async_driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if async_driver is None:
+        raise ValueError(f"No async driver for database backend {url.get_backend_name()}")
+    return url.set(drivername=async_driver)
+
+
+def create_async_db_engine(
+    database_url: str,
+    pool_size: int = 10,
+    max_overflow: int = 20,
+    pool_timeout: float = 30,
+    pool_pre_ping: bool = True,
+    statement_timeout_ms: int = 0
+) -> AsyncEngine:
+    """
+    Create a pooled async engine for the database URL.
+
+    The pool settings apply to Postgres. statement_timeout_ms is set as its
+    statement_timeout on every pooled connection; 0 leaves the server's default.
+    """
+    url = to_async_url(database_url)
+    if url.get_backend_name() != "postgresql":
+        # SQLite (local development) connects per session without a pool
+        return create_async_engine(url, pool_pre_ping=pool_pre_ping)
+    
+    connect_args = {}
+    if statement_timeout_ms > 0:
+        connect_args["server_settings"] = {"statement_timeout": str(statement_timeout_ms)}
+    return create_async_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_pre_ping=pool_pre_ping,
+        connect_args=connect_args
+    )
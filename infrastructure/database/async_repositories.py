@@ -0,0 +1,241 @@
+import asyncio
+from typing import Dict, List, Optional
+from sqlalchemy import Select, Update, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+
+from ...domain.entities import JobEntity, FileEntity, FileStatus
+from ...domain.repositories import JobRepository, FileRepository
+from ...domain.value_objects import Backlog
+from .models import Job, File
+from .repositories import (
+    job_to_entity, file_to_entity, lock_statuses_statement, statuses_by_id,
+    job_progress_statements, backlog_statement, finished_since_statement, acquire_lease_statement, renew_lease_statement,
+    release_lease_statement, stale_jobs_statement, claim_stale_job_statement, unfinished_job_update_statement
+)
+
+
+class AsyncSessionBoundRepository:
+    """
+    Runs session work on the event loop through an AsyncSession.
+
+    Repositories sharing a session also share a lock, because an AsyncSession
+    must not be used by two tasks at once.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self._lock = db.info.setdefault("repository_lock", asyncio.Lock())
+
+
+class AsyncSQLAlchemyJobRepository(AsyncSessionBoundRepository, JobRepository):
+    async def create(self, job: JobEntity) -> JobEntity:
+        async with self._lock:
+            db_job = Job(
+                id=job.id,
+                status=job.status,
+                file_count=job.file_count,
+                download_url=job.download_url,
+                error_message=job.error_message,
+                tenant_id=job.tenant_id,
+                created_at=job.created_at or datetime.utcnow(),
+                updated_at=datetime.utcnow(),
+                # Creation is the first status change, as in the status cache
+                version=1
+            )
+            self.db.add(db_job)
+            await self.db.commit()
+            await self.db.refresh(db_job)
+            return job_to_entity(db_job)
+
+    async def get_by_id(self, job_id: str) -> Optional[JobEntity]:
+        async with self._lock:
+            db_job = await self.db.scalar(select(Job).where(Job.id == job_id))
+            return job_to_entity(db_job) if db_job else None
+
+    async def get_version(self, job_id: str) -> Optional[int]:
+        async with self._lock:
+            return await self.db.scalar(select(Job.version).where(Job.id == job_id))
+
+    async def update(self, job: JobEntity) -> JobEntity:
+        async with self._lock:
+            db_job = await self.db.scalar(select(Job).where(Job.id == job.id))
+            if db_job:
+                db_job.status = job.status
+                db_job.file_count = job.file_count
+                db_job.download_url = job.download_url
+                db_job.error_message = job.error_message
+                db_job.updated_at = datetime.utcnow()
+                db_job.version = Job.version + 1
+                await self.db.commit()
+                await self.db.refresh(db_job)
+                return job_to_entity(db_job)
+            return job
+
+    async def update_if_unfinished(self, job: JobEntity) -> Optional[JobEntity]:
+        async with self._lock:
+            result = await self.db.execute(unfinished_job_update_statement(job))
+            await self.db.commit()
+            if result.rowcount != 1:
+                return None
+            db_job = await self.db.scalar(select(Job).where(Job.id == job.id))
+            return job_to_entity(db_job)
+
+    async def delete(self, job_id: str) -> bool:
+        async with self._lock:
+            db_job = await self.db.scalar(select(Job).where(Job.id == job_id))
+            if db_job:
+                await self.db.delete(db_job)
+                await self.db.commit()
+                return True
+            return False
+
+    async def get_backlog(self, tenant_id: Optional[str] = None) -> Backlog:
+        return await self._get_counts(backlog_statement(tenant_id))
+
+    async def get_finished_since(self, since: datetime, tenant_id: Optional[str] = None) -> Backlog:
+        return await self._get_counts(finished_since_statement(since, tenant_id))
+
+    async def acquire_lease(self, job_id: str, owner: str, lease_seconds: int) -> bool:
+        return await self._execute_lease(acquire_lease_statement(job_id, owner, lease_seconds))
+
+    async def renew_lease(self, job_id: str, owner: str, lease_seconds: int) -> bool:
+        return await self._execute_lease(renew_lease_statement(job_id, owner, lease_seconds))
+
+    async def release_lease(self, job_id: str, owner: str):
+        await self._execute_lease(release_lease_statement(job_id, owner))
+
+    async def claim_stale_jobs(self, limit: int = 100) -> List[JobEntity]:
+        async with self._lock:
+            claimed = []
+            for db_job in (await self.db.scalars(stale_jobs_statement(limit))).all():
+                # Conditional, so two reapers never both claim a job
+                result = await self.db.execute(claim_stale_job_statement(db_job.id))
+                if result.rowcount == 1:
+                    claimed.append(job_to_entity(db_job))
+            await self.db.commit()
+            return claimed
+
+    async def _get_counts(self, statement: Select) -> Backlog:
+        async with self._lock:
+            jobs, files = (await self.db.execute(statement)).one()
+            return Backlog(jobs=jobs, files=files)
+
+    async def _execute_lease(self, statement: Update) -> bool:
+        async with self._lock:
+            updated = (await self.db.execute(statement)).rowcount == 1
+            await self.db.commit()
+            return updated
+
+
+class AsyncSQLAlchemyFileRepository(AsyncSessionBoundRepository, FileRepository):
+    async def create(self, file: FileEntity) -> FileEntity:
+        async with self._lock:
+            db_file = File(
+                job_id=file.job_id,
+                filename=file.filename,
+                status=file.status,
+                error_message=file.error_message,
+                validation_mode=file.validation_mode,
+                estimated_cost_seconds=file.estimated_cost_seconds,
+                created_at=file.created_at or datetime.utcnow(),
+                updated_at=datetime.utcnow()
+            )
+            self.db.add(db_file)
+            await self._update_job_progress([file], {})
+            await self.db.commit()
+            await self.db.refresh(db_file)
+            return file_to_entity(db_file)
+
+    async def create_many(self, files: List[FileEntity]) -> List[FileEntity]:
+        if not files:
+            return []
+        async with self._lock:
+            now = datetime.utcnow()
+            rows = [
+                {
+                    "job_id": file.job_id,
+                    "filename": file.filename,
+                    "status": file.status,
+                    "error_message": file.error_message,
+                    "validation_mode": file.validation_mode,
+                    "estimated_cost_seconds": file.estimated_cost_seconds,
+                    "created_at": file.created_at or now,
+                    "updated_at": now
+                }
+                for file in files
+            ]
+            # One multi-row INSERT ... RETURNING, ids come back in input order
+            db_files = (await self.db.scalars(
+                insert(File).returning(File, sort_by_parameter_order=True), rows
+            )).all()
+            created_files = [file_to_entity(db_file) for db_file in db_files]
+            await self._update_job_progress(files, {})
+            await self.db.commit()
+            return created_files
+
+    async def get_by_job_id(self, job_id: str) -> List[FileEntity]:
+        async with self._lock:
+            db_files = await self.db.scalars(select(File).where(File.job_id == job_id))
+            return [file_to_entity(db_file) for db_file in db_files]
+
+    async def get_by_ids(self, file_ids: List[int]) -> List[FileEntity]:
+        async with self._lock:
+            db_files = await self.db.scalars(select(File).where(File.id.in_(file_ids)))
+            return [file_to_entity(db_file) for db_file in db_files]
+
+    async def get_page(self, job_id: str, status: Optional[FileStatus] = None,
+                       after_id: Optional[int] = None, limit: int = 100) -> List[FileEntity]:
+        # Keyset pagination, served by the (job_id, status, id) index
+        query = select(File).where(File.job_id == job_id)
+        if status is not None:
+            query = query.where(File.status == status)
+        if after_id is not None:
+            query = query.where(File.id > after_id)
+        async with self._lock:
+            db_files = await self.db.scalars(query.order_by(File.id).limit(limit))
+            return [file_to_entity(db_file) for db_file in db_files]
+
+    async def update(self, file: FileEntity) -> FileEntity:
+        async with self._lock:
+            previous_statuses = await self._lock_statuses([file])
+            file.updated_at = datetime.utcnow()
+            await self.db.execute(
+                update(File)
+                .where(File.id == file.id)
+                .values(status=file.status, error_message=file.error_message, attempts=file.attempts,
+                        last_error=file.last_error, updated_at=file.updated_at)
+            )
+            await self._update_job_progress([file], previous_statuses)
+            await self.db.commit()
+            return file
+
+    async def update_batch(self, files: List[FileEntity]) -> List[FileEntity]:
+        if not files:
+            return []
+        async with self._lock:
+            previous_statuses = await self._lock_statuses(files)
+            now = datetime.utcnow()
+            for file in files:
+                file.updated_at = now
+            # Bulk UPDATE by primary key, sent as a single executemany
+            await self.db.execute(
+                update(File),
+                [
+                    {"id": file.id, "status": file.status, "error_message": file.error_message,
+                     "attempts": file.attempts, "last_error": file.last_error, "updated_at": now}
+                    for file in files
+                ]
+            )
+            await self._update_job_progress(files, previous_statuses)
+            await self.db.commit()
+            return files
+
+    async def _lock_statuses(self, files: List[FileEntity]) -> Dict[int, FileStatus]:
+        """Current statuses of the files, locked until the transaction ends"""
+        return statuses_by_id(await self.db.execute(lock_statuses_statement(files)))
+
+    async def _update_job_progress(self, files: List[FileEntity], previous_statuses: Dict[int, FileStatus]):
+        """Bump the files' jobs' status version and progress counters in the current transaction"""
+        for statement in job_progress_statements(files, previous_statuses):
+            await self.db.execute(statement)
@@ -1,36 +1,106 @@
-from typing import List, Optional
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import Select, Update, case, func, insert, or_, select, update
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from ...domain.entities import JobEntity, FileEntity, JobStatus, FileStatus
 from ...domain.repositories import JobRepository, FileRepository
+from ...domain.value_objects import Backlog
+from ..services.executors import run_db
 from .models import Job, File
 
+# Job counter column of each file status past PENDING
+PROGRESS_COUNTERS = {
+    FileStatus.IN_PROGRESS: "in_progress_count",
+    FileStatus.COMPLETED: "completed_count",
+    FileStatus.FAILED: "failed_count"
+}
+
+
+class SessionBoundRepository:
+    """
+    Runs blocking session work on the database thread pool.
+
+    Repositories sharing a session also share a lock, because a Session must
+    not be used from two threads at once.
+    """
 
-class SQLAlchemyJobRepository(JobRepository):
     def __init__(self, db: Session):
         self.db = db
+        self._lock = db.info.setdefault("repository_lock", threading.Lock())
 
+    async def _run(self, func: Callable[..., Any], *args) -> Any:
+        def locked():
+            with self._lock:
+                return func(*args)
+        return await run_db(locked)
+
+
+class SQLAlchemyJobRepository(SessionBoundRepository, JobRepository):
     async def create(self, job: JobEntity) -> JobEntity:
+        return await self._run(self._create, job)
+
+    async def get_by_id(self, job_id: str) -> Optional[JobEntity]:
+        return await self._run(self._get_by_id, job_id)
+
+    async def get_version(self, job_id: str) -> Optional[int]:
+        return await self._run(self._get_version, job_id)
+
+    async def update(self, job: JobEntity) -> JobEntity:
+        return await self._run(self._update, job)
+
+    async def update_if_unfinished(self, job: JobEntity) -> Optional[JobEntity]:
+        return await self._run(self._update_if_unfinished, job)
+
+    async def delete(self, job_id: str) -> bool:
+        return await self._run(self._delete, job_id)
+
+    async def get_backlog(self, tenant_id: Optional[str] = None) -> Backlog:
+        return await self._run(self._get_counts, backlog_statement(tenant_id))
+
+    async def get_finished_since(self, since: datetime, tenant_id: Optional[str] = None) -> Backlog:
+        return await self._run(self._get_counts, finished_since_statement(since, tenant_id))
+
+    async def acquire_lease(self, job_id: str, owner: str, lease_seconds: int) -> bool:
+        return await self._run(self._execute_lease, acquire_lease_statement(job_id, owner, lease_seconds))
+
+    async def renew_lease(self, job_id: str, owner: str, lease_seconds: int) -> bool:
+        return await self._run(self._execute_lease, renew_lease_statement(job_id, owner, lease_seconds))
+
+    async def release_lease(self, job_id: str, owner: str):
+        await self._run(self._execute_lease, release_lease_statement(job_id, owner))
+
+    async def claim_stale_jobs(self, limit: int = 100) -> List[JobEntity]:
+        return await self._run(self._claim_stale_jobs, limit)
+
+    def _create(self, job: JobEntity) -> JobEntity:
         db_job = Job(
             id=job.id,
             status=job.status,
             file_count=job.file_count,
             download_url=job.download_url,
             error_message=job.error_message,
+            tenant_id=job.tenant_id,
             created_at=job.created_at or datetime.utcnow(),
-            updated_at=datetime.utcnow()
+            updated_at=datetime.utcnow(),
+            # Creation is the first status change, as in the status cache
+            version=1
         )
         self.db.add(db_job)
         self.db.commit()
         self.db.refresh(db_job)
-        return self._to_entity(db_job)
+        return job_to_entity(db_job)
 
-    async def get_by_id(self, job_id: str) -> Optional[JobEntity]:
+    def _get_by_id(self, job_id: str) -> Optional[JobEntity]:
         db_job = self.db.query(Job).filter(Job.id == job_id).first()
-        return self._to_entity(db_job) if db_job else None
+        return job_to_entity(db_job) if db_job else None
 
-    async def update(self, job: JobEntity) -> JobEntity:
+    def _get_version(self, job_id: str) -> Optional[int]:
+        return self.db.query(Job.version).filter(Job.id == job_id).scalar()
+
+    def _update(self, job: JobEntity) -> JobEntity:
         db_job = self.db.query(Job).filter(Job.id == job.id).first()
         if db_job:
             db_job.status = job.status
@@ -38,12 +108,18 @@ class SQLAlchemyJobRepository(JobRepository):
             db_job.download_url = job.download_url
             db_job.error_message = job.error_message
             db_job.updated_at = datetime.utcnow()
+            db_job.version = Job.version + 1
             self.db.commit()
             self.db.refresh(db_job)
-            return self._to_entity(db_job)
+            return job_to_entity(db_job)
         return job
 
-    async def delete(self, job_id: str) -> bool:
+    def _update_if_unfinished(self, job: JobEntity) -> Optional[JobEntity]:
+        updated = self.db.execute(unfinished_job_update_statement(job)).rowcount == 1
+        self.db.commit()
+        return self._get_by_id(job.id) if updated else None
+
+    def _delete(self, job_id: str) -> bool:
         db_job = self.db.query(Job).filter(Job.id == job_id).first()
         if db_job:
             self.db.delete(db_job)
@@ -51,65 +127,317 @@ class SQLAlchemyJobRepository(JobRepository):
             return True
         return False
 
-    def _to_entity(self, db_job: Job) -> JobEntity:
-        return JobEntity(
-            id=db_job.id,
-            status=db_job.status,
-            file_count=db_job.file_count,
-            download_url=db_job.download_url,
-            error_message=db_job.error_message,
-            created_at=db_job.created_at,
-            updated_at=db_job.updated_at
-        )
+    def _get_counts(self, statement: Select) -> Backlog:
+        jobs, files = self.db.execute(statement).one()
+        return Backlog(jobs=jobs, files=files)
 
+    def _execute_lease(self, statement: Update) -> bool:
+        updated = self.db.execute(statement).rowcount == 1
+        self.db.commit()
+        return updated
 
-class SQLAlchemyFileRepository(FileRepository):
-    def __init__(self, db: Session):
-        self.db = db
+    def _claim_stale_jobs(self, limit: int) -> List[JobEntity]:
+        claimed = []
+        for db_job in self.db.scalars(stale_jobs_statement(limit)).all():
+            # Conditional, so two reapers never both claim a job
+            if self.db.execute(claim_stale_job_statement(db_job.id)).rowcount == 1:
+                claimed.append(job_to_entity(db_job))
+        self.db.commit()
+        return claimed
 
+
+class SQLAlchemyFileRepository(SessionBoundRepository, FileRepository):
     async def create(self, file: FileEntity) -> FileEntity:
+        return await self._run(self._create, file)
+
+    async def create_many(self, files: List[FileEntity]) -> List[FileEntity]:
+        return await self._run(self._create_many, files)
+
+    async def get_by_job_id(self, job_id: str) -> List[FileEntity]:
+        return await self._run(self._get_by_job_id, job_id)
+
+    async def get_by_ids(self, file_ids: List[int]) -> List[FileEntity]:
+        return await self._run(self._get_by_ids, file_ids)
+
+    async def get_page(self, job_id: str, status: Optional[FileStatus] = None,
+                       after_id: Optional[int] = None, limit: int = 100) -> List[FileEntity]:
+        return await self._run(self._get_page, job_id, status, after_id, limit)
+
+    async def update(self, file: FileEntity) -> FileEntity:
+        return await self._run(self._update, file)
+
+    async def update_batch(self, files: List[FileEntity]) -> List[FileEntity]:
+        return await self._run(self._update_batch, files)
+
+    def _create(self, file: FileEntity) -> FileEntity:
         db_file = File(
             job_id=file.job_id,
             filename=file.filename,
             status=file.status,
             error_message=file.error_message,
+            validation_mode=file.validation_mode,
+            estimated_cost_seconds=file.estimated_cost_seconds,
             created_at=file.created_at or datetime.utcnow(),
             updated_at=datetime.utcnow()
         )
         self.db.add(db_file)
+        self._update_job_progress([file], {})
         self.db.commit()
         self.db.refresh(db_file)
-        return self._to_entity(db_file)
+        return file_to_entity(db_file)
 
-    async def get_by_job_id(self, job_id: str) -> List[FileEntity]:
+    def _create_many(self, files: List[FileEntity]) -> List[FileEntity]:
+        if not files:
+            return []
+        now = datetime.utcnow()
+        rows = [
+            {
+                "job_id": file.job_id,
+                "filename": file.filename,
+                "status": file.status,
+                "error_message": file.error_message,
+                "validation_mode": file.validation_mode,
+                "estimated_cost_seconds": file.estimated_cost_seconds,
+                "created_at": file.created_at or now,
+                "updated_at": now
+            }
+            for file in files
+        ]
+        # One multi-row INSERT ... RETURNING, ids come back in input order
+        db_files = self.db.scalars(
+            insert(File).returning(File, sort_by_parameter_order=True), rows
+        ).all()
+        created_files = [file_to_entity(db_file) for db_file in db_files]
+        self._update_job_progress(files, {})
+        self.db.commit()
+        return created_files
+
+    def _get_by_job_id(self, job_id: str) -> List[FileEntity]:
         db_files = self.db.query(File).filter(File.job_id == job_id).all()
-        return [self._to_entity(db_file) for db_file in db_files]
+        return [file_to_entity(db_file) for db_file in db_files]
 
-    async def update(self, file: FileEntity) -> FileEntity:
-        db_file = self.db.query(File).filter(File.id == file.id).first()
-        if db_file:
-            db_file.status = file.status
-            db_file.error_message = file.error_message
-            db_file.updated_at = datetime.utcnow()
-            self.db.commit()
-            self.db.refresh(db_file)
-            return self._to_entity(db_file)
+    def _get_by_ids(self, file_ids: List[int]) -> List[FileEntity]:
+        db_files = self.db.query(File).filter(File.id.in_(file_ids)).all()
+        return [file_to_entity(db_file) for db_file in db_files]
+
+    def _get_page(self, job_id: str, status: Optional[FileStatus],
+                  after_id: Optional[int], limit: int) -> List[FileEntity]:
+        # Keyset pagination, served by the (job_id, status, id) index
+        query = self.db.query(File).filter(File.job_id == job_id)
+        if status is not None:
+            query = query.filter(File.status == status)
+        if after_id is not None:
+            query = query.filter(File.id > after_id)
+        db_files = query.order_by(File.id).limit(limit).all()
+        return [file_to_entity(db_file) for db_file in db_files]
+
+    def _update(self, file: FileEntity) -> FileEntity:
+        previous_statuses = self._lock_statuses([file])
+        file.updated_at = datetime.utcnow()
+        self.db.execute(
+            update(File)
+            .where(File.id == file.id)
+            .values(status=file.status, error_message=file.error_message, attempts=file.attempts,
+                    last_error=file.last_error, updated_at=file.updated_at)
+        )
+        self._update_job_progress([file], previous_statuses)
+        self.db.commit()
         return file
 
-    async def update_batch(self, files: List[FileEntity]) -> List[FileEntity]:
-        updated_files = []
+    def _update_batch(self, files: List[FileEntity]) -> List[FileEntity]:
+        if not files:
+            return []
+        previous_statuses = self._lock_statuses(files)
+        now = datetime.utcnow()
         for file in files:
-            updated_file = await self.update(file)
-            updated_files.append(updated_file)
-        return updated_files
-
-    def _to_entity(self, db_file: File) -> FileEntity:
-        return FileEntity(
-            id=db_file.id,
-            job_id=db_file.job_id,
-            filename=db_file.filename,
-            status=db_file.status,
-            error_message=db_file.error_message,
-            created_at=db_file.created_at,
-            updated_at=db_file.updated_at
+            file.updated_at = now
+        # Bulk UPDATE by primary key, sent as a single executemany
+        self.db.execute(
+            update(File),
+            [
+                {"id": file.id, "status": file.status, "error_message": file.error_message,
+                 "attempts": file.attempts, "last_error": file.last_error, "updated_at": now}
+                for file in files
+            ]
+        )
+        self._update_job_progress(files, previous_statuses)
+        self.db.commit()
+        return files
+
+    def _lock_statuses(self, files: List[FileEntity]) -> Dict[int, FileStatus]:
+        """Current statuses of the files, locked until the transaction ends"""
+        return statuses_by_id(self.db.execute(lock_statuses_statement(files)))
+
+    def _update_job_progress(self, files: List[FileEntity], previous_statuses: Dict[int, FileStatus]):
+        """Bump the files' jobs' status version and progress counters in the current transaction"""
+        for statement in job_progress_statements(files, previous_statuses):
+            self.db.execute(statement)
+
+
+def job_to_entity(db_job: Job) -> JobEntity:
+    progress = {
+        file_status: getattr(db_job, column)
+        for file_status, column in PROGRESS_COUNTERS.items()
+    }
+    file_counts = {FileStatus.PENDING: db_job.file_count - sum(progress.values()), **progress}
+    return JobEntity(
+        id=db_job.id,
+        status=db_job.status,
+        file_count=db_job.file_count,
+        download_url=db_job.download_url,
+        error_message=db_job.error_message,
+        created_at=db_job.created_at,
+        updated_at=db_job.updated_at,
+        tenant_id=db_job.tenant_id,
+        version=db_job.version,
+        file_counts=file_counts
+    )
+
+
+def file_to_entity(db_file: File) -> FileEntity:
+    return FileEntity(
+        id=db_file.id,
+        job_id=db_file.job_id,
+        filename=db_file.filename,
+        status=db_file.status,
+        error_message=db_file.error_message,
+        validation_mode=db_file.validation_mode,
+        estimated_cost_seconds=db_file.estimated_cost_seconds,
+        attempts=db_file.attempts or 0,
+        last_error=db_file.last_error,
+        created_at=db_file.created_at,
+        updated_at=db_file.updated_at
+    )
+
+
+def lock_statuses_statement(files: List[FileEntity]) -> Select:
+    """Selects the current status of the files and locks their rows"""
+    return (
+        select(File.id, File.status)
+        .where(File.id.in_([file.id for file in files]))
+        .order_by(File.id)
+        .with_for_update()
+    )
+
+
+def statuses_by_id(rows) -> Dict[int, FileStatus]:
+    return {file_id: FileStatus(file_status.value) for file_id, file_status in rows}
+
+
+def backlog_statement(tenant_id: Optional[str]) -> Select:
+    """Counts the queued jobs and the files of unfinished jobs not yet converted"""
+    query = select(
+        func.coalesce(func.sum(case((Job.status == JobStatus.PENDING, 1), else_=0)), 0),
+        func.coalesce(func.sum(Job.file_count - Job.completed_count - Job.failed_count), 0)
+    ).where(Job.status.in_([JobStatus.PENDING, JobStatus.IN_PROGRESS]))
+    if tenant_id is not None:
+        query = query.where(Job.tenant_id == tenant_id)
+    return query
+
+
+def finished_since_statement(since: datetime, tenant_id: Optional[str]) -> Select:
+    """Counts the jobs, and their files, that finished since the given time"""
+    query = select(
+        func.count(Job.id),
+        func.coalesce(func.sum(Job.file_count), 0)
+    ).where(Job.status.in_([JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED]), Job.updated_at >= since)
+    if tenant_id is not None:
+        query = query.where(Job.tenant_id == tenant_id)
+    return query
+
+
+def unfinished_job_update_statement(job: JobEntity) -> Update:
+    """
+    Writes the job only while it is PENDING or IN_PROGRESS, so a cancel and
+    a worker finishing the job can't overwrite each other's status
+    """
+    return (
+        update(Job)
+        .where(Job.id == job.id, Job.status.in_([JobStatus.PENDING, JobStatus.IN_PROGRESS]))
+        .values(
+            status=job.status,
+            file_count=job.file_count,
+            download_url=job.download_url,
+            error_message=job.error_message,
+            updated_at=datetime.utcnow(),
+            version=Job.version + 1
+        )
+    )
+
+
+def acquire_lease_statement(job_id: str, owner: str, lease_seconds: int) -> Update:
+    """Takes the lease when it is free, expired or already the owner's"""
+    now = datetime.utcnow()
+    return (
+        update(Job)
+        .where(
+            Job.id == job_id,
+            or_(Job.lease_owner.is_(None), Job.lease_owner == owner, Job.lease_expires_at < now)
         )
+        .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=lease_seconds))
+    )
+
+
+def renew_lease_statement(job_id: str, owner: str, lease_seconds: int) -> Update:
+    return (
+        update(Job)
+        .where(Job.id == job_id, Job.lease_owner == owner)
+        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+    )
+
+
+def release_lease_statement(job_id: str, owner: str) -> Update:
+    return (
+        update(Job)
+        .where(Job.id == job_id, Job.lease_owner == owner)
+        .values(lease_owner=None, lease_expires_at=None)
+    )
+
+
+def stale_jobs_statement(limit: int) -> Select:
+    """
+    IN_PROGRESS jobs whose owner stopped renewing the lease, oldest first,
+    and CANCELLED ones their owner died before settling. Jobs nobody holds
+    are waiting in the backlog, or already settled, and are left alone.
+    """
+    return (
+        select(Job)
+        .where(
+            Job.status.in_([JobStatus.IN_PROGRESS, JobStatus.CANCELLED]),
+            Job.lease_owner.is_not(None),
+            Job.lease_expires_at < datetime.utcnow()
+        )
+        .order_by(Job.lease_expires_at)
+        .limit(limit)
+    )
+
+
+def claim_stale_job_statement(job_id: str) -> Update:
+    return (
+        update(Job)
+        .where(Job.id == job_id, Job.lease_owner.is_not(None), Job.lease_expires_at < datetime.utcnow())
+        .values(lease_owner=None, lease_expires_at=None)
+    )
+
+
+def job_progress_statements(files: List[FileEntity],
+                            previous_statuses: Dict[int, FileStatus]) -> List[Update]:
+    """
+    Updates that bump the status version of the files' jobs and move their
+    progress counters from each file's previous status to its new one
+    """
+    deltas: Dict[str, Counter] = {file.job_id: Counter() for file in files}
+    for file in files:
+        previous_status = previous_statuses.get(file.id)
+        if previous_status != file.status:
+            deltas[file.job_id][previous_status] -= 1
+            deltas[file.job_id][file.status] += 1
+    statements = []
+    # Fixed order, so concurrent batches lock job rows without deadlocking
+    for job_id in sorted(deltas):
+        values = {"version": Job.version + 1}
+        for file_status, column in PROGRESS_COUNTERS.items():
+            if deltas[job_id][file_status]:
+                values[column] = getattr(Job, column) + deltas[job_id][file_status]
+        statements.append(update(Job).where(Job.id == job_id).values(**values))
+    return statements
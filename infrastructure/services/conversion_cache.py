@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import uuid
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ...domain.services import FileConverter
+from ...domain.value_objects import ConversionResult
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class CachingFileConverter(FileConverter):
+    """
+    Content-addressed PDF cache in front of another FileConverter.
+
+    Entries are keyed by the SHA-256 of the DOCX bytes plus the wrapped
+    converter's settings fingerprint, stored on local disk and evicted
+    least-recently-used first once the cache grows past `max_bytes`.
+    Identical documents that are converted concurrently share a single
+    conversion.
+    """
+
+    def __init__(self, converter: FileConverter, cache_dir: str = "/app/cache/conversions",
+                 max_bytes: int = 5 * 1024 ** 3):
+        self.converter = converter
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._cached_bytes: Optional[int] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    def settings_fingerprint(self) -> str:
+        return self.converter.settings_fingerprint()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters of this process"""
+        return {"hits": self.hits, "misses": self.misses}
+
+    async def convert_docx_to_pdf(self, input_path: str, output_path: str,
+                                  timeout: Optional[float] = None) -> ConversionResult:
+        """
+        Serve the PDF from the cache, converting and storing it on a miss
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            key = await loop.run_in_executor(None, self._cache_key, input_path)
+        except OSError as e:
+            logger.warning(f"Could not hash {input_path}, bypassing conversion cache: {str(e)}")
+            return await self.converter.convert_docx_to_pdf(input_path, output_path, timeout)
+
+        # Wait for an identical document that is being converted right now
+        while key in self._in_flight:
+            await asyncio.shield(self._in_flight[key])
+
+        if self._restore(key, output_path):
+            self.hits += 1
+            logger.info(f"Conversion cache hit for {input_path} ({self.hits} hits, {self.misses} misses)")
+            return ConversionResult.success_result(input_path, output_path)
+
+        self.misses += 1
+        in_flight = loop.create_future()
+        self._in_flight[key] = in_flight
+        try:
+            result = await self.converter.convert_docx_to_pdf(input_path, output_path, timeout)
+            if result.success:
+                await loop.run_in_executor(None, self._store, key, output_path)
+            return result
+        finally:
+            del self._in_flight[key]
+            in_flight.set_result(None)
+
+    def supports_batches(self) -> bool:
+        return self.converter.supports_batches()
+
+    async def convert_batch(self, conversions: List[Tuple[str, str]], timeout: Optional[float] = None,
+                            file_timeouts: Optional[List[float]] = None) -> List[ConversionResult]:
+        """
+        Serve what the cache holds and convert the misses as one batch of the
+        wrapped converter
+        """
+        loop = asyncio.get_running_loop()
+        file_timeouts = file_timeouts or [timeout] * len(conversions)
+        results: List[Optional[ConversionResult]] = [None] * len(conversions)
+        misses: Dict[int, Optional[str]] = {}
+        # Documents converted elsewhere right now, or twice in this batch, go last
+        deferred = []
+        for index, (input_path, output_path) in enumerate(conversions):
+            try:
+                key = await loop.run_in_executor(None, self._cache_key, input_path)
+            except OSError as e:
+                logger.warning(f"Could not hash {input_path}, bypassing conversion cache: {str(e)}")
+                misses[index] = None
+                continue
+            if key in self._in_flight:
+                deferred.append(index)
+            elif self._restore(key, output_path):
+                self.hits += 1
+                results[index] = ConversionResult.success_result(input_path, output_path)
+            else:
+                self.misses += 1
+                self._in_flight[key] = loop.create_future()
+                misses[index] = key
+
+        try:
+            if misses:
+                converted = await self.converter.convert_batch(
+                    [conversions[index] for index in misses], timeout, [file_timeouts[index] for index in misses]
+                )
+                for (index, key), result in zip(misses.items(), converted):
+                    results[index] = result
+                    if key and result.success:
+                        await loop.run_in_executor(None, self._store, key, result.output_path)
+        finally:
+            for key in misses.values():
+                if key:
+                    self._in_flight.pop(key).set_result(None)
+
+        for index in deferred:
+            results[index] = await self.convert_docx_to_pdf(*conversions[index], file_timeouts[index])
+        logger.info(f"Conversion cache served {len(conversions) - len(misses) - len(deferred)} of a batch of {len(conversions)} files")
+        return results
+
+    def _cache_key(self, input_path: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(self.settings_fingerprint().encode())
+        digest.update(b"\0")
+        with open(input_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return Path(self.cache_dir) / key[:2] / f"{key}.pdf"
+
+    def _restore(self, key: str, output_path: str) -> bool:
+        """Hardlink (or copy) a cached PDF to output_path; False on a miss"""
+        entry = self._entry_path(key)
+        try:
+            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            _link_or_copy(str(entry), output_path)
+            # Touch the entry so eviction sees it as recently used
+            os.utime(entry)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.warning(f"Could not restore cached PDF {entry}: {str(e)}")
+            return False
+
+    def _store(self, key: str, output_path: str):
+        entry = self._entry_path(key)
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            # Publish atomically so concurrent workers never see partial entries
+            tmp_path = entry.parent / f".{key}.{uuid.uuid4().hex}.tmp"
+            _link_or_copy(output_path, str(tmp_path))
+            os.replace(tmp_path, entry)
+
+            if self._cached_bytes is None:
+                self._cached_bytes = self._scan_size()
+            else:
+                self._cached_bytes += entry.stat().st_size
+            if self._cached_bytes > self.max_bytes:
+                self._evict()
+        except OSError as e:
+            logger.warning(f"Could not store {output_path} in conversion cache: {str(e)}")
+
+    def _scan_size(self) -> int:
+        return sum(path.stat().st_size for path in Path(self.cache_dir).glob("*/*.pdf"))
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is at 90% of its bound"""
+        entries = []
+        for path in Path(self.cache_dir).glob("*/*.pdf"):
+            try:
+                stat = path.stat()
+                entries.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                total -= size
+                evicted += 1
+            except FileNotFoundError:
+                continue
+        self._cached_bytes = total
+        logger.info(f"Evicted {evicted} entries from conversion cache, {total} bytes remain")
+
+
+def _link_or_copy(source: str, destination: str):
+    try:
+        os.link(source, destination)
+    except OSError:
+        # Cross-device or link-less filesystems fall back to a plain copy
+        shutil.copyfile(source, destination)
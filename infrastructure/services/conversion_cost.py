@@ -0,0 +1,72 @@
+"""
+Conversion cost model: predicts how long LibreOffice takes on a DOCX from a
+cheap look at its package, to order conversions and size their timeouts
+"""
+import zipfile
+from dataclasses import dataclass
+
+SECTION_TAG = b"<w:sectPr"
+# Section breaks are counted in at most this much of word/document.xml
+SECTION_SCAN_BYTES = 16 * 1024 ** 2
+SCAN_CHUNK_BYTES = 1024 ** 2
+
+# Rough seconds per unit for `soffice --convert-to pdf`: markup that
+# compresses poorly is dense text and layout, media must be decoded, and
+# every section is laid out on its own
+BASE_SECONDS = 2.0
+SECONDS_PER_DOCUMENT_XML_MB = 1.0
+SECONDS_PER_COMPRESSED_XML_MB = 4.0
+SECONDS_PER_MEDIA_MB = 0.5
+SECONDS_PER_SECTION = 0.05
+
+MB = 1024 ** 2
+
+
+@dataclass
+class DocxCostFeatures:
+    document_xml_bytes: int
+    document_xml_compressed_bytes: int
+    media_bytes: int
+    section_count: int
+
+
+def measure_docx(zip_file: zipfile.ZipFile) -> DocxCostFeatures:
+    """Read the cost features of an open DOCX package"""
+    document = zip_file.getinfo("word/document.xml")
+    media_bytes = sum(
+        info.file_size for info in zip_file.infolist() if info.filename.startswith("word/media/")
+    )
+    return DocxCostFeatures(
+        document_xml_bytes=document.file_size,
+        document_xml_compressed_bytes=document.compress_size,
+        media_bytes=media_bytes,
+        section_count=_count_sections(zip_file, document)
+    )
+
+
+def estimate_conversion_seconds(features: DocxCostFeatures) -> float:
+    return round(
+        BASE_SECONDS
+        + SECONDS_PER_DOCUMENT_XML_MB * features.document_xml_bytes / MB
+        + SECONDS_PER_COMPRESSED_XML_MB * features.document_xml_compressed_bytes / MB
+        + SECONDS_PER_MEDIA_MB * features.media_bytes / MB
+        + SECONDS_PER_SECTION * features.section_count,
+        2
+    )
+
+
+def _count_sections(zip_file: zipfile.ZipFile, document: zipfile.ZipInfo) -> int:
+    count = 0
+    scanned = 0
+    tail = b""
+    with zip_file.open(document) as stream:
+        while scanned < SECTION_SCAN_BYTES:
+            chunk = stream.read(SCAN_CHUNK_BYTES)
+            if not chunk:
+                break
+            scanned += len(chunk)
+            # Keep the end of the previous chunk so a tag split across two is found
+            data = tail + chunk
+            count += data.count(SECTION_TAG)
+            tail = data[-(len(SECTION_TAG) - 1):]
+    return count
@@ -0,0 +1,28 @@
+"""
+Bounded thread pools for blocking work called from async code
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+# ZIP extraction and DOCX validation; bounds how much ingestion runs at once
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "4"))
+# Synchronous SQLAlchemy session work
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "16"))
+
+_ingest_executor = ThreadPoolExecutor(max_workers=INGEST_MAX_WORKERS, thread_name_prefix="ingest")
+_db_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+
+
+async def run_ingest(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run blocking ingestion work off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_ingest_executor, partial(func, *args, **kwargs))
+
+
+async def run_db(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run blocking database work off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, partial(func, *args, **kwargs))
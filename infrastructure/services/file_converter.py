@@ -1,16 +1,55 @@
-import subprocess
+import asyncio
 import os
+import shutil
+import signal
+import threading
 import logging
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 from ...domain.services import FileConverter
-from ...domain.value_objects import ConversionResult
+from ...domain.value_objects import ConversionResult, FailureKind
 
 logger = logging.getLogger(__name__)
 
 
+class ProfileSlots:
+    """
+    Hands out slot numbers so concurrent soffice runs in this process each get
+    their own -env:UserInstallation profile and output directory.
+    """
+
+    def __init__(self):
+        self._free: List[int] = []
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> int:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            slot = self._next
+            self._next += 1
+            return slot
+
+    def release(self, slot: int):
+        with self._lock:
+            self._free.append(slot)
+
+
+_profile_slots = ProfileSlots()
+
+
 class LibreOfficeFileConverter(FileConverter):
-    async def convert_docx_to_pdf(self, input_path: str, output_path: str) -> ConversionResult:
+    def __init__(self, profile_root: str = "/app/temp/lo_profiles", timeout: float = 60):
+        self.profile_root = profile_root
+        self.timeout = timeout
+
+    def settings_fingerprint(self) -> str:
+        return "libreoffice-cli:pdf"
+
+    async def convert_docx_to_pdf(self, input_path: str, output_path: str,
+                                  timeout: Optional[float] = None) -> ConversionResult:
         """
         Convert DOCX file to PDF using LibreOffice
         """
@@ -19,39 +58,192 @@ class LibreOfficeFileConverter(FileConverter):
             if not os.path.exists(input_path):
                 logger.error(f"Input file does not exist: {input_path}")
                 return ConversionResult.failure_result(input_path, output_path, "Input file does not exist")
-            
+
             # Create output directory if it doesn't exist
             Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-            
-            # Use LibreOffice to convert DOCX to PDF
-            cmd = [
-                "libreoffice",
-                "--headless",
-                "--convert-to", "pdf",
-                "--outdir", str(Path(output_path).parent),
-                input_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-            
-            if result.returncode == 0:
-                # LibreOffice creates the file with the same name but .pdf extension
-                expected_pdf = Path(input_path).with_suffix('.pdf')
-                if expected_pdf.exists():
-                    # Move to the desired output path
-                    expected_pdf.rename(output_path)
-                    logger.info(f"Successfully converted {input_path} to {output_path}")
-                    return ConversionResult.success_result(input_path, output_path)
-                else:
-                    logger.error(f"PDF file was not created: {expected_pdf}")
-                    return ConversionResult.failure_result(input_path, output_path, "PDF file was not created")
-            else:
-                logger.error(f"LibreOffice conversion failed: {result.stderr}")
-                return ConversionResult.failure_result(input_path, output_path, f"LibreOffice conversion failed: {result.stderr}")
-                
-        except subprocess.TimeoutExpired:
-            logger.error(f"Conversion timeout for {input_path}")
-            return ConversionResult.failure_result(input_path, output_path, "Conversion timeout")
+
+            slot = _profile_slots.acquire()
+            try:
+                return await self._convert_in_slot(slot, input_path, output_path, timeout or self.timeout)
+            finally:
+                _profile_slots.release(slot)
+
         except Exception as e:
             logger.error(f"Error converting {input_path}: {str(e)}")
-            return ConversionResult.failure_result(input_path, output_path, str(e))
+            return ConversionResult.failure_result(input_path, output_path, str(e), failure_kind=FailureKind.TRANSIENT)
+
+    def supports_batches(self) -> bool:
+        return True
+
+    async def convert_batch(self, conversions: List[Tuple[str, str]], timeout: Optional[float] = None,
+                            file_timeouts: Optional[List[float]] = None) -> List[ConversionResult]:
+        """
+        Convert the files with a single soffice run, paying its startup once.
+        Files a run leaves unconverted are retried in halves down to single
+        files, so a bad document fails alone instead of with its batch; after
+        a run times out they are converted one at a time, each within its own
+        file timeout, so a hanging document isn't given a timeout per halving.
+        """
+        timeout = timeout or self.timeout
+        file_timeouts = [file_timeout or timeout for file_timeout in file_timeouts or [None] * len(conversions)]
+        results: List[Optional[ConversionResult]] = [None] * len(conversions)
+        pending = []
+        for index, (input_path, output_path) in enumerate(conversions):
+            if not os.path.exists(input_path):
+                logger.error(f"Input file does not exist: {input_path}")
+                results[index] = ConversionResult.failure_result(input_path, output_path, "Input file does not exist")
+            else:
+                Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+                pending.append(index)
+
+        slot = _profile_slots.acquire()
+        try:
+            while pending:
+                # soffice names each PDF after its input, so a repeated name
+                # waits for a later run
+                batch, deferred, names = [], [], set()
+                for index in pending:
+                    name = Path(conversions[index][0]).stem
+                    (deferred if name in names else batch).append(index)
+                    names.add(name)
+                batch_results = await self._convert_batch_in_slot(
+                    slot, [conversions[index] for index in batch], [file_timeouts[index] for index in batch], timeout
+                )
+                for index, result in zip(batch, batch_results):
+                    results[index] = result
+                pending = deferred
+        except Exception as e:
+            logger.error(f"Error converting a batch of {len(conversions)} files: {str(e)}")
+        finally:
+            _profile_slots.release(slot)
+
+        return [
+            result or ConversionResult.failure_result(
+                input_path, output_path, "Batch conversion failed", failure_kind=FailureKind.TRANSIENT
+            )
+            for result, (input_path, output_path) in zip(results, conversions)
+        ]
+
+    async def _convert_batch_in_slot(self, slot: int, batch: List[Tuple[str, str]], file_timeouts: List[float],
+                                     timeout: float) -> List[ConversionResult]:
+        if len(batch) == 1:
+            input_path, output_path = batch[0]
+            return [await self._convert_in_slot(slot, input_path, output_path, file_timeouts[0])]
+
+        profile_dir, slot_output_dir = self._prepare_slot(slot)
+        returncode, error_output = await self._run_soffice(
+            profile_dir, slot_output_dir, [input_path for input_path, _ in batch], timeout
+        )
+        if returncode is None:
+            logger.error(f"Conversion timeout for a batch of {len(batch)} files")
+        elif returncode != 0:
+            logger.error(f"LibreOffice batch conversion failed: {error_output}")
+
+        results: List[Optional[ConversionResult]] = []
+        for input_path, output_path in batch:
+            expected_pdf = slot_output_dir / f"{Path(input_path).stem}.pdf"
+            if expected_pdf.exists() and expected_pdf.stat().st_size > 0:
+                shutil.move(str(expected_pdf), output_path)
+                results.append(ConversionResult.success_result(input_path, output_path))
+            else:
+                results.append(None)
+
+        # Bisect what the run left unconverted to isolate the bad documents; a
+        # hanging one would time out every half holding it, so after a timeout
+        # the files go one at a time
+        failed = [index for index, result in enumerate(results) if result is None]
+        if returncode is None:
+            parts = [[index] for index in failed]
+        else:
+            half = (len(failed) + 1) // 2
+            parts = [part for part in (failed[:half], failed[half:]) if part]
+        if failed:
+            logger.warning(
+                f"{len(failed)} of {len(batch)} files were not converted in a batch, "
+                f"retrying them {'one at a time' if returncode is None else 'in halves'}"
+            )
+        for part in parts:
+            part_timeouts = [file_timeouts[index] for index in part]
+            part_results = await self._convert_batch_in_slot(
+                slot, [batch[index] for index in part], part_timeouts, min(timeout, sum(part_timeouts))
+            )
+            for index, result in zip(part, part_results):
+                results[index] = result
+        logger.info(f"Converted a batch of {len(batch)} files, {len(batch) - len(failed)} in one run")
+        return results
+
+    async def _convert_in_slot(self, slot: int, input_path: str, output_path: str,
+                               timeout: float) -> ConversionResult:
+        profile_dir, slot_output_dir = self._prepare_slot(slot)
+        returncode, error_output = await self._run_soffice(profile_dir, slot_output_dir, [input_path], timeout)
+        if returncode is None:
+            logger.error(f"Conversion timeout for {input_path}")
+            return ConversionResult.failure_result(
+                input_path, output_path, "Conversion timeout", poison_suspect=True, failure_kind=FailureKind.TIMEOUT
+            )
+
+        if returncode == 0:
+            # LibreOffice creates the file with the same name but .pdf extension
+            expected_pdf = slot_output_dir / f"{Path(input_path).stem}.pdf"
+            if expected_pdf.exists():
+                # Move to the desired output path
+                shutil.move(str(expected_pdf), output_path)
+                logger.info(f"Successfully converted {input_path} to {output_path}")
+                return ConversionResult.success_result(input_path, output_path)
+            else:
+                logger.error(f"PDF file was not created: {expected_pdf}")
+                return ConversionResult.failure_result(
+                    input_path, output_path, "PDF file was not created", failure_kind=FailureKind.CRASH
+                )
+        else:
+            logger.error(f"LibreOffice conversion failed: {error_output}")
+            return ConversionResult.failure_result(
+                input_path, output_path, f"LibreOffice conversion failed: {error_output}", poison_suspect=True,
+                failure_kind=FailureKind.CRASH
+            )
+
+    def _prepare_slot(self, slot: int) -> Tuple[Path, Path]:
+        """Profile and emptied output directory of the slot"""
+        # Each slot has a private profile (soffice locks it) and a private outdir
+        slot_dir = Path(self.profile_root) / f"{os.getpid()}-{slot}"
+        profile_dir = slot_dir / "profile"
+        slot_output_dir = slot_dir / "output"
+        shutil.rmtree(slot_output_dir, ignore_errors=True)
+        slot_output_dir.mkdir(parents=True, exist_ok=True)
+        return profile_dir, slot_output_dir
+
+    async def _run_soffice(self, profile_dir: Path, output_dir: Path, input_paths: List[str],
+                           timeout: float) -> Tuple[Optional[int], str]:
+        """Run one soffice conversion; returns its exit code (None on timeout) and stderr"""
+        # Use LibreOffice to convert DOCX to PDF
+        cmd = [
+            "libreoffice",
+            f"-env:UserInstallation={profile_dir.as_uri()}",
+            "--headless",
+            "--convert-to", "pdf",
+            "--outdir", str(output_dir),
+            *input_paths
+        ]
+
+        # Its own process group, so killing it also kills what it spawned
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, start_new_session=True
+        )
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await _kill(process)
+            return None, ""
+        except asyncio.CancelledError:
+            # The job was cancelled: free the slot now instead of finishing
+            await _kill(process)
+            raise
+        return process.returncode, stderr.decode(errors="replace")
+
+
+async def _kill(process: asyncio.subprocess.Process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    await process.wait()
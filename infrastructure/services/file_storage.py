@@ -1,31 +1,74 @@
+import io
 import os
 import zipfile
 import shutil
+import hashlib
 import logging
 from pathlib import Path
-from typing import List
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
 
+import aiofiles
+
+from ...domain.exceptions import UploadTooLargeError
 from ...domain.services import FileStorage
+from ...domain.value_objects import StoredUpload
+from .executors import run_ingest
 
 logger = logging.getLogger(__name__)
 
+ZIP_STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class _ZipStreamSink(io.RawIOBase):
+    """Unseekable sink that collects what ZipFile writes until drained"""
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
 
 class LocalFileStorage(FileStorage):
-    async def save_uploaded_file(self, file_content: bytes, file_path: str) -> bool:
-        """Save uploaded file content to the specified path"""
+    async def save_uploaded_file(self, stream: AsyncIterator[bytes], file_path: str,
+                                max_bytes: Optional[int] = None) -> StoredUpload:
+        """Stream uploaded chunks to the specified path, hashing them on the way"""
+        # Create directory if it doesn't exist
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        
+        digest = hashlib.sha256()
+        size = 0
         try:
-            # Create directory if it doesn't exist
-            Path(file_path).parent.mkdir(parents=True, exist_ok=True)
-            
-            with open(file_path, "wb") as f:
-                f.write(file_content)
-            return True
+            async with aiofiles.open(file_path, "wb") as f:
+                async for chunk in stream:
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise UploadTooLargeError(max_bytes)
+                    digest.update(chunk)
+                    await f.write(chunk)
         except Exception as e:
             logger.error(f"Error saving file {file_path}: {str(e)}")
-            return False
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+        
+        return StoredUpload(path=file_path, size=size, sha256=digest.hexdigest())
 
     async def extract_zip_file(self, zip_path: str, extract_to: str) -> List[str]:
         """Extract zip file and return list of extracted file paths"""
+        return await run_ingest(self._extract_zip_file, zip_path, extract_to)
+
+    def _extract_zip_file(self, zip_path: str, extract_to: str) -> List[str]:
         extracted_files = []
         try:
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
@@ -43,27 +86,50 @@ class LocalFileStorage(FileStorage):
             logger.error(f"Error extracting zip file {zip_path}: {str(e)}")
             raise
 
-    async def create_zip_archive(self, files: List[str], zip_path: str) -> bool:
-        """Create a zip archive of the specified files"""
-        try:
-            # Create directory if it doesn't exist
-            Path(zip_path).parent.mkdir(parents=True, exist_ok=True)
-            
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for file_path in files:
-                    if os.path.exists(file_path):
-                        zipf.write(file_path, Path(file_path).name)
-            
-            logger.info(f"Created zip archive: {zip_path}")
-            return True
-        except Exception as e:
-            logger.error(f"Error creating zip archive {zip_path}: {str(e)}")
-            return False
+    def stream_zip_archive(self, files: List[Tuple[str, str]]) -> Iterator[bytes]:
+        """
+        Yield a ZIP archive of the specified files as it is built.
+
+        Entries are stored uncompressed, since PDFs are already compressed,
+        and ZIP64 records are added automatically when needed. The sink is
+        unseekable, so sizes and CRCs go into data descriptors.
+        """
+        sink = _ZipStreamSink()
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED, allowZip64=True) as zipf:
+            for file_path, archive_name in files:
+                zinfo = zipfile.ZipInfo.from_file(file_path, archive_name)
+                zinfo.compress_type = zipfile.ZIP_STORED
+                with open(file_path, 'rb') as src, zipf.open(zinfo, 'w') as dest:
+                    for chunk in iter(lambda: src.read(ZIP_STREAM_CHUNK_SIZE), b""):
+                        dest.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+                data = sink.drain()
+                if data:
+                    yield data
+        data = sink.drain()
+        if data:
+            yield data
 
     async def file_exists(self, file_path: str) -> bool:
         """Check if file exists"""
         return os.path.exists(file_path)
 
+    async def file_size(self, file_path: str) -> Optional[int]:
+        """Size of the file in bytes, or None if it does not exist"""
+        try:
+            return os.path.getsize(file_path)
+        except OSError:
+            return None
+
+    async def free_space(self, directory_path: str) -> int:
+        """Bytes available on the filesystem holding the directory, or its nearest existing parent"""
+        path = Path(directory_path)
+        while not path.exists() and path != path.parent:
+            path = path.parent
+        return shutil.disk_usage(path).free
+
     async def create_directory(self, directory_path: str) -> bool:
         """Create directory if it doesn't exist"""
         try:
@@ -72,3 +138,12 @@ class LocalFileStorage(FileStorage):
         except Exception as e:
             logger.error(f"Error creating directory {directory_path}: {str(e)}")
             return False
+
+    async def delete_directory(self, directory_path: str) -> bool:
+        """Remove the directory and everything in it"""
+        try:
+            await run_ingest(shutil.rmtree, directory_path, ignore_errors=True)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting directory {directory_path}: {str(e)}")
+            return False
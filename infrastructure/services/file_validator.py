@@ -1,17 +1,37 @@
 import os
+import zipfile
 import logging
+from typing import Optional
 
 from ...domain.services import FileValidator
 from ...domain.value_objects import FileValidationResult
+from .conversion_cost import measure_docx, estimate_conversion_seconds
+from .executors import run_ingest
 
 logger = logging.getLogger(__name__)
 
+WORD_MAIN_CONTENT_TYPE = b"application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"
+MAX_CONTENT_TYPES_BYTES = 1024 * 1024
+
 
 class DocxFileValidator(FileValidator):
+    """
+    "fast" mode checks the ZIP central directory, [Content_Types].xml and
+    word/document.xml without parsing the document. "deep" mode also loads
+    the file with python-docx.
+    """
+
+    def __init__(self, mode: str = "fast", max_document_xml_bytes: int = 512 * 1024 ** 2):
+        self.mode = mode
+        self.max_document_xml_bytes = max_document_xml_bytes
+
     async def validate_docx_file(self, file_path: str) -> FileValidationResult:
         """
         Validate if the file is a valid DOCX file
         """
+        return await run_ingest(self._validate_docx_file, file_path)
+
+    def _validate_docx_file(self, file_path: str) -> FileValidationResult:
         try:
             if not os.path.exists(file_path):
                 return FileValidationResult.invalid_file(file_path, "File does not exist")
@@ -20,12 +40,52 @@ class DocxFileValidator(FileValidator):
             if not file_path.lower().endswith('.docx'):
                 return FileValidationResult.invalid_file(file_path, "File is not a DOCX file")
             
-            # Try to open with python-docx to validate
-            from docx import Document
-            doc = Document(file_path)
-            # If we can open it, it's likely a valid DOCX
-            return FileValidationResult.valid_file(file_path)
+            error_message = self._check_structure(file_path)
+            if error_message:
+                logger.error(f"Invalid DOCX file {file_path}: {error_message}")
+                return FileValidationResult.invalid_file(file_path, error_message)
+            
+            if self.mode == "deep":
+                # Try to open with python-docx to validate
+                from docx import Document
+                Document(file_path)
+            
+            return FileValidationResult.valid_file(
+                file_path, validation_mode=self.mode,
+                estimated_cost_seconds=self._estimate_cost(file_path)
+            )
             
         except Exception as e:
             logger.error(f"Invalid DOCX file {file_path}: {str(e)}")
             return FileValidationResult.invalid_file(file_path, str(e))
+
+    def _check_structure(self, file_path: str) -> Optional[str]:
+        """Return an error message if the DOCX package structure is broken"""
+        try:
+            with zipfile.ZipFile(file_path, 'r') as zip_file:
+                try:
+                    content_types = zip_file.getinfo('[Content_Types].xml')
+                    document = zip_file.getinfo('word/document.xml')
+                except KeyError:
+                    return "Missing [Content_Types].xml or word/document.xml"
+                
+                if document.file_size == 0:
+                    return "word/document.xml is empty"
+                if document.file_size > self.max_document_xml_bytes:
+                    return "word/document.xml is too large"
+                if content_types.file_size > MAX_CONTENT_TYPES_BYTES:
+                    return "[Content_Types].xml is too large"
+                if WORD_MAIN_CONTENT_TYPE not in zip_file.read(content_types):
+                    return "Not a Word document"
+        except zipfile.BadZipFile:
+            return "File is not a valid ZIP archive"
+        return None
+
+    def _estimate_cost(self, file_path: str) -> Optional[float]:
+        """Predicted conversion seconds, or None if the package can't be measured"""
+        try:
+            with zipfile.ZipFile(file_path, 'r') as zip_file:
+                return estimate_conversion_seconds(measure_docx(zip_file))
+        except Exception as e:
+            logger.warning(f"Could not estimate the conversion cost of {file_path}: {str(e)}")
+            return None
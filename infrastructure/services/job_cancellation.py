@@ -0,0 +1,34 @@
+import logging
+
+import redis.asyncio as redis
+
+from ...domain.services import JobCancellation
+from .redis_clients import loop_client
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "job_cancel:"
+
+
+class RedisJobCancellation(JobCancellation):
+    """
+    One Redis key per cancelled job, which workers poll while they run it.
+    Keys outlive any run of the job by `ttl_seconds`.
+    """
+
+    def __init__(self, redis_url: str, ttl_seconds: int = 24 * 3600):
+        self.redis_url = redis_url
+        self.ttl_seconds = ttl_seconds
+
+    def _redis(self) -> redis.Redis:
+        return loop_client(self.redis_url)
+
+    async def request(self, job_id: str):
+        await self._redis().set(_key(job_id), "1", ex=self.ttl_seconds)
+
+    async def is_requested(self, job_id: str) -> bool:
+        return await self._redis().exists(_key(job_id)) == 1
+
+
+def _key(job_id: str) -> str:
+    return f"{KEY_PREFIX}{job_id}"
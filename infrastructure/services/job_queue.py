@@ -1,25 +1,136 @@
+import math
 import os
+import uuid
 import logging
-from celery import Celery
+from typing import List, Optional
+import redis
+from celery import Celery, chord
 
 from ...domain.services import JobQueue
+from ...domain.value_objects import JobPriority
+from .job_lanes import LANES, select_lane
+from .tenant_scheduler import RedisTenantScheduler
 
 logger = logging.getLogger(__name__)
 
+# Ids of the Celery tasks started for a job, kept so cancelling it can revoke them
+JOB_TASKS_KEY_PREFIX = "job_tasks:"
+JOB_TASKS_TTL_SECONDS = 24 * 3600
+# Ids of the chunk and finalizer tasks of a fanned-out job, which a cancel
+# leaves running: chunks hold no lease, so they settle the job themselves
+JOB_CHUNKS_KEY_PREFIX = "job_chunks:"
+
 
 class CeleryJobQueue(JobQueue):
-    def __init__(self):
+    def __init__(self, fanout_chunk_size: int = 0, fast_lane_max_files: int = 50,
+                 tenant_scheduler: Optional[RedisTenantScheduler] = None):
         REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
         self.celery = Celery("worker", broker=REDIS_URL, backend=REDIS_URL)
+        self.redis = redis.from_url(REDIS_URL, decode_responses=True)
+        # 0 processes a job in one task; N > 0 fans it out into tasks of N files
+        self.fanout_chunk_size = fanout_chunk_size
+        # Jobs up to this many files go to the fast lane unless a priority says otherwise
+        self.fast_lane_max_files = fast_lane_max_files
+        # Orders tenants' jobs fairly; without it jobs run in submission order
+        self.tenant_scheduler = tenant_scheduler
 
-    async def enqueue_job(self, job_id: str) -> bool:
-        """Enqueue a job for processing"""
+    async def enqueue_job(self, job_id: str, file_ids: Optional[List[int]] = None,
+                          priority: Optional[JobPriority] = None,
+                          tenant_id: Optional[str] = None) -> bool:
+        """Enqueue a job for processing on the lane of its priority or size"""
         try:
             # Import here to avoid circular imports
-            from ...interface.workers import process_job_task
-            process_job_task.delay(job_id)
-            logger.info(f"Enqueued job {job_id} for processing")
+            from ...interface.workers.celery_worker import dispatch_next_job_task
+            lane = select_lane(len(file_ids or []), priority, self.fast_lane_max_files)
+            if self.tenant_scheduler and tenant_id:
+                try:
+                    # Every queued job adds one dispatch task to the lane; each
+                    # of them runs whichever job the scheduler picks next
+                    self.tenant_scheduler.push(lane, tenant_id, job_id, len(file_ids or []))
+                    dispatch_next_job_task.apply_async(args=[lane], queue=lane)
+                    logger.info(f"Scheduled job {job_id} of tenant {tenant_id} on {lane}")
+                    return True
+                except redis.RedisError as e:
+                    logger.warning(f"Could not schedule job {job_id}, queueing it directly: {str(e)}")
+            self.dispatch(job_id, file_ids, lane)
             return True
         except Exception as e:
             logger.error(f"Error enqueueing job {job_id}: {str(e)}")
             return False
+
+    def dispatch(self, job_id: str, file_ids: Optional[List[int]], lane: str,
+                 tenant_id: Optional[str] = None):
+        """
+        Start the job's tasks on the lane, file_ids in longest-first order.
+        With a tenant_id, the job holds a running slot of that tenant, which
+        its finalizer gives back.
+        """
+        from ...interface.workers.celery_worker import (
+            process_job_task, convert_files_task, finalize_job_task
+        )
+        if self.fanout_chunk_size > 0 and file_ids:
+            # Deal the files out in turn, so the expensive ones at the head of
+            # the longest-first order spread across the chunks
+            chunk_count = math.ceil(len(file_ids) / self.fanout_chunk_size)
+            chunks = [file_ids[i::chunk_count] for i in range(chunk_count)]
+            task_ids = [uuid.uuid4().hex for _ in range(chunk_count + 1)]
+            self._record_tasks(job_id, _chunks_key(job_id), task_ids)
+            # The finalizer runs once every chunk task has finished
+            chord(
+                convert_files_task.s(job_id, chunk).set(queue=lane, task_id=task_id)
+                for chunk, task_id in zip(chunks, task_ids)
+            )(finalize_job_task.si(job_id, tenant_id).set(queue=lane, task_id=task_ids[-1]))
+            logger.info(f"Enqueued job {job_id} on {lane} for processing as {len(chunks)} tasks")
+        else:
+            task_id = uuid.uuid4().hex
+            self._record_tasks(job_id, _tasks_key(job_id), [task_id])
+            process_job_task.apply_async(args=[job_id, tenant_id], queue=lane, task_id=task_id)
+            logger.info(f"Enqueued job {job_id} on {lane} for processing")
+
+    async def cancel_job(self, job_id: str, tenant_id: Optional[str] = None) -> bool:
+        """
+        Take the job out of its tenant's queues, revoke the tasks started
+        for it and give back its tenant's running slot; tasks already
+        running stop on their own once they see the job is cancelled.
+
+        The chunk tasks of a fanned-out job are not revoked: each one that
+        starts settles its own files, and the finalizer the rest once they
+        have all returned. True for such a job.
+        """
+        if self.tenant_scheduler and tenant_id:
+            try:
+                self.tenant_scheduler.remove(tenant_id, job_id, LANES.values())
+                self.tenant_scheduler.release(tenant_id, job_id)
+            except redis.RedisError as e:
+                logger.warning(f"Could not unschedule job {job_id}: {str(e)}")
+        try:
+            task_ids = list(self.redis.smembers(_tasks_key(job_id)))
+            if task_ids:
+                self.celery.control.revoke(task_ids)
+                logger.info(f"Revoked {len(task_ids)} tasks of job {job_id}")
+            self.redis.delete(_tasks_key(job_id))
+        except Exception as e:
+            logger.warning(f"Could not revoke the tasks of job {job_id}: {str(e)}")
+        try:
+            return self.redis.exists(_chunks_key(job_id)) == 1
+        except redis.RedisError as e:
+            logger.warning(f"Could not tell whether job {job_id} was fanned out: {str(e)}")
+            return False
+
+    def _record_tasks(self, job_id: str, key: str, task_ids: List[str]):
+        try:
+            pipeline = self.redis.pipeline()
+            pipeline.sadd(key, *task_ids)
+            pipeline.expire(key, JOB_TASKS_TTL_SECONDS)
+            pipeline.execute()
+        except redis.RedisError as e:
+            # Without the ids, a cancelled job's tasks still stop when they start
+            logger.warning(f"Could not record the tasks of job {job_id}: {str(e)}")
+
+
+def _tasks_key(job_id: str) -> str:
+    return f"{JOB_TASKS_KEY_PREFIX}{job_id}"
+
+
+def _chunks_key(job_id: str) -> str:
+    return f"{JOB_CHUNKS_KEY_PREFIX}{job_id}"
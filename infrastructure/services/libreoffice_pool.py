@@ -0,0 +1,264 @@
+import asyncio
+import atexit
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+from ...domain.services import FileConverter
+from ...domain.value_objects import ConversionResult, FailureKind
+
+logger = logging.getLogger(__name__)
+
+UNO_CLIENT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uno_client.py")
+
+# Exit codes of uno_client.py
+UNO_EXIT_OK = 0
+UNO_EXIT_NO_CONNECTION = 2
+
+
+class SofficeInstance:
+    """A headless soffice process listening on its own UNO pipe and profile"""
+
+    def __init__(self, index: int, profile_root: str, soffice_binary: str,
+                 uno_python: str, start_timeout: float):
+        self.index = index
+        self.soffice_binary = soffice_binary
+        self.uno_python = uno_python
+        self.start_timeout = start_timeout
+        self.pipe_name = f"bulkdoc_{os.getpid()}_{index}"
+        self.profile_dir = os.path.join(profile_root, f"{os.getpid()}-{index}")
+        self.process: Optional[subprocess.Popen] = None
+        self.conversions = 0
+
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def has_crashed(self) -> bool:
+        return self.process is not None and self.process.poll() is not None
+
+    def start(self):
+        """Start soffice and wait until its UNO pipe accepts connections"""
+        Path(self.profile_dir).mkdir(parents=True, exist_ok=True)
+        cmd = [
+            self.soffice_binary,
+            "--headless",
+            "--invisible",
+            "--nologo",
+            "--norestore",
+            "--nodefault",
+            "--nolockcheck",
+            f"-env:UserInstallation={Path(self.profile_dir).as_uri()}",
+            f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext",
+        ]
+        self.process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+        self.conversions = 0
+
+        if not self.ping(self.start_timeout):
+            self.stop()
+            raise RuntimeError(f"soffice instance {self.index} did not become ready")
+        logger.info(f"Started soffice instance {self.index} (pid {self.process.pid})")
+
+    def ping(self, timeout: float = 5.0) -> bool:
+        """Health check: the process is alive and answers on its UNO pipe"""
+        if not self.is_running():
+            return False
+        try:
+            result = subprocess.run(
+                [self.uno_python, UNO_CLIENT_SCRIPT, "ping", self.pipe_name, str(timeout)],
+                capture_output=True, text=True, timeout=timeout + 10
+            )
+            return result.returncode == UNO_EXIT_OK
+        except subprocess.TimeoutExpired:
+            return False
+
+    def convert(self, input_path: str, output_path: str,
+                timeout: float) -> subprocess.CompletedProcess:
+        """Convert one document through this instance; raises TimeoutExpired"""
+        result = subprocess.run(
+            [self.uno_python, UNO_CLIENT_SCRIPT, "convert", self.pipe_name, input_path, output_path],
+            capture_output=True, text=True, timeout=timeout
+        )
+        self.conversions += 1
+        return result
+
+    def kill(self):
+        """Kill the soffice process group at once, abandoning the conversion it runs"""
+        process = self.process
+        if process is not None and process.poll() is None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def stop(self, wipe_profile: bool = False):
+        """Terminate the soffice process group, optionally discarding its profile"""
+        if self.process is not None and self.process.poll() is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGTERM)
+                self.process.wait(timeout=10)
+            except (ProcessLookupError, subprocess.TimeoutExpired):
+                try:
+                    os.killpg(self.process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                self.process.wait()
+        self.process = None
+        if wipe_profile:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class LibreOfficeProcessPool:
+    """
+    Pool of long-lived headless soffice instances for one worker process.
+
+    Instances are started lazily on first use, health-checked when they are
+    handed out, and recycled after `max_conversions` documents or a crash.
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        max_conversions: int = 200,
+        profile_root: str = "/app/temp/soffice_profiles",
+        soffice_binary: str = "soffice",
+        uno_python: str = "/usr/bin/python3",
+        start_timeout: float = 30.0,
+        acquire_timeout: float = 300.0
+    ):
+        self.max_conversions = max_conversions
+        self.acquire_timeout = acquire_timeout
+        self._instances: List[SofficeInstance] = [
+            SofficeInstance(index, profile_root, soffice_binary, uno_python, start_timeout)
+            for index in range(size)
+        ]
+        self._idle: "queue.Queue[SofficeInstance]" = queue.Queue()
+        for instance in self._instances:
+            self._idle.put(instance)
+        atexit.register(self.shutdown)
+
+    def acquire(self) -> SofficeInstance:
+        """Take an idle instance, restarting it first if it is down"""
+        instance = self._idle.get(timeout=self.acquire_timeout)
+        try:
+            if instance.has_crashed():
+                logger.warning(f"soffice instance {instance.index} crashed, restarting")
+                instance.stop(wipe_profile=True)
+            if not instance.is_running():
+                instance.start()
+        except Exception:
+            self._idle.put(instance)
+            raise
+        return instance
+
+    def release(self, instance: SofficeInstance, healthy: bool = True):
+        """Return an instance to the pool, recycling it when needed"""
+        if not healthy:
+            logger.warning(f"Recycling unhealthy soffice instance {instance.index}")
+            instance.stop(wipe_profile=True)
+        elif instance.conversions >= self.max_conversions:
+            logger.info(f"Recycling soffice instance {instance.index} after {instance.conversions} conversions")
+            instance.stop()
+        self._idle.put(instance)
+
+    def shutdown(self):
+        """Stop every instance in the pool"""
+        for instance in self._instances:
+            instance.stop()
+
+
+class LibreOfficePoolFileConverter(FileConverter):
+    def __init__(self, pool: LibreOfficeProcessPool, conversion_timeout: float = 60.0):
+        self.pool = pool
+        self.conversion_timeout = conversion_timeout
+
+    def settings_fingerprint(self) -> str:
+        return "libreoffice-uno:writer_pdf_Export"
+
+    async def convert_docx_to_pdf(self, input_path: str, output_path: str,
+                                  timeout: Optional[float] = None) -> ConversionResult:
+        """
+        Convert DOCX file to PDF using a warm soffice instance from the pool
+        """
+        if not os.path.exists(input_path):
+            logger.error(f"Input file does not exist: {input_path}")
+            return ConversionResult.failure_result(input_path, output_path, "Input file does not exist")
+
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+
+        loop = asyncio.get_running_loop()
+        # Holds the instance converting the document, to kill it on cancellation
+        acquired: List[SofficeInstance] = []
+        try:
+            return await loop.run_in_executor(
+                None, self._convert_sync, input_path, output_path, timeout or self.conversion_timeout, acquired
+            )
+        except asyncio.CancelledError:
+            # The conversion thread then sees the instance die and recycles it
+            for instance in acquired:
+                instance.kill()
+            raise
+
+    def _convert_sync(self, input_path: str, output_path: str, timeout: float,
+                      acquired: List[SofficeInstance]) -> ConversionResult:
+        try:
+            instance = self.pool.acquire()
+            acquired.append(instance)
+        except queue.Empty:
+            return ConversionResult.failure_result(
+                input_path, output_path, "No LibreOffice instance available", failure_kind=FailureKind.TRANSIENT
+            )
+        except Exception as e:
+            logger.error(f"Could not start LibreOffice instance: {str(e)}")
+            return ConversionResult.failure_result(
+                input_path, output_path, f"Could not start LibreOffice: {str(e)}", failure_kind=FailureKind.TRANSIENT
+            )
+
+        healthy = True
+        try:
+            result = instance.convert(
+                os.path.abspath(input_path),
+                os.path.abspath(output_path),
+                timeout
+            )
+
+            if result.returncode == UNO_EXIT_OK:
+                if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+                    logger.info(f"Successfully converted {input_path} to {output_path}")
+                    return ConversionResult.success_result(input_path, output_path)
+                logger.error(f"PDF file was not created: {output_path}")
+                return ConversionResult.failure_result(
+                    input_path, output_path, "PDF file was not created", failure_kind=FailureKind.CRASH
+                )
+
+            healthy = result.returncode != UNO_EXIT_NO_CONNECTION and instance.is_running()
+            logger.error(f"LibreOffice conversion failed: {result.stderr}")
+            # An instance that died on the document was crashed by it
+            return ConversionResult.failure_result(
+                input_path, output_path, f"LibreOffice conversion failed: {result.stderr}",
+                poison_suspect=result.returncode != UNO_EXIT_NO_CONNECTION and not healthy,
+                failure_kind=FailureKind.TRANSIENT if result.returncode == UNO_EXIT_NO_CONNECTION else FailureKind.CRASH
+            )
+
+        except subprocess.TimeoutExpired:
+            # A hung document leaves soffice busy, so the instance must go
+            healthy = False
+            logger.error(f"Conversion timeout for {input_path}")
+            return ConversionResult.failure_result(
+                input_path, output_path, "Conversion timeout", poison_suspect=True, failure_kind=FailureKind.TIMEOUT
+            )
+        except Exception as e:
+            healthy = instance.is_running()
+            logger.error(f"Error converting {input_path}: {str(e)}")
+            return ConversionResult.failure_result(input_path, output_path, str(e), failure_kind=FailureKind.TRANSIENT)
+        finally:
+            self.pool.release(instance, healthy)
@@ -0,0 +1,183 @@
+"""
+Quarantine of poison documents: ones that timed out or crashed the converter
+more than max_failures times are failed right away instead of converted again
+"""
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from ...domain.services import DocumentQuarantine, FileConverter
+from ...domain.value_objects import ConversionResult, QuarantineEntry
+from .redis_clients import loop_client
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "quarantine:"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(file_path: str) -> str:
+    """SHA-256 of the file's bytes"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RedisDocumentQuarantine(DocumentQuarantine):
+    """
+    One Redis hash per quarantined document, holding its failure count,
+    last error and file name, which expires `ttl_seconds` after the last
+    failure.
+    """
+
+    def __init__(self, redis_url: str, ttl_seconds: int = 7 * 24 * 3600):
+        self.redis_url = redis_url
+        self.ttl_seconds = ttl_seconds
+
+    def _redis(self) -> redis.Redis:
+        return loop_client(self.redis_url)
+
+    async def get(self, content_hash: str) -> Optional[QuarantineEntry]:
+        pipeline = self._redis().pipeline()
+        pipeline.hgetall(_key(content_hash))
+        pipeline.ttl(_key(content_hash))
+        fields, ttl = await pipeline.execute()
+        return _entry(content_hash, fields, ttl)
+
+    async def record_failure(self, content_hash: str, filename: str, error_message: str) -> QuarantineEntry:
+        key = _key(content_hash)
+        pipeline = self._redis().pipeline()
+        pipeline.hincrby(key, "failures", 1)
+        pipeline.hset(key, mapping={
+            "error_message": error_message,
+            "filename": filename,
+            "last_failed_at": datetime.utcnow().isoformat()
+        })
+        pipeline.expire(key, self.ttl_seconds)
+        pipeline.hgetall(key)
+        *_, fields = await pipeline.execute()
+        return _entry(content_hash, fields, self.ttl_seconds)
+
+    async def list_entries(self, limit: int = 100) -> List[QuarantineEntry]:
+        client = self._redis()
+        entries = []
+        async for key in client.scan_iter(match=f"{KEY_PREFIX}*", count=limit):
+            entry = await self.get(key[len(KEY_PREFIX):])
+            if entry:
+                entries.append(entry)
+            if len(entries) >= limit:
+                break
+        return entries
+
+    async def clear(self, content_hash: str) -> bool:
+        return await self._redis().delete(_key(content_hash)) == 1
+
+
+class QuarantiningFileConverter(FileConverter):
+    """
+    Fast-fails documents that timed out or crashed the wrapped converter
+    more than `max_failures` times, instead of spending a worker slot on
+    them again.
+
+    The quarantine is best effort: when it can't be reached, documents are
+    converted as usual.
+    """
+
+    def __init__(self, converter: FileConverter, quarantine: DocumentQuarantine, max_failures: int = 2):
+        self.converter = converter
+        self.quarantine = quarantine
+        self.max_failures = max(1, max_failures)
+
+    def settings_fingerprint(self) -> str:
+        return self.converter.settings_fingerprint()
+
+    def supports_batches(self) -> bool:
+        return self.converter.supports_batches()
+
+    async def convert_docx_to_pdf(self, input_path: str, output_path: str,
+                                  timeout: Optional[float] = None) -> ConversionResult:
+        """
+        Fail a quarantined document right away, otherwise convert it and
+        record a timeout or crash against it
+        """
+        document_hash, rejection = await self._check(input_path, output_path)
+        if rejection:
+            return rejection
+        result = await self.converter.convert_docx_to_pdf(input_path, output_path, timeout)
+        await self._record(document_hash, result)
+        return result
+
+    async def convert_batch(self, conversions: List[Tuple[str, str]], timeout: Optional[float] = None,
+                            file_timeouts: Optional[List[float]] = None) -> List[ConversionResult]:
+        file_timeouts = file_timeouts or [timeout] * len(conversions)
+        results: List[Optional[ConversionResult]] = [None] * len(conversions)
+        admitted: Dict[int, Optional[str]] = {}
+        for index, (input_path, output_path) in enumerate(conversions):
+            document_hash, rejection = await self._check(input_path, output_path)
+            if rejection:
+                results[index] = rejection
+            else:
+                admitted[index] = document_hash
+
+        if admitted:
+            converted = await self.converter.convert_batch(
+                [conversions[index] for index in admitted], timeout, [file_timeouts[index] for index in admitted]
+            )
+            for (index, document_hash), result in zip(admitted.items(), converted):
+                await self._record(document_hash, result)
+                results[index] = result
+        return results
+
+    async def _check(self, input_path: str,
+                     output_path: str) -> Tuple[Optional[str], Optional[ConversionResult]]:
+        """The document's hash, and its failure result if it is quarantined"""
+        try:
+            loop = asyncio.get_running_loop()
+            document_hash = await loop.run_in_executor(None, content_hash, input_path)
+            entry = await self.quarantine.get(document_hash)
+        except Exception as e:
+            logger.warning(f"Could not check the quarantine for {input_path}: {str(e)}")
+            return None, None
+
+        if entry and entry.failures > self.max_failures:
+            logger.warning(f"Skipping quarantined document {input_path} ({document_hash})")
+            return document_hash, ConversionResult.failure_result(
+                input_path, output_path,
+                f"Quarantined after {entry.failures} failed conversions: {entry.error_message}"
+            )
+        return document_hash, None
+
+    async def _record(self, document_hash: Optional[str], result: ConversionResult):
+        if not document_hash or not result.poison_suspect:
+            return
+        try:
+            entry = await self.quarantine.record_failure(
+                document_hash, result.input_path.rsplit('/', 1)[-1], result.error_message or "Conversion failed"
+            )
+            if entry.failures > self.max_failures:
+                logger.warning(f"Quarantined {result.input_path} ({document_hash}) after {entry.failures} failures")
+        except Exception as e:
+            logger.warning(f"Could not record the failure of {result.input_path}: {str(e)}")
+
+
+def _key(content_hash: str) -> str:
+    return f"{KEY_PREFIX}{content_hash}"
+
+
+def _entry(content_hash: str, fields: dict, ttl: Optional[int]) -> Optional[QuarantineEntry]:
+    if not fields:
+        return None
+    return QuarantineEntry(
+        content_hash=content_hash,
+        failures=int(fields.get("failures", 0)),
+        error_message=fields.get("error_message", ""),
+        filename=fields.get("filename"),
+        last_failed_at=datetime.fromisoformat(fields["last_failed_at"]) if fields.get("last_failed_at") else None,
+        expires_in_seconds=ttl if ttl is not None and ttl >= 0 else None
+    )
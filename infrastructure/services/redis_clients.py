@@ -0,0 +1,42 @@
+"""
+redis.asyncio clients shared by the Redis-backed services, one per event loop
+"""
+import asyncio
+import weakref
+from typing import Awaitable, Dict, TypeVar
+
+import redis.asyncio as redis
+
+T = TypeVar("T")
+
+# Clients by event loop and URL; a loop's entry goes away with the loop
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, redis.Redis]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def loop_client(redis_url: str) -> redis.Redis:
+    """
+    The running event loop's client for the URL. Worker tasks run each job
+    in a fresh event loop, and asyncio connections can't be shared between
+    loops.
+    """
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(redis_url)
+    if client is None:
+        client = clients[redis_url] = redis.from_url(redis_url, decode_responses=True)
+    return client
+
+
+async def close_loop_clients():
+    """Close the running loop's clients and their connection pools"""
+    for client in _clients.pop(asyncio.get_running_loop(), {}).values():
+        await client.aclose()
+
+
+async def closing_loop_clients(awaitable: Awaitable[T]) -> T:
+    """Await the work of a task running in its own event loop, then close that loop's clients"""
+    try:
+        return await awaitable
+    finally:
+        await close_loop_clients()
@@ -0,0 +1,324 @@
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+import redis.asyncio as redis
+
+from ...domain.entities import JobEntity, FileEntity, JobStatus, FileStatus
+from ...domain.repositories import JobRepository, FileRepository
+from ...domain.services import JobStatusCache
+from ...domain.value_objects import Backlog
+from .redis_clients import loop_client
+
+logger = logging.getLogger(__name__)
+
+JOB_FIELD = "job"
+VERSION_FIELD = "version"
+FILE_FIELD_PREFIX = "file:"
+COUNT_FIELDS = {file_status: f"count:{file_status.value}" for file_status in FileStatus}
+
+# Store fields, move the per-status file counts, bump the version, refresh
+# the TTL and publish the change
+STORE_SCRIPT = """
+for i = 4, #ARGV, 2 do
+    if string.sub(ARGV[i], 1, 5) == 'file:' then
+        local previous = redis.call('HGET', KEYS[1], ARGV[i])
+        if previous then
+            redis.call('HINCRBY', KEYS[1], 'count:' .. cjson.decode(previous).status, -1)
+        end
+        redis.call('HINCRBY', KEYS[1], 'count:' .. cjson.decode(ARGV[i + 1]).status, 1)
+    end
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('PUBLISH', ARGV[2], ARGV[3])
+return version
+"""
+
+# Add missing fields and raise the version to at least the database's, so a
+# rebuilt projection never reuses a version that was already handed out
+BACKFILL_SCRIPT = """
+for i = 3, #ARGV, 2 do
+    if redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 1]) == 1
+            and string.sub(ARGV[i], 1, 5) == 'file:' then
+        redis.call('HINCRBY', KEYS[1], 'count:' .. cjson.decode(ARGV[i + 1]).status, 1)
+    end
+end
+local current = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if tonumber(ARGV[2]) > current then
+    redis.call('HSET', KEYS[1], 'version', ARGV[2])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+"""
+
+# Idle subscribers get a heartbeat event this often
+EVENT_HEARTBEAT_SECONDS = 15.0
+
+
+def status_key(job_id: str) -> str:
+    return f"job_status:{job_id}"
+
+
+def events_channel(job_id: str) -> str:
+    return f"job_events:{job_id}"
+
+
+class RedisJobStatusCache(JobStatusCache):
+    """
+    Job status projection kept in one Redis hash per job.
+
+    The hash holds a `job` field and one `file:<id>` field per file, each a
+    small JSON document, plus a `count:<status>` counter per file status,
+    and expires `ttl_seconds` after the last write.
+    Every write except a backfill bumps the hash's `version` field and is
+    published on the job's `job_events:<id>` channel in the same round trip.
+    """
+
+    def __init__(self, redis_url: str, ttl_seconds: int = 3600):
+        self.redis_url = redis_url
+        self.ttl_seconds = ttl_seconds
+        self._client: Optional[redis.Redis] = None
+
+    def _redis(self) -> redis.Redis:
+        client = loop_client(self.redis_url)
+        if client is not self._client:
+            self._client = client
+            self._store_script = client.register_script(STORE_SCRIPT)
+            self._backfill_script = client.register_script(BACKFILL_SCRIPT)
+        return client
+
+    async def get_job(self, job_id: str) -> Optional[JobEntity]:
+        fields = await self._redis().hgetall(status_key(job_id))
+        if JOB_FIELD not in fields:
+            return None
+
+        job = _job_from_json(fields[JOB_FIELD])
+        job.version = int(fields.get(VERSION_FIELD, 0))
+        job.files = sorted(
+            (_file_from_json(job_id, value) for name, value in fields.items()
+             if name.startswith(FILE_FIELD_PREFIX)),
+            key=lambda f: f.id
+        )
+        # A hash rebuilt from partial writes is not a valid answer
+        if len(job.files) < job.file_count:
+            return None
+        return job
+
+    async def get_summary(self, job_id: str) -> Optional[JobEntity]:
+        job_json, version, *counts = await self._redis().hmget(
+            status_key(job_id), JOB_FIELD, VERSION_FIELD, *COUNT_FIELDS.values()
+        )
+        if job_json is None or version is None:
+            return None
+        job = _job_from_json(job_json)
+        job.version = int(version)
+        job.file_counts = {
+            file_status: int(count or 0) for file_status, count in zip(COUNT_FIELDS, counts)
+        }
+        # Same completeness rule as get_job: the counters cover every file
+        if sum(job.file_counts.values()) < job.file_count:
+            return None
+        return job
+
+    async def get_version(self, job_id: str) -> Optional[int]:
+        job = await self.get_summary(job_id)
+        return job.version if job else None
+
+    async def store_job(self, job: JobEntity, only_missing: bool = False):
+        job_json = _job_to_json(job)
+        event = f'{{"type": "job", "job": {job_json}}}'
+        await self._store(job.id, {JOB_FIELD: job_json}, only_missing, event, job.version)
+
+    async def store_files(self, job_id: str, files: List[FileEntity], only_missing: bool = False):
+        if files:
+            fields = {f"{FILE_FIELD_PREFIX}{f.id}": _file_to_json(f) for f in files}
+            # One message per batch; subscribers split it into per-file events
+            event = f'{{"type": "files", "files": [{", ".join(fields.values())}]}}'
+            await self._store(job_id, fields, only_missing, event)
+
+    async def delete_job(self, job_id: str):
+        await self._redis().delete(status_key(job_id))
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[dict]:
+        pubsub = self._redis().pubsub()
+        try:
+            await pubsub.subscribe(events_channel(job_id))
+            while True:
+                message = await pubsub.get_message(timeout=EVENT_HEARTBEAT_SECONDS)
+                if message is None:
+                    yield {"type": "heartbeat"}
+                elif message["type"] == "subscribe":
+                    yield {"type": "subscribed"}
+                elif message["type"] == "message":
+                    yield json.loads(message["data"])
+        finally:
+            await pubsub.aclose()
+
+    async def _store(self, job_id: str, fields: Dict[str, str], only_missing: bool,
+                     event: str, version: int = 0):
+        self._redis()  # registers the scripts on this loop's client
+        pairs = [item for field in fields.items() for item in field]
+        if only_missing:
+            # Backfills from the database never overwrite fresher worker writes
+            await self._backfill_script(
+                keys=[status_key(job_id)], args=[self.ttl_seconds, version, *pairs]
+            )
+        else:
+            await self._store_script(
+                keys=[status_key(job_id)],
+                args=[self.ttl_seconds, events_channel(job_id), event, *pairs]
+            )
+
+
+class StatusCachingJobRepository(JobRepository):
+    """JobRepository that writes job changes through to the status cache"""
+
+    def __init__(self, repository: JobRepository, status_cache: JobStatusCache):
+        self.repository = repository
+        self.status_cache = status_cache
+
+    async def create(self, job: JobEntity) -> JobEntity:
+        created_job = await self.repository.create(job)
+        await _write_through(self.status_cache.store_job(created_job), job.id)
+        return created_job
+
+    async def get_by_id(self, job_id: str) -> Optional[JobEntity]:
+        return await self.repository.get_by_id(job_id)
+
+    async def get_version(self, job_id: str) -> Optional[int]:
+        return await self.repository.get_version(job_id)
+
+    async def update(self, job: JobEntity) -> JobEntity:
+        updated_job = await self.repository.update(job)
+        await _write_through(self.status_cache.store_job(updated_job), job.id)
+        return updated_job
+
+    async def update_if_unfinished(self, job: JobEntity) -> Optional[JobEntity]:
+        updated_job = await self.repository.update_if_unfinished(job)
+        if updated_job:
+            await _write_through(self.status_cache.store_job(updated_job), job.id)
+        return updated_job
+
+    async def delete(self, job_id: str) -> bool:
+        deleted = await self.repository.delete(job_id)
+        await _write_through(self.status_cache.delete_job(job_id), job_id)
+        return deleted
+
+    async def get_backlog(self, tenant_id: Optional[str] = None) -> Backlog:
+        return await self.repository.get_backlog(tenant_id)
+
+    async def get_finished_since(self, since: datetime, tenant_id: Optional[str] = None) -> Backlog:
+        return await self.repository.get_finished_since(since, tenant_id)
+
+    async def acquire_lease(self, job_id: str, owner: str, lease_seconds: int) -> bool:
+        return await self.repository.acquire_lease(job_id, owner, lease_seconds)
+
+    async def renew_lease(self, job_id: str, owner: str, lease_seconds: int) -> bool:
+        return await self.repository.renew_lease(job_id, owner, lease_seconds)
+
+    async def release_lease(self, job_id: str, owner: str):
+        await self.repository.release_lease(job_id, owner)
+
+    async def claim_stale_jobs(self, limit: int = 100) -> List[JobEntity]:
+        return await self.repository.claim_stale_jobs(limit)
+
+
+class StatusCachingFileRepository(FileRepository):
+    """FileRepository that writes file status changes through to the status cache"""
+
+    def __init__(self, repository: FileRepository, status_cache: JobStatusCache):
+        self.repository = repository
+        self.status_cache = status_cache
+
+    async def create(self, file: FileEntity) -> FileEntity:
+        created_file = await self.repository.create(file)
+        await self._store_files([created_file])
+        return created_file
+
+    async def create_many(self, files: List[FileEntity]) -> List[FileEntity]:
+        created_files = await self.repository.create_many(files)
+        await self._store_files(created_files)
+        return created_files
+
+    async def get_by_job_id(self, job_id: str) -> List[FileEntity]:
+        return await self.repository.get_by_job_id(job_id)
+
+    async def get_by_ids(self, file_ids: List[int]) -> List[FileEntity]:
+        return await self.repository.get_by_ids(file_ids)
+
+    async def get_page(self, job_id: str, status: Optional[FileStatus] = None,
+                       after_id: Optional[int] = None, limit: int = 100) -> List[FileEntity]:
+        return await self.repository.get_page(job_id, status, after_id, limit)
+
+    async def update(self, file: FileEntity) -> FileEntity:
+        updated_file = await self.repository.update(file)
+        await self._store_files([updated_file])
+        return updated_file
+
+    async def update_batch(self, files: List[FileEntity]) -> List[FileEntity]:
+        updated_files = await self.repository.update_batch(files)
+        await self._store_files(updated_files)
+        return updated_files
+
+    async def _store_files(self, files: List[FileEntity]):
+        by_job: Dict[str, List[FileEntity]] = defaultdict(list)
+        for file in files:
+            by_job[file.job_id].append(file)
+        for job_id, job_files in by_job.items():
+            await _write_through(self.status_cache.store_files(job_id, job_files), job_id)
+
+
+async def _write_through(cache_write, job_id: str):
+    """The database is the source of truth, so a failed cache write only logs"""
+    try:
+        await cache_write
+    except Exception as e:
+        logger.warning(f"Could not update cached status of job {job_id}: {str(e)}")
+
+
+def _job_to_json(job: JobEntity) -> str:
+    return json.dumps({
+        "id": job.id,
+        "status": job.status.value,
+        "file_count": job.file_count,
+        "download_url": job.download_url,
+        "error_message": job.error_message,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None
+    })
+
+
+def _job_from_json(value: str) -> JobEntity:
+    data = json.loads(value)
+    return JobEntity(
+        id=data["id"],
+        status=JobStatus(data["status"]),
+        file_count=data["file_count"],
+        download_url=data["download_url"],
+        error_message=data["error_message"],
+        created_at=datetime.fromisoformat(data["created_at"]) if data["created_at"] else None,
+        updated_at=datetime.fromisoformat(data["updated_at"]) if data["updated_at"] else None
+    )
+
+
+def _file_to_json(file: FileEntity) -> str:
+    return json.dumps({
+        "id": file.id,
+        "filename": file.filename,
+        "status": file.status.value,
+        "error_message": file.error_message
+    })
+
+
+def _file_from_json(job_id: str, value: str) -> FileEntity:
+    data = json.loads(value)
+    return FileEntity(
+        id=data["id"],
+        job_id=job_id,
+        filename=data["filename"],
+        status=FileStatus(data["status"]),
+        error_message=data["error_message"]
+    )
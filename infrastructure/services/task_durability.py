@@ -0,0 +1,49 @@
+"""
+Crash-safe task delivery and graceful shutdown of workers
+"""
+import os
+import signal
+import threading
+
+from billiard.process import active_children
+from celery.signals import worker_process_init, worker_shutting_down
+
+# Set when the worker is asked to stop: running jobs finish the files in
+# flight and hand the rest back to the queue
+shutdown_requested = threading.Event()
+
+
+def configure_durable_tasks(celery_app, visibility_timeout_seconds: int):
+    """
+    Acknowledge tasks only once they finish, so the task of a worker that
+    dies is delivered again, and reserve one task per worker process so a
+    dying worker holds back no others
+    """
+    celery_app.conf.task_acks_late = True
+    celery_app.conf.task_reject_on_worker_lost = True
+    celery_app.conf.worker_prefetch_multiplier = 1
+    celery_app.conf.broker_transport_options = {
+        **celery_app.conf.broker_transport_options,
+        "visibility_timeout": visibility_timeout_seconds
+    }
+
+
+def _request_shutdown(signum, frame):
+    shutdown_requested.set()
+    # A second SIGTERM terminates as usual
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+@worker_process_init.connect
+def _install_sigterm_handler(**kwargs):
+    signal.signal(signal.SIGTERM, _request_shutdown)
+
+
+@worker_shutting_down.connect
+def _forward_shutdown(how=None, **kwargs):
+    # Tasks of the solo and thread pools run in this process
+    shutdown_requested.set()
+    if how == "Warm":
+        # Prefork pool processes don't get the worker's SIGTERM themselves
+        for child in active_children():
+            os.kill(child.pid, signal.SIGTERM)
@@ -0,0 +1,207 @@
+"""
+Per-tenant fair scheduling of queued jobs with deficit round-robin
+"""
+import hashlib
+import re
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import redis
+
+# Every key shares the {tenant_sched} hash tag, so Redis Cluster keeps them
+# in one slot: NEXT_SCRIPT builds tenant queue and running-set keys from the
+# prefixes it is given, because the tenants it visits are only known inside it
+KEY_PREFIX = "{tenant_sched}:"
+DEFAULT_TENANT = "default"
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Append a job to its tenant's queue; a tenant joins the lane's round-robin
+# ring when its queue goes from empty to non-empty. A requeued job gives up
+# the running slot it may still hold from a worker that died.
+PUSH_SCRIPT = """
+redis.call('ZREM', KEYS[3], ARGV[3])
+if redis.call('RPUSH', KEYS[1], ARGV[1]) == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[2])
+end
+"""
+
+# Deficit round-robin over the lane's ring of tenants. The tenant at the
+# head of the ring is served while its deficit covers the cost (file count)
+# of its next job; otherwise it earns a quantum scaled by its weight and
+# goes to the back. Tenants at their running-jobs cap are skipped without
+# earning; the default tenant, shared by every client without a tenant of
+# its own, has no cap. Returns {'job', job_id, tenant}, {'wait'} or {'empty'}. Queue
+# and running-set keys come from the lane and running prefixes in ARGV, all
+# under the KEY_PREFIX hash tag of the ring and deficit keys.
+NEXT_SCRIPT = """
+local lane_prefix, running_prefix = ARGV[1], ARGV[2]
+local quantum, max_running = tonumber(ARGV[3]), tonumber(ARGV[4])
+local now, slot_timeout = tonumber(ARGV[6]), tonumber(ARGV[7])
+local uncapped = ARGV[8]
+local weights = {}
+for i = 9, #ARGV, 2 do
+    weights[ARGV[i]] = tonumber(ARGV[i + 1])
+end
+local capped = 0
+for _ = 1, tonumber(ARGV[5]) do
+    local tenant = redis.call('LINDEX', KEYS[1], 0)
+    if not tenant then
+        return {'empty'}
+    end
+    local queue = lane_prefix .. 'queue:' .. tenant
+    local running = running_prefix .. tenant
+    -- Slots of jobs that never reported back (e.g. a killed worker) expire
+    redis.call('ZREMRANGEBYSCORE', running, '-inf', now - slot_timeout)
+    local head = redis.call('LINDEX', queue, 0)
+    if not head then
+        redis.call('LPOP', KEYS[1])
+        redis.call('HDEL', KEYS[2], tenant)
+    elseif max_running > 0 and tenant ~= uncapped and redis.call('ZCARD', running) >= max_running then
+        capped = capped + 1
+        if capped >= redis.call('LLEN', KEYS[1]) then
+            return {'wait'}
+        end
+        redis.call('LMOVE', KEYS[1], KEYS[1], 'LEFT', 'RIGHT')
+    else
+        capped = 0
+        local separator = string.find(head, ' ', 1, true)
+        local cost = tonumber(string.sub(head, 1, separator - 1))
+        local deficit = tonumber(redis.call('HGET', KEYS[2], tenant) or '0')
+        if deficit >= cost then
+            local job_id = string.sub(head, separator + 1)
+            redis.call('LPOP', queue)
+            redis.call('ZADD', running, now, job_id)
+            if redis.call('LLEN', queue) == 0 then
+                -- An idle tenant leaves the ring and keeps no credit
+                redis.call('LPOP', KEYS[1])
+                redis.call('HDEL', KEYS[2], tenant)
+            else
+                redis.call('HSET', KEYS[2], tenant, deficit - cost)
+            end
+            return {'job', job_id, tenant}
+        end
+        redis.call('HSET', KEYS[2], tenant, deficit + quantum * (weights[tenant] or 1))
+        redis.call('LMOVE', KEYS[1], KEYS[1], 'LEFT', 'RIGHT')
+    end
+end
+return {'wait'}
+"""
+
+# Drop a job from its tenant's queue on each of the given lanes; a tenant
+# whose queue empties leaves the ring on the next scheduling call
+REMOVE_SCRIPT = """
+local suffix = ' ' .. ARGV[1]
+local removed = 0
+for _, queue in ipairs(KEYS) do
+    for _, entry in ipairs(redis.call('LRANGE', queue, 0, -1)) do
+        if string.sub(entry, -#suffix) == suffix then
+            removed = removed + redis.call('LREM', queue, 0, entry)
+        end
+    end
+end
+return removed
+"""
+
+# Ring rotations one scheduling call may take before it gives up for now
+MAX_ROUNDS = 1000
+
+
+def resolve_tenant_id(tenant_header: Optional[str], api_key: Optional[str]) -> str:
+    """
+    Tenant of a request: the X-Tenant-ID header, else an identity derived
+    from the API key (never the key itself), else the default tenant
+    """
+    if tenant_header:
+        if not TENANT_ID_PATTERN.match(tenant_header):
+            raise ValueError("X-Tenant-ID must be 1-64 letters, digits, '.', '_' or '-'")
+        return tenant_header
+    if api_key:
+        return f"key-{hashlib.sha256(api_key.encode()).hexdigest()[:16]}"
+    return DEFAULT_TENANT
+
+
+def parse_tenant_weights(spec: str) -> Dict[str, int]:
+    """Parse "acme:3,globex:2" into tenant weights; unlisted tenants weigh 1"""
+    weights = {}
+    for entry in spec.split(","):
+        tenant_id, _, weight = entry.strip().partition(":")
+        if tenant_id:
+            weights[tenant_id] = max(1, int(weight or 1))
+    return weights
+
+
+class RedisTenantScheduler:
+    """
+    Holds queued jobs per tenant and lane in Redis and hands them out with
+    deficit round-robin, so one tenant's backlog can't starve the others.
+
+    A job's cost is its file count. Each tenant earns `quantum_files` times
+    its weight per round and may have at most `max_running_jobs` jobs
+    running at once (0 for no cap); the default tenant has no cap. Running slots are released by the
+    worker when the job ends, or expire after `slot_timeout_seconds`.
+    """
+
+    def __init__(self, redis_url: str, quantum_files: int = 100, max_running_jobs: int = 2,
+                 weights: Optional[Dict[str, int]] = None, slot_timeout_seconds: int = 6 * 3600):
+        self.client = redis.from_url(redis_url, decode_responses=True)
+        self.quantum_files = max(1, quantum_files)
+        self.max_running_jobs = max_running_jobs
+        self.weights = weights or {}
+        self.slot_timeout_seconds = slot_timeout_seconds
+        self._push_script = self.client.register_script(PUSH_SCRIPT)
+        self._next_script = self.client.register_script(NEXT_SCRIPT)
+        self._remove_script = self.client.register_script(REMOVE_SCRIPT)
+
+    def push(self, lane: str, tenant_id: str, job_id: str, cost: int):
+        """Queue a job behind the tenant's earlier jobs on the lane"""
+        self._push_script(
+            keys=[self._queue_key(lane, tenant_id), self._ring_key(lane), self._running_key(tenant_id)],
+            args=[f"{max(1, cost)} {job_id}", tenant_id, job_id]
+        )
+
+    def next_job(self, lane: str) -> Optional[Tuple[str, str]]:
+        """
+        Take the next job of the lane as (job_id, tenant_id), holding a
+        running slot of its tenant, or None when no tenant may run one now
+        """
+        weight_args = [item for weight in self.weights.items() for item in weight]
+        result = self._next_script(
+            keys=[self._ring_key(lane), self._deficit_key(lane)],
+            args=[
+                self._lane_prefix(lane), f"{KEY_PREFIX}running:", self.quantum_files,
+                self.max_running_jobs, MAX_ROUNDS, time.time(), self.slot_timeout_seconds,
+                DEFAULT_TENANT, *weight_args
+            ]
+        )
+        if result[0] == "job":
+            return result[1], result[2]
+        return None
+
+    def has_pending(self, lane: str) -> bool:
+        """Whether any tenant still has jobs queued on the lane"""
+        return self.client.llen(self._ring_key(lane)) > 0
+
+    def release(self, tenant_id: str, job_id: str):
+        """Give back the running slot the job held"""
+        self.client.zrem(self._running_key(tenant_id), job_id)
+
+    def remove(self, tenant_id: str, job_id: str, lanes: Iterable[str]) -> bool:
+        """Take a job that has not started yet out of the tenant's queues; False if none held it"""
+        return self._remove_script(
+            keys=[self._queue_key(lane, tenant_id) for lane in lanes], args=[job_id]
+        ) > 0
+
+    def _lane_prefix(self, lane: str) -> str:
+        return f"{KEY_PREFIX}{lane}:"
+
+    def _ring_key(self, lane: str) -> str:
+        return f"{self._lane_prefix(lane)}ring"
+
+    def _deficit_key(self, lane: str) -> str:
+        return f"{self._lane_prefix(lane)}deficit"
+
+    def _queue_key(self, lane: str, tenant_id: str) -> str:
+        return f"{self._lane_prefix(lane)}queue:{tenant_id}"
+
+    def _running_key(self, tenant_id: str) -> str:
+        return f"{KEY_PREFIX}running:{tenant_id}"
@@ -0,0 +1,100 @@
+"""
+Minimal UNO client used by the LibreOffice process pool.
+
+This script runs under the interpreter that ships the ``uno`` module
+(usually the system ``python3``), not the application's interpreter, so it
+must not import anything from this package.
+
+Usage:
+    uno_client.py ping <pipe_name> [connect_timeout]
+    uno_client.py convert <pipe_name> <input_path> <output_path>
+"""
+import sys
+import time
+
+EXIT_OK = 0
+EXIT_CONVERSION_ERROR = 1
+EXIT_NO_CONNECTION = 2
+
+
+def _property(name, value):
+    from com.sun.star.beans import PropertyValue
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def _connect(pipe_name, timeout):
+    import uno
+    from com.sun.star.connection import NoConnectException
+
+    local_context = uno.getComponentContext()
+    resolver = local_context.ServiceManager.createInstanceWithContext(
+        "com.sun.star.bridge.UnoUrlResolver", local_context
+    )
+    url = f"uno:pipe,name={pipe_name};urp;StarOffice.ComponentContext"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            context = resolver.resolve(url)
+            return context.ServiceManager.createInstanceWithContext(
+                "com.sun.star.frame.Desktop", context
+            )
+        except NoConnectException:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.25)
+
+
+def _convert(desktop, input_path, output_path):
+    import uno
+
+    document = desktop.loadComponentFromURL(
+        uno.systemPathToFileUrl(input_path),
+        "_blank",
+        0,
+        (_property("Hidden", True), _property("ReadOnly", True)),
+    )
+    if document is None:
+        raise RuntimeError("LibreOffice could not load the document")
+    try:
+        document.storeToURL(
+            uno.systemPathToFileUrl(output_path),
+            (_property("FilterName", "writer_pdf_Export"),),
+        )
+    finally:
+        document.close(True)
+
+
+def main(argv):
+    if len(argv) < 3:
+        print(__doc__, file=sys.stderr)
+        return EXIT_CONVERSION_ERROR
+
+    command, pipe_name = argv[1], argv[2]
+    connect_timeout = float(argv[3]) if command == "ping" and len(argv) > 3 else 5.0
+
+    try:
+        desktop = _connect(pipe_name, connect_timeout)
+    except Exception as e:
+        print(f"Could not connect to soffice on pipe {pipe_name}: {e}", file=sys.stderr)
+        return EXIT_NO_CONNECTION
+
+    if command == "ping":
+        return EXIT_OK
+
+    if command == "convert" and len(argv) == 5:
+        try:
+            _convert(desktop, argv[3], argv[4])
+            return EXIT_OK
+        except Exception as e:
+            print(f"Conversion failed: {e}", file=sys.stderr)
+            return EXIT_CONVERSION_ERROR
+
+    print(__doc__, file=sys.stderr)
+    return EXIT_CONVERSION_ERROR
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
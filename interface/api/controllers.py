@@ -1,12 +1,26 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, AsyncIterator, List, Optional, Tuple
+import hmac
+import json
 import logging
 
-from ...application.use_cases import CreateJobUseCase, GetJobStatusUseCase
-from ...application.dto import JobResponseDto, JobCreateResponseDto, ErrorResponseDto, FileInfoDto
-from ...application.container import container
-from ...infrastructure.database.models import get_db, create_tables
+from ...application.use_cases import (
+    CreateJobUseCase, GetJobStatusUseCase, DownloadJobResultsUseCase, ListJobFilesUseCase,
+    InspectQuarantineUseCase, ClearQuarantineUseCase, CancelJobUseCase
+)
+from ...application.dto import (
+    JobResponseDto, JobCreateResponseDto, ErrorResponseDto, FileInfoDto,
+    FileListItemDto, FilePageDto, QuarantineEntryDto
+)
+from ...application.container import container, ADMIN_TOKEN, QUARANTINE_MAX_FAILURES
+from ...domain.exceptions import UploadTooLargeError, AdmissionRejectedError
+from ...domain.entities import JobEntity, FileStatus
+from ...domain.value_objects import JobPriority, QuarantineEntry
+from ...infrastructure.database.models import create_tables
+from ...infrastructure.services.tenant_scheduler import resolve_tenant_id
+from ...infrastructure.services.redis_clients import close_loop_clients
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,14 +43,83 @@ async def startup_event():
     os.makedirs("/app/temp", exist_ok=True)
 
 
-def get_create_job_use_case(db: Session = Depends(get_db)) -> CreateJobUseCase:
+@app.on_event("shutdown")
+async def shutdown_event():
+    await container.dispose_async_engine()
+    await close_loop_clients()
+
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def iter_upload_chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    """Yield the uploaded file in fixed-size chunks"""
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Async session per request, from the container's pooled engine"""
+    async with container.create_async_session_factory()() as db:
+        yield db
+
+
+def get_tenant_id(
+    x_tenant_id: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None)
+) -> str:
+    """Tenant the job is scheduled for, from the request headers"""
+    try:
+        return resolve_tenant_id(x_tenant_id, x_api_key)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admit requests carrying the configured admin token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin API is disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+
+def get_create_job_use_case(db: AsyncSession = Depends(get_db)) -> CreateJobUseCase:
     return container.create_create_job_use_case(db)
 
 
-def get_get_job_status_use_case(db: Session = Depends(get_db)) -> GetJobStatusUseCase:
+def get_get_job_status_use_case(db: AsyncSession = Depends(get_db)) -> GetJobStatusUseCase:
     return container.create_get_job_status_use_case(db)
 
 
+def get_list_job_files_use_case(db: AsyncSession = Depends(get_db)) -> ListJobFilesUseCase:
+    return container.create_list_job_files_use_case(db)
+
+
+def get_download_job_results_use_case(db: AsyncSession = Depends(get_db)) -> DownloadJobResultsUseCase:
+    return container.create_download_job_results_use_case(db)
+
+
+def get_cancel_job_use_case(db: AsyncSession = Depends(get_db)) -> CancelJobUseCase:
+    return container.create_cancel_job_use_case(db)
+
+
+def get_inspect_quarantine_use_case() -> InspectQuarantineUseCase:
+    use_case = container.create_inspect_quarantine_use_case()
+    if use_case is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Quarantine is disabled")
+    return use_case
+
+
+def get_clear_quarantine_use_case() -> ClearQuarantineUseCase:
+    use_case = container.create_clear_quarantine_use_case()
+    if use_case is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Quarantine is disabled")
+    return use_case
+
+
 @app.post(
     "/api/v1/jobs", 
     response_model=JobCreateResponseDto, 
@@ -44,6 +127,10 @@ def get_get_job_status_use_case(db: Session = Depends(get_db)) -> GetJobStatusUs
 )
 async def create_job(
     file: UploadFile = File(...),
+    priority: Optional[JobPriority] = Query(
+        None, description="Queue lane: high (fast) or low (bulk); by default the job's size decides"
+    ),
+    tenant_id: str = Depends(get_tenant_id),
     create_job_use_case: CreateJobUseCase = Depends(get_create_job_use_case)
 ):
     """
@@ -57,17 +144,31 @@ async def create_job(
                 detail="Only ZIP files are allowed"
             )
         
-        # Read file content
-        file_content = await file.read()
-        
-        # Execute use case
-        job = await create_job_use_case.execute(file_content, file.filename)
+        # Execute use case, streaming the upload instead of reading it whole
+        job = await create_job_use_case.execute(iter_upload_chunks(file), file.filename, priority, tenant_id)
         
         return JobCreateResponseDto(
             job_id=job.id,
             file_count=job.file_count
         )
         
+    except HTTPException:
+        raise
+    except AdmissionRejectedError as e:
+        # 429 when the tenant is over its own limits, 503 when the service is
+        raise HTTPException(
+            status_code=(
+                status.HTTP_429_TOO_MANY_REQUESTS if e.tenant_limited
+                else status.HTTP_503_SERVICE_UNAVAILABLE
+            ),
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after_seconds)}
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -84,13 +185,27 @@ async def create_job(
 @app.get("/api/v1/jobs/{job_id}", response_model=JobResponseDto)
 async def get_job_status(
     job_id: str,
+    response: Response,
+    include_files: bool = Query(True, description="Set to false for a summary with per-status counts only"),
+    if_none_match: Optional[str] = Header(None),
     get_job_use_case: GetJobStatusUseCase = Depends(get_get_job_status_use_case)
 ):
     """
     Get the status of a conversion job
+    
+    Answers If-None-Match with 304 while the job's status version is unchanged,
+    without loading its files. Use /files to page through large jobs.
     """
+    if if_none_match:
+        version = await get_job_use_case.get_version(job_id)
+        if version is not None and etag_matches(if_none_match, job_etag(version)):
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers={"ETag": job_etag(version), "Cache-Control": "no-cache"}
+            )
+    
     # Execute use case
-    job = await get_job_use_case.execute(job_id)
+    job = await get_job_use_case.execute(job_id, include_files=include_files)
     
     if not job:
         raise HTTPException(
@@ -98,6 +213,59 @@ async def get_job_status(
             detail="Job not found"
         )
     
+    response.headers["ETag"] = job_etag(job.version)
+    response.headers["Cache-Control"] = "no-cache"
+    return to_job_response_dto(job, include_files=include_files)
+
+
+@app.delete(
+    "/api/v1/jobs/{job_id}",
+    response_model=JobResponseDto,
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def cancel_job(
+    job_id: str,
+    cancel_job_use_case: CancelJobUseCase = Depends(get_cancel_job_use_case)
+):
+    """
+    Cancel a pending or running job and delete its files
+    
+    Queued tasks of the job are dropped and workers running it stop within
+    JOB_CANCEL_POLL_SECONDS, killing the conversions in flight.
+    """
+    try:
+        job = await cancel_job_use_case.execute(job_id)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    return to_job_response_dto(job, include_files=False)
+
+
+def job_etag(version: int) -> str:
+    return f'W/"{version}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque_tag
+        for candidate in if_none_match.split(",")
+    )
+
+
+def to_job_response_dto(job: JobEntity, include_files: bool = True) -> JobResponseDto:
     # Convert files to DTOs
     file_infos = [
         FileInfoDto(
@@ -106,7 +274,7 @@ async def get_job_status(
             error_message=file.error_message
         )
         for file in job.files
-    ]
+    ] if include_files else None
     
     return JobResponseDto(
         job_id=job.id,
@@ -114,44 +282,188 @@ async def get_job_status(
         created_at=job.created_at,
         download_url=job.download_url,
         files=file_infos,
-        file_count=job.file_count
+        file_count=job.file_count,
+        file_counts=job.file_counts
+    )
+
+
+@app.get("/api/v1/jobs/{job_id}/files", response_model=FilePageDto)
+async def list_job_files(
+    job_id: str,
+    file_status: Optional[FileStatus] = Query(None, alias="status"),
+    after_id: Optional[int] = Query(None, description="next_after_id of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    list_files_use_case: ListJobFilesUseCase = Depends(get_list_job_files_use_case)
+):
+    """
+    Page through the files of a job in id order, optionally only those in one status
+    """
+    page = await list_files_use_case.execute(job_id, file_status, after_id, limit)
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    files, next_after_id = page
+    return FilePageDto(
+        job_id=job_id,
+        files=[
+            FileListItemDto(
+                id=file.id,
+                filename=file.filename,
+                status=file.status,
+                error_message=file.error_message
+            )
+            for file in files
+        ],
+        next_after_id=next_after_id
     )
 
 
 @app.get("/api/v1/jobs/{job_id}/download")
 async def download_job_results(
     job_id: str,
-    db: Session = Depends(get_db)
+    download_use_case: DownloadJobResultsUseCase = Depends(get_download_job_results_use_case)
 ):
     """
-    Download the zip archive of converted PDF files
+    Download the zip archive of converted PDF files, built on the fly
     """
-    job_repo = container.create_job_repository(db)
-    job = await job_repo.get_by_id(job_id)
-    if not job:
+    try:
+        archive = await download_use_case.execute(job_id)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    
+    if archive is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Job not found"
         )
     
-    if job.status != "COMPLETED":
+    # A sync iterator, so Starlette pulls it from its threadpool
+    return StreamingResponse(
+        archive,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="converted_files_{job_id}.zip"'}
+    )
+
+
+@app.get("/api/v1/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Stream the job's status as Server-Sent Events: a snapshot, then file and
+    job transitions, ending with a complete event
+    """
+    # The stream outlives the request, so don't hold a pooled connection for it
+    try:
+        async with container.create_async_session_factory()() as db:
+            stream_use_case = container.create_stream_job_events_use_case(db)
+            if stream_use_case is None:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Job events are not available"
+                )
+            events = await stream_use_case.execute(job_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error subscribing to events of job {job_id}: {str(e)}")
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Job is not completed yet"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Job events are not available"
         )
     
-    zip_path = f"/app/outputs/{job_id}/converted_files.zip"
-    import os
-    if not os.path.exists(zip_path):
+    if events is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Download file not found"
+            detail="Job not found"
         )
     
-    return FileResponse(
-        path=zip_path,
-        filename=f"converted_files_{job_id}.zip",
-        media_type="application/zip"
+    return StreamingResponse(
+        format_sse(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def format_sse(events: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[str]:
+    try:
+        async for event, payload in events:
+            if event == "heartbeat":
+                yield ": keep-alive\n\n"
+                continue
+            if event == "snapshot":
+                payload = to_job_response_dto(payload).model_dump(mode="json")
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    finally:
+        # Runs on client disconnect too, releasing the Redis subscription
+        await events.aclose()
+
+
+@app.get(
+    "/api/v1/admin/quarantine",
+    response_model=List[QuarantineEntryDto],
+    dependencies=[Depends(require_admin)]
+)
+async def list_quarantine(
+    limit: int = Query(100, ge=1, le=1000),
+    inspect_use_case: InspectQuarantineUseCase = Depends(get_inspect_quarantine_use_case)
+):
+    """
+    List documents that timed out or crashed the converter, keyed by the
+    SHA-256 of their content
+    """
+    entries = await inspect_use_case.execute(limit)
+    return [to_quarantine_entry_dto(entry) for entry in entries]
+
+
+@app.get(
+    "/api/v1/admin/quarantine/{content_hash}",
+    response_model=QuarantineEntryDto,
+    dependencies=[Depends(require_admin)]
+)
+async def get_quarantine_entry(
+    content_hash: str,
+    inspect_use_case: InspectQuarantineUseCase = Depends(get_inspect_quarantine_use_case)
+):
+    entry = await inspect_use_case.get(content_hash)
+    if not entry:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document is not quarantined")
+    return to_quarantine_entry_dto(entry)
+
+
+@app.delete(
+    "/api/v1/admin/quarantine/{content_hash}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(require_admin)]
+)
+async def clear_quarantine_entry(
+    content_hash: str,
+    clear_use_case: ClearQuarantineUseCase = Depends(get_clear_quarantine_use_case)
+):
+    """Release a document from quarantine, so it is converted again"""
+    if not await clear_use_case.execute(content_hash):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document is not quarantined")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+def to_quarantine_entry_dto(entry: QuarantineEntry) -> QuarantineEntryDto:
+    return QuarantineEntryDto(
+        content_hash=entry.content_hash,
+        failures=entry.failures,
+        quarantined=entry.failures > QUARANTINE_MAX_FAILURES,
+        error_message=entry.error_message,
+        filename=entry.filename,
+        last_failed_at=entry.last_failed_at,
+        expires_in_seconds=entry.expires_in_seconds
     )
 
 
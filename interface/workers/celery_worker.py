@@ -1,10 +1,19 @@
 from celery import Celery
+from dataclasses import asdict
+from typing import List, Optional
 import os
 import logging
 
 from ...application.use_cases import ProcessJobUseCase
-from ...application.container import container
+from ...domain.entities import longest_first
+from ...application.container import (
+    container, WORKER_LANES, JOB_FANOUT_CHUNK_SIZE, TENANT_RETRY_SECONDS,
+    LEASE_REAPER_INTERVAL_SECONDS, TASK_VISIBILITY_TIMEOUT_SECONDS
+)
 from ...infrastructure.database.models import SessionLocal
+from ...infrastructure.services.redis_clients import closing_loop_clients
+from ...infrastructure.services.job_lanes import FAST_LANE, configure_lanes, parse_lane_weights
+from ...infrastructure.services.task_durability import configure_durable_tasks, shutdown_requested
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,29 +22,137 @@ logger = logging.getLogger(__name__)
 # Celery configuration
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 celery = Celery("worker", broker=REDIS_URL, backend=REDIS_URL)
+configure_lanes(celery, parse_lane_weights(WORKER_LANES))
+configure_durable_tasks(celery, TASK_VISIBILITY_TIMEOUT_SECONDS)
+
+
+@celery.task(bind=True, max_retries=None)
+def dispatch_next_job_task(self, lane: str):
+    """Run the job the tenant scheduler picks next on this lane"""
+    import asyncio
+    tenant_scheduler = container.create_tenant_scheduler()
+    picked = tenant_scheduler.next_job(lane)
+    if picked is None:
+        if tenant_scheduler.has_pending(lane):
+            # Every tenant with queued jobs is at its cap
+            raise self.retry(countdown=TENANT_RETRY_SECONDS)
+        return None
+    
+    job_id, tenant_id = picked
+    if JOB_FANOUT_CHUNK_SIZE <= 0:
+        # Run it here, so the pick happens when a worker is actually free
+        return process_job_task(job_id, tenant_id)
+    
+    db = SessionLocal()
+    try:
+        files = asyncio.run(closing_loop_clients(container.create_file_repository(db).get_by_job_id(job_id)))
+        container.create_job_queue().dispatch(job_id, [f.id for f in longest_first(files)], lane, tenant_id)
+    except Exception as e:
+        logger.error(f"Error dispatching job {job_id}: {str(e)}")
+        tenant_scheduler.release(tenant_id, job_id)
+        raise
+    finally:
+        db.close()
 
 
 @celery.task
-def process_job_task(job_id: str):
+def process_job_task(job_id: str, tenant_id: Optional[str] = None):
     """Process a conversion job"""
     import asyncio
     db = SessionLocal()
     try:
         # Create use case with all dependencies
-        process_job_use_case = container.create_process_job_use_case(db)
+        process_job_use_case: ProcessJobUseCase = container.create_process_job_use_case(db)
         
-        # Execute use case (run async function in sync context)
-        result = asyncio.run(process_job_use_case.execute(job_id))
+        # Execute use case (run async function in sync context); on shutdown
+        # it stops after the files in flight and hands the rest back
+        result = asyncio.run(closing_loop_clients(process_job_use_case.execute(job_id, shutdown_requested.is_set)))
         
-        if result.success:
+        if result.interrupted:
+            logger.info(f"Job {job_id} handed back. Completed: {result.completed_files}, Failed: {result.failed_files}")
+        elif result.cancelled:
+            logger.info(f"Job {job_id} cancelled. Completed: {result.completed_files}, Failed: {result.failed_files}")
+        elif result.success:
             logger.info(f"Job {job_id} completed successfully. Completed: {result.completed_files}, Failed: {result.failed_files}")
         else:
             logger.error(f"Job {job_id} failed: {result.error_message}")
         
-        return result
+        return asdict(result)
         
     except Exception as e:
         logger.error(f"Error processing job {job_id}: {str(e)}")
         raise
     finally:
         db.close()
+        _release_tenant_slot(tenant_id, job_id)
+
+
+@celery.task
+def convert_files_task(job_id: str, file_ids: List[int]):
+    """Convert one chunk of a fanned-out job"""
+    import asyncio
+    db = SessionLocal()
+    try:
+        convert_files_use_case = container.create_convert_files_use_case(db)
+        result = asyncio.run(closing_loop_clients(convert_files_use_case.execute(job_id, file_ids)))
+        logger.info(f"Job {job_id}: chunk of {len(file_ids)} files done. Completed: {result.completed_files}, Failed: {result.failed_files}")
+        return asdict(result)
+        
+    except Exception as e:
+        # Never fail the chord: per-file outcomes are already recorded and
+        # the finalizer has to run for the job to leave IN_PROGRESS
+        logger.error(f"Error converting files of job {job_id}: {str(e)}")
+        return {"job_id": job_id, "success": False, "error_message": str(e)}
+    finally:
+        db.close()
+
+
+@celery.task
+def finalize_job_task(job_id: str, tenant_id: Optional[str] = None):
+    """Build the archive and settle a fanned-out job after all its chunks"""
+    import asyncio
+    db = SessionLocal()
+    try:
+        finalize_job_use_case = container.create_finalize_job_use_case(db)
+        result = asyncio.run(closing_loop_clients(finalize_job_use_case.execute(job_id)))
+        logger.info(f"Job {job_id} finalized. Completed: {result.completed_files}, Failed: {result.failed_files}")
+        return asdict(result)
+        
+    except Exception as e:
+        logger.error(f"Error finalizing job {job_id}: {str(e)}")
+        raise
+    finally:
+        db.close()
+        _release_tenant_slot(tenant_id, job_id)
+
+
+@celery.task
+def reap_stale_jobs_task():
+    """Requeue jobs whose worker stopped renewing their lease"""
+    import asyncio
+    db = SessionLocal()
+    try:
+        reap_stale_jobs_use_case = container.create_reap_stale_jobs_use_case(db)
+        return asyncio.run(closing_loop_clients(reap_stale_jobs_use_case.execute()))
+    finally:
+        db.close()
+
+
+# Run by `celery beat`; on the fast lane so a bulk backlog can't delay it
+celery.conf.beat_schedule = {
+    "reap-stale-jobs": {
+        "task": reap_stale_jobs_task.name,
+        "schedule": LEASE_REAPER_INTERVAL_SECONDS,
+        "options": {"queue": FAST_LANE}
+    }
+}
+
+
+def _release_tenant_slot(tenant_id: Optional[str], job_id: str):
+    if tenant_id is None:
+        return
+    try:
+        container.create_tenant_scheduler().release(tenant_id, job_id)
+    except Exception as e:
+        # The slot expires on its own eventually
+        logger.warning(f"Could not release running slot of job {job_id}: {str(e)}")
@@ -1,6 +1,13 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Tuple
+import asyncio
+import hmac
+import json
 import uuid
 import zipfile
 import os
@@ -8,11 +15,23 @@ import shutil
 import logging
 
 from database import (
-    get_db, create_tables, Job, File as FileModel, JobStatus, FileStatus
+    get_db, create_tables, SessionLocal, Job, File as FileModel, JobStatus,
+    FileStatus
+)
+from models import (
+    JobResponse, JobCreateResponse, FileInfo, FileListItem, FilePage, JobPriority, QuarantineEntry
+)
+from worker import queue_job, cancel_job as cancel_queued_job
+from tenant_scheduler import resolve_tenant_id
+from admission import AdmissionRejected, check_admission
+from docx_converter import validate_docx_file, DOCX_VALIDATION_MODE
+from conversion_cost import estimate_docx_conversion_seconds
+from quarantine import QUARANTINE_MAX_FAILURES, clear_quarantine, get_quarantine_entry, list_quarantine
+from zip_stream import stream_zip
+from redis_client import (
+    cache_job_status, get_cached_job_status, get_cached_job_summary,
+    get_cached_job_version, subscribe_job_events
 )
-from models import JobResponse, JobCreateResponse, FileInfo
-from worker import process_job
-from docx_converter import validate_docx_file
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,6 +43,22 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Token expected in X-Admin-Token by the admin endpoints; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Uploads are saved, extracted, validated and recorded on this bounded pool
+# so that large ingestions never block the event loop
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "4"))
+ingest_executor = ThreadPoolExecutor(
+    max_workers=INGEST_MAX_WORKERS, thread_name_prefix="ingest"
+)
+
+
+async def run_ingest(func, *args):
+    """Run blocking ingestion work on the ingest pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(ingest_executor, partial(func, *args))
+
 
 # Create database tables on startup
 @app.on_event("startup")
@@ -42,7 +77,11 @@ async def startup_event():
 )
 async def create_job(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    priority: Optional[JobPriority] = Query(
+        None, description="Queue lane: high (fast) or low (bulk); by default the job's size decides"
+    ),
+    x_tenant_id: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None)
 ):
     """
     Submit a new conversion job with a zip file containing DOCX files
@@ -55,43 +94,35 @@ async def create_job(
                 detail="Only ZIP files are allowed"
             )
         
-        # Generate unique job ID
-        job_id = str(uuid.uuid4())
+        # Tenant the job is scheduled for
+        try:
+            tenant_id = resolve_tenant_id(x_tenant_id, x_api_key)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
         
-        # Create job directory
-        job_upload_dir = f"/app/uploads/{job_id}"
-        job_output_dir = f"/app/outputs/{job_id}"
-        os.makedirs(job_upload_dir, exist_ok=True)
-        os.makedirs(job_output_dir, exist_ok=True)
+        # Refuse the job before anything is written to disk; 429 when the
+        # tenant is over its own limits, 503 when the service is
+        try:
+            await run_in_threadpool(_check_admission, tenant_id)
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=(
+                    status.HTTP_429_TOO_MANY_REQUESTS if e.tenant_limited
+                    else status.HTTP_503_SERVICE_UNAVAILABLE
+                ),
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after_seconds)}
+            )
         
-        # Save uploaded zip file
-        zip_path = f"{job_upload_dir}/uploaded_files.zip"
-        with open(zip_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Generate unique job ID
+        job_id = str(uuid.uuid4())
         
-        # Extract and validate DOCX files
-        docx_files = []
+        # Save, extract and validate off the event loop
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                for file_info in zip_ref.infolist():
-                    # Skip directories, system files, and non-DOCX files
-                    if (file_info.is_dir() or
-                            file_info.filename.startswith('__MACOSX/') or
-                            file_info.filename.startswith('.') or
-                            not file_info.filename.lower().endswith('.docx')):
-                        continue
-                    
-                    # Extract file
-                    zip_ref.extract(file_info, job_upload_dir)
-                    extracted_path = f"{job_upload_dir}/{file_info.filename}"
-                    
-                    # Validate DOCX file
-                    if validate_docx_file(extracted_path):
-                        docx_files.append(file_info.filename)
-                    else:
-                        logger.warning(
-                            f"Invalid DOCX file: {file_info.filename}"
-                        )
+            docx_files = await run_ingest(_ingest_upload, job_id, file.file)
         except zipfile.BadZipFile:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -104,27 +135,8 @@ async def create_job(
                 detail="No valid DOCX files found in the ZIP"
             )
         
-        # Create job record
-        job = Job(
-            id=job_id,
-            status=JobStatus.PENDING,
-            file_count=len(docx_files)
-        )
-        db.add(job)
-        
-        # Create file records
-        for filename in docx_files:
-            file_record = FileModel(
-                job_id=job_id,
-                filename=filename,
-                status=FileStatus.PENDING
-            )
-            db.add(file_record)
-        
-        db.commit()
-        
-        # Queue the job for processing
-        process_job.delay(job_id)
+        # Record the job and queue it for processing
+        await run_ingest(_create_job_records, job_id, docx_files, priority, tenant_id)
         
         logger.info(f"Created job {job_id} with {len(docx_files)} files")
         
@@ -143,28 +155,196 @@ async def create_job(
         )
 
 
+def _check_admission(tenant_id: str):
+    db = SessionLocal()
+    try:
+        check_admission(db, tenant_id)
+    finally:
+        db.close()
+
+
+def _ingest_upload(job_id: str, upload: BinaryIO) -> Dict[str, Optional[float]]:
+    """
+    Save the uploaded ZIP, extract it and return the valid DOCX names with
+    their predicted conversion seconds
+    """
+    # Create job directory
+    job_upload_dir = f"/app/uploads/{job_id}"
+    job_output_dir = f"/app/outputs/{job_id}"
+    os.makedirs(job_upload_dir, exist_ok=True)
+    os.makedirs(job_output_dir, exist_ok=True)
+    
+    # Save uploaded zip file
+    zip_path = f"{job_upload_dir}/uploaded_files.zip"
+    with open(zip_path, "wb") as buffer:
+        shutil.copyfileobj(upload, buffer)
+    
+    # Extract and validate DOCX files
+    docx_files = {}
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for file_info in zip_ref.infolist():
+            # Skip directories, system files, and non-DOCX files
+            if (file_info.is_dir() or
+                    file_info.filename.startswith('__MACOSX/') or
+                    file_info.filename.startswith('.') or
+                    not file_info.filename.lower().endswith('.docx')):
+                continue
+            
+            # Extract file
+            zip_ref.extract(file_info, job_upload_dir)
+            extracted_path = f"{job_upload_dir}/{file_info.filename}"
+            
+            # Validate DOCX file; the verdict is stored with the file row
+            if validate_docx_file(extracted_path, DOCX_VALIDATION_MODE):
+                docx_files[file_info.filename] = estimate_docx_conversion_seconds(extracted_path)
+            else:
+                logger.warning(
+                    f"Invalid DOCX file: {file_info.filename}"
+                )
+    return docx_files
+
+
+def _create_job_records(job_id: str, docx_files: Dict[str, Optional[float]], priority: Optional[JobPriority] = None,
+                        tenant_id: Optional[str] = None):
+    """Insert the job and its files, then queue the job on its lane"""
+    # Keep the rows loaded after commit so they can seed the status cache
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        # Create job record
+        job = Job(
+            id=job_id,
+            status=JobStatus.PENDING,
+            file_count=len(docx_files),
+            tenant_id=tenant_id,
+            # Creation is the first status change, as in the status cache
+            version=1
+        )
+        db.add(job)
+        
+        # Create file records
+        file_records = []
+        for filename, estimated_cost_seconds in docx_files.items():
+            file_record = FileModel(
+                job_id=job_id,
+                filename=filename,
+                status=FileStatus.PENDING,
+                validation_mode=DOCX_VALIDATION_MODE,
+                estimated_cost_seconds=estimated_cost_seconds
+            )
+            db.add(file_record)
+            file_records.append(file_record)
+        
+        db.commit()
+        cache_job_status(job, file_records)
+    finally:
+        db.close()
+    
+    # Queue the job for processing, on the lane of its priority or size
+    queue_job(job_id, len(docx_files), priority, tenant_id)
+
+
 @app.get("/api/v1/jobs/{job_id}", response_model=JobResponse)
-async def get_job_status(job_id: str, db: Session = Depends(get_db)):
+def get_job_status(
+    job_id: str,
+    response: Response,
+    include_files: bool = Query(True, description="Set to false for a summary with per-status counts only"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     """
     Get the status of a conversion job
+    
+    Declared sync so FastAPI runs its queries on the threadpool. Served
+    from the Redis status projection when it is complete, and answered
+    with 304 while the job's status version matches If-None-Match.
     """
-    job = db.query(Job).filter(Job.id == job_id).first()
-    if not job:
+    if if_none_match:
+        version = get_cached_job_version(job_id)
+        if version is None:
+            version = db.query(Job.version).filter(Job.id == job_id).scalar()
+        if version is not None and _etag_matches(if_none_match, _job_etag(version)):
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers={"ETag": _job_etag(version), "Cache-Control": "no-cache"}
+            )
+    
+    loaded = _load_job_status(job_id, db, include_files)
+    if loaded is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Job not found"
         )
+    job_response, version = loaded
+    response.headers["ETag"] = _job_etag(version)
+    response.headers["Cache-Control"] = "no-cache"
+    return job_response
+
+
+def _job_etag(version: int) -> str:
+    return f'W/"{version}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque_tag
+        for candidate in if_none_match.split(",")
+    )
+
+
+def _load_job_status(job_id: str, db: Session,
+                     include_files: bool = True) -> Optional[Tuple[JobResponse, int]]:
+    """The job's status response and status version, or None if it doesn't exist"""
+    if include_files:
+        cached_job = get_cached_job_status(job_id)
+    else:
+        cached_job = get_cached_job_summary(job_id)
+    if cached_job:
+        return JobResponse(
+            job_id=cached_job["id"],
+            status=cached_job["status"],
+            created_at=cached_job["created_at"],
+            download_url=cached_job["download_url"],
+            files=[
+                FileInfo(
+                    filename=file["filename"],
+                    status=file["status"],
+                    error_message=file["error_message"]
+                )
+                for file in cached_job["files"]
+            ] if include_files else None,
+            file_count=cached_job["file_count"],
+            file_counts=cached_job["file_counts"]
+        ), cached_job["version"]
     
-    # Get file statuses
-    files = db.query(FileModel).filter(FileModel.job_id == job_id).all()
-    file_infos = [
-        FileInfo(
-            filename=file.filename,
-            status=file.status,
-            error_message=file.error_message
-        )
-        for file in files
-    ]
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        return None
+    
+    # Read from the job's progress counters, without loading file rows
+    file_counts = {
+        FileStatus.PENDING: (job.file_count - job.in_progress_count
+                             - job.completed_count - job.failed_count),
+        FileStatus.IN_PROGRESS: job.in_progress_count,
+        FileStatus.COMPLETED: job.completed_count,
+        FileStatus.FAILED: job.failed_count
+    }
+    file_infos = None
+    if include_files:
+        # Get file statuses
+        files = db.query(FileModel).filter(FileModel.job_id == job_id).all()
+        cache_job_status(job, files, only_missing=True)
+        file_infos = [
+            FileInfo(
+                filename=file.filename,
+                status=file.status,
+                error_message=file.error_message
+            )
+            for file in files
+        ]
     
     return JobResponse(
         job_id=job.id,
@@ -172,12 +352,162 @@ async def get_job_status(job_id: str, db: Session = Depends(get_db)):
         created_at=job.created_at,
         download_url=job.download_url,
         files=file_infos,
-        file_count=job.file_count
+        file_count=job.file_count,
+        file_counts=file_counts
+    ), job.version
+
+
+@app.delete(
+    "/api/v1/jobs/{job_id}",
+    response_model=JobResponse,
+    status_code=status.HTTP_202_ACCEPTED
+)
+def cancel_job(job_id: str, db: Session = Depends(get_db)):
+    """
+    Cancel a pending or running job and delete its files
+    
+    Queued tasks of the job are dropped and workers running it stop within
+    JOB_CANCEL_POLL_SECONDS, killing the conversions in flight.
+    """
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    # The cancel is conditional, so a job that finished since it was read stays finished
+    if job.status != JobStatus.CANCELLED and not cancel_queued_job(db, job):
+        db.refresh(job)
+        if job.status != JobStatus.CANCELLED:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Job is already {job.status.value}"
+            )
+    job_response, _ = _load_job_status(job_id, db, include_files=False)
+    return job_response
+
+
+@app.get("/api/v1/jobs/{job_id}/files", response_model=FilePage)
+def list_job_files(
+    job_id: str,
+    file_status: Optional[FileStatus] = Query(None, alias="status"),
+    after_id: Optional[int] = Query(None, description="next_after_id of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """
+    Page through the files of a job in id order, optionally only those in one status
+    """
+    if db.query(Job.id).filter(Job.id == job_id).scalar() is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    # Keyset pagination, served by the (job_id, status, id) index
+    query = db.query(FileModel).filter(FileModel.job_id == job_id)
+    if file_status is not None:
+        query = query.filter(FileModel.status == file_status)
+    if after_id is not None:
+        query = query.filter(FileModel.id > after_id)
+    # Fetch one extra row to learn whether another page follows
+    files = query.order_by(FileModel.id).limit(limit + 1).all()
+    
+    next_after_id = None
+    if len(files) > limit:
+        files = files[:limit]
+        next_after_id = files[-1].id
+    
+    return FilePage(
+        job_id=job_id,
+        files=[
+            FileListItem(
+                id=file.id,
+                filename=file.filename,
+                status=file.status,
+                error_message=file.error_message
+            )
+            for file in files
+        ],
+        next_after_id=next_after_id
     )
 
 
+@app.get("/api/v1/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Stream the job's status as Server-Sent Events: a snapshot, then file and
+    job transitions, ending with a complete event
+    """
+    # Subscribe before reading the snapshot so no transition falls in between
+    events = subscribe_job_events(job_id)
+    try:
+        await events.__anext__()
+        loaded = await run_in_threadpool(_load_job_status_detached, job_id)
+    except Exception as e:
+        await events.aclose()
+        logger.error(f"Error subscribing to events of job {job_id}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Job events are not available"
+        )
+    
+    if loaded is None:
+        await events.aclose()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    job_response, _ = loaded
+    return StreamingResponse(
+        _job_event_stream(job_response, events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _load_job_status_detached(job_id: str) -> Optional[Tuple[JobResponse, int]]:
+    # The stream outlives the request, so don't hold a pooled connection for it
+    db = SessionLocal()
+    try:
+        return _load_job_status(job_id, db)
+    finally:
+        db.close()
+
+
+async def _job_event_stream(job_response: JobResponse, events: AsyncIterator[dict]) -> AsyncIterator[str]:
+    finished = (JobStatus.COMPLETED.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value)
+    try:
+        yield f"event: snapshot\ndata: {job_response.model_dump_json()}\n\n"
+        if job_response.status.value in finished:
+            complete = {
+                "id": job_response.job_id,
+                "status": job_response.status.value,
+                "download_url": job_response.download_url
+            }
+            yield f"event: complete\ndata: {json.dumps(complete)}\n\n"
+            return
+        
+        async for event in events:
+            if event["type"] == "heartbeat":
+                yield ": keep-alive\n\n"
+            elif event["type"] == "files":
+                for file_event in event["files"]:
+                    yield f"event: file\ndata: {json.dumps(file_event)}\n\n"
+            elif event["type"] == "job":
+                yield f"event: job\ndata: {json.dumps(event['job'])}\n\n"
+                if event["job"]["status"] in finished:
+                    yield f"event: complete\ndata: {json.dumps(event['job'])}\n\n"
+                    return
+    finally:
+        # Runs on client disconnect too, releasing the Redis subscription
+        await events.aclose()
+
+
 @app.get("/api/v1/jobs/{job_id}/download")
-async def download_job_results(job_id: str, db: Session = Depends(get_db)):
+def download_job_results(job_id: str, db: Session = Depends(get_db)):
     """
     Download the zip archive of converted PDF files
     """
@@ -212,20 +542,84 @@ async def download_job_results(job_id: str, db: Session = Depends(get_db)):
             detail="Job is not completed yet"
         )
     
-    zip_path = f"/app/outputs/{job_id}/converted_files.zip"
-    if not os.path.exists(zip_path):
+    # Build the archive on the fly from the individual PDFs
+    files = db.query(FileModel).filter(
+        FileModel.job_id == job_id,
+        FileModel.status == FileStatus.COMPLETED
+    ).all()
+    pdf_files = []
+    for file_record in files:
+        pdf_name = file_record.filename.replace('.docx', '.pdf')
+        pdf_path = f"/app/outputs/{job_id}/{pdf_name}"
+        if os.path.exists(pdf_path):
+            pdf_files.append((pdf_path, pdf_name))
+    
+    if not pdf_files:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Download file not found"
         )
     
-    return FileResponse(
-        path=zip_path,
-        filename=f"converted_files_{job_id}.zip",
-        media_type="application/zip"
+    return StreamingResponse(
+        stream_zip(pdf_files),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition":
+                f'attachment; filename="converted_files_{job_id}.zip"'
+        }
     )
 
 
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admit requests carrying the configured admin token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin API is disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+
+def require_quarantine():
+    if QUARANTINE_MAX_FAILURES <= 0:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Quarantine is disabled")
+
+
+@app.get(
+    "/api/v1/admin/quarantine",
+    response_model=List[QuarantineEntry],
+    dependencies=[Depends(require_admin), Depends(require_quarantine)]
+)
+async def list_quarantined_documents(limit: int = Query(100, ge=1, le=1000)):
+    """
+    List documents that timed out or crashed the converter, keyed by the
+    SHA-256 of their content
+    """
+    return await run_in_threadpool(list_quarantine, limit)
+
+
+@app.get(
+    "/api/v1/admin/quarantine/{content_hash}",
+    response_model=QuarantineEntry,
+    dependencies=[Depends(require_admin), Depends(require_quarantine)]
+)
+async def get_quarantined_document(content_hash: str):
+    entry = await run_in_threadpool(get_quarantine_entry, content_hash)
+    if not entry:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document is not quarantined")
+    return entry
+
+
+@app.delete(
+    "/api/v1/admin/quarantine/{content_hash}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(require_admin), Depends(require_quarantine)]
+)
+async def release_quarantined_document(content_hash: str):
+    """Release a document from quarantine, so it is converted again"""
+    if not await run_in_threadpool(clear_quarantine, content_hash):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document is not quarantined")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
 @app.get("/health")
 async def health_check():
     """
@@ -1,9 +1,16 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
+from enum import Enum
 from database import JobStatus, FileStatus
 
 
+class JobPriority(str, Enum):
+    """Explicit lane choice at submission; without one the job's size decides"""
+    HIGH = "high"
+    LOW = "low"
+
+
 class FileInfo(BaseModel):
     filename: str
     status: FileStatus
@@ -15,8 +22,21 @@ class JobResponse(BaseModel):
     status: JobStatus
     created_at: datetime
     download_url: Optional[str] = None
-    files: List[FileInfo]
+    # Omitted from summary responses (include_files=false)
+    files: Optional[List[FileInfo]] = None
     file_count: int
+    file_counts: Dict[FileStatus, int] = {}
+
+
+class FileListItem(FileInfo):
+    id: int
+
+
+class FilePage(BaseModel):
+    job_id: str
+    files: List[FileListItem]
+    # Pass as after_id to fetch the next page; None on the last page
+    next_after_id: Optional[int] = None
 
 
 class JobCreateResponse(BaseModel):
@@ -24,5 +44,16 @@ class JobCreateResponse(BaseModel):
     file_count: int
 
 
+class QuarantineEntry(BaseModel):
+    content_hash: str
+    failures: int
+    # Whether new conversions of the document are failed right away
+    quarantined: bool
+    error_message: str
+    filename: Optional[str] = None
+    last_failed_at: Optional[datetime] = None
+    expires_in_seconds: Optional[int] = None
+
+
 class ErrorResponse(BaseModel):
     detail: str
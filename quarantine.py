@@ -0,0 +1,113 @@
+"""
+Quarantine of poison documents: ones that timed out or crashed LibreOffice
+more than QUARANTINE_MAX_FAILURES times are failed right away instead of
+converted again
+"""
+import hashlib
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional
+
+import redis
+
+from redis_client import redis_client
+
+# Documents that time out or crash the converter more than this many times are
+# failed right away until QUARANTINE_TTL_SECONDS after their last failure; 0 disables it
+QUARANTINE_MAX_FAILURES = int(os.getenv("QUARANTINE_MAX_FAILURES", "2"))
+QUARANTINE_TTL_SECONDS = int(os.getenv("QUARANTINE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+KEY_PREFIX = "quarantine:"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(file_path: str) -> str:
+    """SHA-256 of the file's bytes"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def quarantined_error(file_path: str) -> Optional[str]:
+    """The error to fail the file with if it is quarantined, else None"""
+    if QUARANTINE_MAX_FAILURES <= 0:
+        return None
+    try:
+        entry = get_quarantine_entry(content_hash(file_path))
+    except (OSError, redis.RedisError) as e:
+        logger.warning(f"Could not check the quarantine for {file_path}: {str(e)}")
+        return None
+    if not entry or not entry["quarantined"]:
+        return None
+    logger.warning(f"Skipping quarantined document {file_path} ({entry['content_hash']})")
+    return f"Quarantined after {entry['failures']} failed conversions: {entry['error_message']}"
+
+
+def record_conversion_failure(file_path: str, error_message: str):
+    """Count a timeout or crash of the converter against the file's content"""
+    if QUARANTINE_MAX_FAILURES <= 0:
+        return
+    try:
+        document_hash = content_hash(file_path)
+        key = _key(document_hash)
+        pipeline = redis_client.pipeline()
+        pipeline.hincrby(key, "failures", 1)
+        pipeline.hset(key, mapping={
+            "error_message": error_message,
+            "filename": os.path.basename(file_path),
+            "last_failed_at": datetime.utcnow().isoformat()
+        })
+        pipeline.expire(key, QUARANTINE_TTL_SECONDS)
+        failures = pipeline.execute()[0]
+    except (OSError, redis.RedisError) as e:
+        logger.warning(f"Could not record the failure of {file_path}: {str(e)}")
+        return
+    if failures > QUARANTINE_MAX_FAILURES:
+        logger.warning(f"Quarantined {file_path} ({document_hash}) after {failures} failures")
+
+
+def get_quarantine_entry(document_hash: str) -> Optional[dict]:
+    pipeline = redis_client.pipeline()
+    pipeline.hgetall(_key(document_hash))
+    pipeline.ttl(_key(document_hash))
+    fields, ttl = pipeline.execute()
+    if not fields:
+        return None
+    failures = int(fields.get("failures", 0))
+    return {
+        "content_hash": document_hash,
+        "failures": failures,
+        "quarantined": failures > QUARANTINE_MAX_FAILURES,
+        "error_message": fields.get("error_message", ""),
+        "filename": fields.get("filename"),
+        "last_failed_at": fields.get("last_failed_at"),
+        "expires_in_seconds": ttl if ttl >= 0 else None
+    }
+
+
+def list_quarantine(limit: int = 100) -> List[dict]:
+    entries = []
+    for key in redis_client.scan_iter(match=f"{KEY_PREFIX}*", count=limit):
+        entry = get_quarantine_entry(key[len(KEY_PREFIX):])
+        if entry:
+            entries.append(entry)
+        if len(entries) >= limit:
+            break
+    return entries
+
+
+def clear_quarantine(document_hash: str) -> bool:
+    """Release a document so it is converted again; False if it had no entry"""
+    cleared = redis_client.delete(_key(document_hash)) == 1
+    if cleared:
+        logger.info(f"Released document {document_hash} from quarantine")
+    return cleared
+
+
+def _key(document_hash: str) -> str:
+    return f"{KEY_PREFIX}{document_hash}"
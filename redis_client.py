@@ -1,6 +1,240 @@
 import redis
+import redis.asyncio
 import os
+import json
+import logging
+from typing import AsyncIterator, List, Optional
+from database import FileStatus
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+# Lifetime of a job's status projection after its last write; 0 disables it
+STATUS_CACHE_TTL_SECONDS = int(os.getenv("STATUS_CACHE_TTL_SECONDS", "3600"))
+
+# Idle event subscribers get a heartbeat this often
+EVENT_HEARTBEAT_SECONDS = 15.0
+
+# Cancellation requests outlive any run of their job by this long
+JOB_CANCEL_TTL_SECONDS = 24 * 3600
+
+# Cached per-status file counters
+COUNT_FIELDS = {file_status: f"count:{file_status.value}" for file_status in FileStatus}
+
+# Store fields, move the per-status file counts, bump the version, refresh
+# the TTL and publish the change
+STORE_SCRIPT = """
+for i = 4, #ARGV, 2 do
+    if string.sub(ARGV[i], 1, 5) == 'file:' then
+        local previous = redis.call('HGET', KEYS[1], ARGV[i])
+        if previous then
+            redis.call('HINCRBY', KEYS[1], 'count:' .. cjson.decode(previous).status, -1)
+        end
+        redis.call('HINCRBY', KEYS[1], 'count:' .. cjson.decode(ARGV[i + 1]).status, 1)
+    end
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('PUBLISH', ARGV[2], ARGV[3])
+return version
+"""
+
+# Add missing fields and raise the version to at least the database's, so a
+# rebuilt projection never reuses a version that was already handed out
+BACKFILL_SCRIPT = """
+for i = 3, #ARGV, 2 do
+    if redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 1]) == 1
+            and string.sub(ARGV[i], 1, 5) == 'file:' then
+        redis.call('HINCRBY', KEYS[1], 'count:' .. cjson.decode(ARGV[i + 1]).status, 1)
+    end
+end
+local current = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if tonumber(ARGV[2]) > current then
+    redis.call('HSET', KEYS[1], 'version', ARGV[2])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+"""
+
 redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+store_script = redis_client.register_script(STORE_SCRIPT)
+backfill_script = redis_client.register_script(BACKFILL_SCRIPT)
+
+# Used by the API's event streams, which live on its event loop
+async_redis_client = redis.asyncio.from_url(REDIS_URL, decode_responses=True)
+
+logger = logging.getLogger(__name__)
+
+
+def _status_key(job_id: str) -> str:
+    return f"job_status:{job_id}"
+
+
+def _events_channel(job_id: str) -> str:
+    return f"job_events:{job_id}"
+
+
+def cache_job_status(job, files: Optional[List] = None, only_missing: bool = False):
+    """
+    Write a job and optionally its files to the status projection.
+
+    Takes database rows. With only_missing, fields that are already cached
+    are kept, so backfills never overwrite fresher worker writes. Failures
+    are logged only; the database stays the source of truth. Everything
+    but a backfill bumps the cached version and is published to the job's
+    event subscribers.
+    """
+    if STATUS_CACHE_TTL_SECONDS <= 0:
+        return
+    job_json = json.dumps({
+        "id": job.id,
+        "status": job.status.value,
+        "file_count": job.file_count,
+        "download_url": job.download_url,
+        "error_message": job.error_message,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None
+    })
+    event = f'{{"type": "job", "job": {job_json}}}'
+    fields = {"job": job_json}
+    if files:
+        # Job and files go in one write, which counts as a single change
+        fields.update(_file_fields(files))
+    _store_fields(job.id, fields, only_missing, event, job.version)
+
+
+def cache_file_statuses(job_id: str, files: List, only_missing: bool = False):
+    """Write file rows of one job to the status projection"""
+    if STATUS_CACHE_TTL_SECONDS <= 0 or not files:
+        return
+    fields = _file_fields(files)
+    event = f'{{"type": "files", "files": [{", ".join(fields.values())}]}}'
+    _store_fields(job_id, fields, only_missing, event)
+
+
+def _file_fields(files: List) -> dict:
+    return {
+        f"file:{file.id}": json.dumps({
+            "id": file.id,
+            "filename": file.filename,
+            "status": file.status.value,
+            "error_message": file.error_message
+        })
+        for file in files
+    }
+
+
+def get_cached_job_status(job_id: str) -> Optional[dict]:
+    """
+    Cached job as a dict with a "files" list ordered by id, or None when
+    the projection is missing or incomplete
+    """
+    if STATUS_CACHE_TTL_SECONDS <= 0:
+        return None
+    try:
+        fields = redis_client.hgetall(_status_key(job_id))
+    except redis.RedisError as e:
+        logger.warning(f"Could not read cached status of job {job_id}: {str(e)}")
+        return None
+    if "job" not in fields:
+        return None
+
+    job = json.loads(fields["job"])
+    job["files"] = sorted(
+        (json.loads(value) for name, value in fields.items() if name.startswith("file:")),
+        key=lambda f: f["id"]
+    )
+    if len(job["files"]) < job["file_count"]:
+        return None
+    job["version"] = int(fields.get("version", 0))
+    job["file_counts"] = {
+        file_status: int(fields.get(field, 0)) for file_status, field in COUNT_FIELDS.items()
+    }
+    return job
+
+
+def get_cached_job_summary(job_id: str) -> Optional[dict]:
+    """
+    Cached job as a dict with its "file_counts" but no files, read in
+    constant time, or None when the projection is missing or incomplete
+    """
+    if STATUS_CACHE_TTL_SECONDS <= 0:
+        return None
+    try:
+        job_json, version, *counts = redis_client.hmget(
+            _status_key(job_id), "job", "version", *COUNT_FIELDS.values()
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Could not read cached status of job {job_id}: {str(e)}")
+        return None
+    if job_json is None or version is None:
+        return None
+
+    job = json.loads(job_json)
+    job["version"] = int(version)
+    job["file_counts"] = {
+        file_status: int(count or 0) for file_status, count in zip(COUNT_FIELDS, counts)
+    }
+    # Same completeness rule as get_cached_job_status: the counters cover every file
+    if sum(job["file_counts"].values()) < job["file_count"]:
+        return None
+    return job
+
+
+def get_cached_job_version(job_id: str) -> Optional[int]:
+    """Cached status version of a job, without reading its files"""
+    job = get_cached_job_summary(job_id)
+    return job["version"] if job else None
+
+
+async def subscribe_job_events(job_id: str) -> AsyncIterator[dict]:
+    """
+    Status change events of a job. The first item is a "subscribed" event;
+    nothing published after it is missed.
+    """
+    pubsub = async_redis_client.pubsub()
+    try:
+        await pubsub.subscribe(_events_channel(job_id))
+        while True:
+            message = await pubsub.get_message(timeout=EVENT_HEARTBEAT_SECONDS)
+            if message is None:
+                yield {"type": "heartbeat"}
+            elif message["type"] == "subscribe":
+                yield {"type": "subscribed"}
+            elif message["type"] == "message":
+                yield json.loads(message["data"])
+    finally:
+        await pubsub.aclose()
+
+
+def request_job_cancel(job_id: str):
+    """Tell the workers running the job to stop it"""
+    redis_client.set(_cancel_key(job_id), "1", ex=JOB_CANCEL_TTL_SECONDS)
+
+
+def is_job_cancel_requested(job_id: str) -> bool:
+    try:
+        return redis_client.exists(_cancel_key(job_id)) == 1
+    except redis.RedisError as e:
+        logger.warning(f"Could not check whether job {job_id} was cancelled: {str(e)}")
+        return False
+
+
+def _cancel_key(job_id: str) -> str:
+    return f"job_cancel:{job_id}"
+
+
+def _store_fields(job_id: str, fields: dict, only_missing: bool, event: str, version: int = 0):
+    pairs = [item for field in fields.items() for item in field]
+    try:
+        if only_missing:
+            backfill_script(
+                keys=[_status_key(job_id)],
+                args=[STATUS_CACHE_TTL_SECONDS, version, *pairs]
+            )
+        else:
+            store_script(
+                keys=[_status_key(job_id)],
+                args=[STATUS_CACHE_TTL_SECONDS, _events_channel(job_id), event, *pairs]
+            )
+    except redis.RedisError as e:
+        logger.warning(f"Could not update cached status of job {job_id}: {str(e)}")
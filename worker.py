@@ -1,9 +1,29 @@
 from celery import Celery
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from typing import List, Optional
 import os
-import zipfile
+import random
+import shutil
+import time
+import uuid
 from pathlib import Path
+import redis
+from sqlalchemy import func, or_
 from database import SessionLocal, Job, File, JobStatus, FileStatus
-from docx_converter import convert_docx_to_pdf
+from docx_converter import (
+    ConversionFailure, FAILURE_PERMANENT, FAILURE_TIMEOUT, FAILURE_TRANSIENT,
+    convert_docx_file, convert_docx_batch_to_pdf, kill_conversion, clear_killed_conversion
+)
+from conversion_cost import conversion_timeout
+from quarantine import quarantined_error
+from redis_client import (
+    cache_job_status, cache_file_statuses, request_job_cancel, is_job_cancel_requested, redis_client
+)
+from models import JobPriority
+from job_lanes import FAST_LANE, LANES, configure_lanes, parse_lane_weights, select_lane
+from tenant_scheduler import tenant_scheduler, TENANT_RETRY_SECONDS
+from task_durability import configure_durable_tasks, shutdown_requested
 import logging
 
 # Configure logging
@@ -14,11 +34,158 @@ logger = logging.getLogger(__name__)
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 celery = Celery("worker", broker=REDIS_URL, backend=REDIS_URL)
 
+# Lanes this worker consumes and how strongly it favours each, e.g. "fast:3,bulk:1"
+WORKER_LANES = os.getenv("WORKER_LANES", "fast:3,bulk:1")
+configure_lanes(celery, parse_lane_weights(WORKER_LANES))
+
+# Unacknowledged tasks are redelivered after this long; keep it above the longest job
+TASK_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("TASK_VISIBILITY_TIMEOUT_SECONDS", str(6 * 3600)))
+configure_durable_tasks(celery, TASK_VISIBILITY_TIMEOUT_SECONDS)
+
+# Jobs of at most this many files are queued on the fast lane, bigger ones on the bulk lane
+FAST_LANE_MAX_FILES = int(os.getenv("FAST_LANE_MAX_FILES", "50"))
+
+# A running job renews its lease every third of this; the reaper requeues
+# jobs whose lease expired, checking every LEASE_REAPER_INTERVAL_SECONDS
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+LEASE_REAPER_INTERVAL_SECONDS = float(os.getenv("LEASE_REAPER_INTERVAL_SECONDS", "60"))
+# Workers running a job check this often whether it was cancelled
+JOB_CANCEL_POLL_SECONDS = float(os.getenv("JOB_CANCEL_POLL_SECONDS", "1"))
+
+# Number of files of a single job converted at the same time
+CONVERSION_CONCURRENCY = max(1, int(
+    os.getenv("CONVERSION_CONCURRENCY", str(os.cpu_count() or 1))
+))
+PROFILE_ROOT = "/app/temp/lo_profiles"
+
+# Small files are converted together, one LibreOffice run per batch of at most
+# this many bytes and files; 0 bytes disables batching
+CONVERSION_BATCH_MAX_BYTES = int(os.getenv("CONVERSION_BATCH_MAX_BYTES", "0"))
+CONVERSION_BATCH_MAX_FILES = max(1, int(os.getenv("CONVERSION_BATCH_MAX_FILES", "20")))
+
+# Attempts a file gets when its conversion crashes or fails around the
+# converter, and when it times out; retries back off exponentially from the
+# base delay up to the max delay
+CONVERSION_MAX_ATTEMPTS = int(os.getenv("CONVERSION_MAX_ATTEMPTS", "3"))
+CONVERSION_TIMEOUT_MAX_ATTEMPTS = int(os.getenv("CONVERSION_TIMEOUT_MAX_ATTEMPTS", "2"))
+CONVERSION_RETRY_BASE_DELAY_SECONDS = float(os.getenv("CONVERSION_RETRY_BASE_DELAY_SECONDS", "2"))
+CONVERSION_RETRY_MAX_DELAY_SECONDS = float(os.getenv("CONVERSION_RETRY_MAX_DELAY_SECONDS", "60"))
+
+# File status changes are committed every N ms or N files; an interval of 0 commits each one
+STATUS_FLUSH_INTERVAL_MS = int(os.getenv("STATUS_FLUSH_INTERVAL_MS", "500"))
+STATUS_FLUSH_MAX_BATCH = max(1, int(os.getenv("STATUS_FLUSH_MAX_BATCH", "200")))
+
+# Ids of the Celery tasks queued for a job, kept so cancelling it can revoke them
+JOB_TASKS_KEY_PREFIX = "job_tasks:"
+JOB_TASKS_TTL_SECONDS = 24 * 3600
+JOB_CANCELLED_MESSAGE = "Job was cancelled"
+
+# Job counter column of each file status past PENDING
+PROGRESS_COUNTERS = {
+    FileStatus.IN_PROGRESS: "in_progress_count",
+    FileStatus.COMPLETED: "completed_count",
+    FileStatus.FAILED: "failed_count"
+}
+
+
+def queue_job(job_id: str, file_count: int, priority: Optional[JobPriority] = None,
+              tenant_id: Optional[str] = None):
+    """Queue a job on the lane of its priority or size"""
+    lane = select_lane(file_count, priority, FAST_LANE_MAX_FILES)
+    if tenant_id:
+        try:
+            # Every queued job adds one dispatch task to the lane; each of
+            # them runs whichever job the tenant scheduler picks next
+            tenant_scheduler.push(lane, tenant_id, job_id, file_count)
+            dispatch_next_job.apply_async(args=[lane], queue=lane)
+            return
+        except redis.RedisError as e:
+            logger.warning(f"Could not schedule job {job_id}, queueing it directly: {str(e)}")
+    task_id = uuid.uuid4().hex
+    try:
+        pipeline = redis_client.pipeline()
+        pipeline.sadd(_tasks_key(job_id), task_id)
+        pipeline.expire(_tasks_key(job_id), JOB_TASKS_TTL_SECONDS)
+        pipeline.execute()
+    except redis.RedisError as e:
+        # Without the id, a cancelled job's task still stops when it starts
+        logger.warning(f"Could not record the task of job {job_id}: {str(e)}")
+    process_job.apply_async(args=[job_id], queue=lane, task_id=task_id)
+
+
+def cancel_job(db, job: Job) -> bool:
+    """
+    Cancel an unfinished job: mark it CANCELLED, take it out of the queues,
+    tell the workers running it to stop and delete its files. Whoever holds
+    the job's lease settles its unfinished files: the worker running the job
+    once it stops, otherwise the cancel itself. The reaper settles them if
+    that worker dies. Returns False, leaving the job alone, if it finished
+    since it was read.
+    """
+    if not _set_job_status(db, job, JobStatus.CANCELLED):
+        return False
+    request_job_cancel(job.id)
+    
+    if job.tenant_id:
+        try:
+            tenant_scheduler.remove(job.tenant_id, job.id, LANES.values())
+            tenant_scheduler.release(job.tenant_id, job.id)
+        except redis.RedisError as e:
+            logger.warning(f"Could not unschedule job {job.id}: {str(e)}")
+    try:
+        task_ids = list(redis_client.smembers(_tasks_key(job.id)))
+        if task_ids:
+            celery.control.revoke(task_ids)
+            logger.info(f"Revoked {len(task_ids)} tasks of job {job.id}")
+        redis_client.delete(_tasks_key(job.id))
+    except Exception as e:
+        logger.warning(f"Could not revoke the tasks of job {job.id}: {str(e)}")
+    
+    owner = uuid.uuid4().hex
+    if _acquire_lease(db, job.id, owner):
+        try:
+            _fail_unfinished_files(db, job)
+        finally:
+            _release_lease(db, job.id, owner)
+    _delete_job_files(job.id)
+    logger.info(f"Cancelled job {job.id}")
+    return True
+
+
+@celery.task(bind=True, max_retries=None)
+def dispatch_next_job(self, lane: str):
+    """Run the job the tenant scheduler picks next on this lane"""
+    picked = tenant_scheduler.next_job(lane)
+    if picked is None:
+        if tenant_scheduler.has_pending(lane):
+            # Every tenant with queued jobs is at its cap
+            raise self.retry(countdown=TENANT_RETRY_SECONDS)
+        return
+    
+    job_id, tenant_id = picked
+    try:
+        # Run it here, so the pick happens when a worker is actually free
+        process_job(job_id)
+    finally:
+        try:
+            tenant_scheduler.release(tenant_id, job_id)
+        except Exception as e:
+            # The slot expires on its own eventually
+            logger.warning(f"Could not release running slot of job {job_id}: {str(e)}")
+
 
 @celery.task
 def process_job(job_id: str):
-    """Process a conversion job"""
-    db = SessionLocal()
+    """
+    Process a conversion job, resuming it if an earlier run was cut short.
+    On worker shutdown, or if the job's lease is lost, the files in flight
+    are finished and the rest of the job is queued again. Once the job is
+    cancelled, the conversions in flight are killed and its files failed.
+    """
+    # Only this task writes the job's rows, so they stay valid across commits
+    db = SessionLocal(expire_on_commit=False)
+    job = None
+    owner = uuid.uuid4().hex
     try:
         # Get job from database
         job = db.query(Job).filter(Job.id == job_id).first()
@@ -26,77 +193,259 @@ def process_job(job_id: str):
             logger.error(f"Job {job_id} not found")
             return
         
-        # Update job status to IN_PROGRESS
-        job.status = JobStatus.IN_PROGRESS
-        db.commit()
+        # A redelivered task of a job that already finished
+        if job.status in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED):
+            logger.info(f"Job {job_id} is already {job.status.value}")
+            return
+        
+        if not _acquire_lease(db, job_id, owner):
+            logger.info(f"Job {job_id} is being processed by another worker")
+            return
         
-        # Get all files for this job
-        files = db.query(File).filter(File.job_id == job_id).all()
+        # Update job status to IN_PROGRESS, unless it was cancelled since it was read
+        if not _set_job_status(db, job, JobStatus.IN_PROGRESS):
+            logger.info(f"Job {job_id} was cancelled, skipping it")
+            # The cancel left the files to this run, which held the lease
+            _fail_unfinished_files(db, job)
+            _release_lease(db, job_id, owner)
+            return
+        
+        # Get all files for this job, longest predicted conversion first so
+        # the expensive ones don't trail behind once the rest are done
+        files = (
+            db.query(File)
+            .filter(File.job_id == job_id)
+            .order_by(File.estimated_cost_seconds.desc().nulls_last(), File.id)
+            .all()
+        )
         
-        # Process each file
+        # Process files concurrently. Conversions run in worker threads, each
+        # with its own LibreOffice profile slot; all database writes stay on
+        # this thread because the session is not thread-safe.
         completed_files = 0
         failed_files = 0
+        pending_batches = iter(_plan_batches(job_id, files))
+        # (monotonic time it may start, files) of failed files awaiting a retry
+        retry_batches = []
+        free_slots = list(range(CONVERSION_CONCURRENCY))
+        for slot in free_slots:
+            # A kill left over from a run that stopped with an error
+            clear_killed_conversion(_profile_dir(slot))
+        in_flight = {}
+        flush_interval = STATUS_FLUSH_INTERVAL_MS / 1000
+        changed_files = {}
+        # Statuses as last committed, to move the job's progress counters
+        committed_statuses = {file_record.id: file_record.status for file_record in files}
+        last_flush = time.monotonic()
+        renew_interval = JOB_LEASE_SECONDS / 3
+        next_renewal = time.monotonic() + renew_interval
+        next_cancel_check = time.monotonic() + JOB_CANCEL_POLL_SECONDS
+        interrupted = False
+        cancelled = False
         
-        for file_record in files:
-            try:
-                # Update file status to IN_PROGRESS
-                file_record.status = FileStatus.IN_PROGRESS
+        def flush_statuses(force: bool = False):
+            # Coalesce status changes into one transaction per interval/batch
+            nonlocal last_flush
+            if not changed_files:
+                return
+            if (force or len(changed_files) >= STATUS_FLUSH_MAX_BATCH or
+                    time.monotonic() - last_flush >= flush_interval):
+                _move_progress_counters(job, changed_files.values(), committed_statuses)
+                job.version = Job.version + 1
                 db.commit()
+                cache_file_statuses(job_id, list(changed_files.values()))
+                changed_files.clear()
+                last_flush = time.monotonic()
+        
+        with ThreadPoolExecutor(max_workers=CONVERSION_CONCURRENCY) as executor:
+            
+            def next_batch() -> Optional[List[File]]:
+                # Retries whose backoff is over go first
+                now = time.monotonic()
+                for index, (ready_at, batch) in enumerate(retry_batches):
+                    if ready_at <= now:
+                        del retry_batches[index]
+                        return batch
+                return next(pending_batches, None)
+            
+            def submit_next_batch() -> bool:
+                nonlocal completed_files, failed_files, interrupted
+                while True:
+                    batch = next_batch()
+                    if batch is None:
+                        return False
+                    # Resuming: keep what an earlier run converted, and what
+                    # it gave up on, instead of paying its timeouts again
+                    to_convert = []
+                    for file_record in batch:
+                        if (file_record.status == FileStatus.COMPLETED and
+                                os.path.exists(_output_path(job_id, file_record.filename))):
+                            completed_files += 1
+                        elif file_record.status == FileStatus.FAILED:
+                            failed_files += 1
+                        else:
+                            to_convert.append(file_record)
+                    if to_convert:
+                        break
+                if cancelled:
+                    return False
+                if interrupted or shutdown_requested.is_set():
+                    interrupted = True
+                    return False
                 
-                # Convert the file
-                input_path = f"/app/uploads/{job_id}/{file_record.filename}"
-                output_path = (
-                    f"/app/outputs/{job_id}/"
-                    f"{file_record.filename.replace('.docx', '.pdf')}"
-                )
-                
-                # Ensure output directory exists
-                Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-                
-                # Convert DOCX to PDF
-                success = convert_docx_to_pdf(input_path, output_path)
+                # Update file status to IN_PROGRESS
+                for file_record in to_convert:
+                    file_record.status = FileStatus.IN_PROGRESS
+                    file_record.attempts = (file_record.attempts or 0) + 1
+                    changed_files[file_record.id] = file_record
+                flush_statuses()
                 
-                if success:
-                    file_record.status = FileStatus.COMPLETED
-                    completed_files += 1
-                    logger.info(f"Successfully converted {file_record.filename}")
+                slot = free_slots.pop()
+                estimates = [
+                    file_record.estimated_cost_seconds for file_record in to_convert
+                    if file_record.estimated_cost_seconds is not None
+                ]
+                future = executor.submit(
+                    _convert_files, job_id, [file_record.filename for file_record in to_convert], _profile_dir(slot),
+                    all(file_record.validation_mode is not None for file_record in to_convert),
+                    conversion_timeout(sum(estimates) if estimates else None),
+                    [conversion_timeout(file_record.estimated_cost_seconds) for file_record in to_convert]
+                )
+                in_flight[future] = (to_convert, slot)
+                return True
+            
+            while free_slots and submit_next_batch():
+                pass
+            
+            while in_flight or (retry_batches and not interrupted and not cancelled and
+                                not shutdown_requested.is_set()):
+                # Wake up at least once per interval to flush buffered
+                # statuses, in time to renew the lease or check for a
+                # cancellation, and when a retry is due
+                timeout = max(0, min(next_renewal, next_cancel_check) - time.monotonic())
+                if changed_files:
+                    timeout = min(timeout, flush_interval)
+                if retry_batches:
+                    timeout = min(timeout, max(0, min(ready_at for ready_at, _ in retry_batches) - time.monotonic()))
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
                 else:
-                    file_record.status = FileStatus.FAILED
-                    file_record.error_message = "Conversion failed"
-                    failed_files += 1
-                    logger.error(f"Failed to convert {file_record.filename}")
-                
-                db.commit()
-                
-            except Exception as e:
-                file_record.status = FileStatus.FAILED
-                file_record.error_message = str(e)
-                failed_files += 1
-                logger.error(
-                    f"Error processing {file_record.filename}: {str(e)}"
+                    # Only retries are left; wait out their backoff, or a shutdown
+                    shutdown_requested.wait(timeout)
+                    done = set()
+                if time.monotonic() >= next_renewal:
+                    # Committing flushes the buffered statuses, so move their counters first
+                    flush_statuses(force=True)
+                    if not _renew_lease(db, job_id, owner):
+                        logger.warning(f"Job {job_id} lost its lease, stopping after the files in flight")
+                        interrupted = True
+                    next_renewal = time.monotonic() + renew_interval
+                if not cancelled and time.monotonic() >= next_cancel_check:
+                    cancelled = is_job_cancel_requested(job_id)
+                    next_cancel_check = time.monotonic() + JOB_CANCEL_POLL_SECONDS
+                    if cancelled:
+                        logger.info(f"Job {job_id} was cancelled, killing its conversions")
+                        for _, slot in in_flight.values():
+                            kill_conversion(_profile_dir(slot))
+                for future in done:
+                    batch, slot = in_flight.pop(future)
+                    # Its conversions returned, so a kill no longer applies to the slot
+                    clear_killed_conversion(_profile_dir(slot))
+                    free_slots.append(slot)
+                    if cancelled:
+                        # Its files are failed with the rest below
+                        continue
+                    try:
+                        failures = future.result()
+                    except Exception as e:
+                        failures = [ConversionFailure(FAILURE_TRANSIENT, str(e))] * len(batch)
+                    
+                    retries = []
+                    for file_record, failure in zip(batch, failures):
+                        if failure is None:
+                            file_record.status = FileStatus.COMPLETED
+                            completed_files += 1
+                            logger.info(
+                                f"Successfully converted {file_record.filename}"
+                            )
+                        elif _should_retry(failure.kind, file_record.attempts):
+                            # Back to PENDING until the retry, which only
+                            # converts the files that failed
+                            file_record.status = FileStatus.PENDING
+                            file_record.last_error = failure.message
+                            retries.append(file_record)
+                            logger.warning(
+                                f"Attempt {file_record.attempts} to convert {file_record.filename} "
+                                f"failed, retrying: {failure.message}"
+                            )
+                        else:
+                            file_record.status = FileStatus.FAILED
+                            file_record.error_message = failure.message
+                            file_record.last_error = failure.message
+                            failed_files += 1
+                            logger.error(
+                                f"Failed to convert {file_record.filename}: {failure.message}"
+                            )
+                        changed_files[file_record.id] = file_record
+                    if retries:
+                        delay = _retry_delay(max(file_record.attempts for file_record in retries))
+                        retry_batches.append((time.monotonic() + delay, retries))
+                    flush_statuses()
+                while free_slots and submit_next_batch():
+                    pass
+                flush_statuses()
+        
+        # Retries still waiting are left to the run that resumes the job
+        if retry_batches and not cancelled:
+            interrupted = True
+        
+        # Terminal file states must be stored before the job is finalized
+        flush_statuses(force=True)
+        
+        if not cancelled and not interrupted:
+            # The download endpoint streams the archive from the PDFs
+            if completed_files > 0:
+                finalized = _set_job_status(
+                    db, job, JobStatus.COMPLETED, download_url=f"/api/v1/jobs/{job_id}/download"
                 )
-                db.commit()
+            else:
+                finalized = _set_job_status(
+                    db, job, JobStatus.FAILED, error_message=f"All {len(files)} files failed to convert"
+                )
+            # A job cancelled after the last poll stays CANCELLED
+            cancelled = not finalized
         
-        # Create zip archive if there are completed files
+        if cancelled:
+            _fail_unfinished_files(db, job)
+            _release_lease(db, job_id, owner)
+            _delete_job_files(job_id)
+            logger.info(
+                f"Job {job_id} cancelled. Success: {completed_files}, "
+                f"Failed: {failed_files}"
+            )
+            return
+        
+        if interrupted:
+            # The job stays IN_PROGRESS, unheld, so the reaper leaves it to
+            # the queued task however long it waits
+            _release_lease(db, job_id, owner)
+            queue_job(job_id, job.file_count, tenant_id=job.tenant_id)
+            logger.info(
+                f"Job {job_id} handed back. Success: {completed_files}, "
+                f"Failed: {failed_files}"
+            )
+            return
+        
+        _release_lease(db, job_id, owner)
         if completed_files > 0:
-            zip_path = f"/app/outputs/{job_id}/converted_files.zip"
-            create_zip_archive(job_id, zip_path)
-            
-            # Update job with download URL
-            job.download_url = f"/api/v1/jobs/{job_id}/download"
-            job.status = JobStatus.COMPLETED
             logger.info(
                 f"Job {job_id} completed successfully with "
                 f"{completed_files} files converted"
             )
         else:
-            job.status = JobStatus.FAILED
-            job.error_message = f"All {len(files)} files failed to convert"
             logger.error(
                 f"Job {job_id} failed: All files failed to convert"
             )
-        
-        db.commit()
         logger.info(
             f"Job {job_id} completed. Success: {completed_files}, "
             f"Failed: {failed_files}"
@@ -104,19 +453,255 @@ def process_job(job_id: str):
         
     except Exception as e:
         logger.error(f"Error processing job {job_id}: {str(e)}")
-        job.status = JobStatus.FAILED
-        job.error_message = str(e)
-        db.commit()
+        if job:
+            # Drop unflushed file changes, which have no counter moves
+            db.rollback()
+            _set_job_status(db, job, JobStatus.FAILED, error_message=str(e))
+            _release_lease(db, job_id, owner)
     finally:
         db.close()
 
 
-def create_zip_archive(job_id: str, zip_path: str):
-    """Create a zip archive of all converted PDF files"""
-    output_dir = f"/app/outputs/{job_id}"
+@celery.task
+def reap_stale_jobs():
+    """
+    Requeue IN_PROGRESS jobs whose worker stopped renewing their lease, and
+    settle the files of cancelled ones the worker died before settling
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        # Jobs nobody holds are waiting in the backlog, or already settled,
+        # and are left alone
+        stale_jobs = (
+            db.query(Job)
+            .filter(
+                Job.status.in_([JobStatus.IN_PROGRESS, JobStatus.CANCELLED]),
+                Job.lease_owner.is_not(None),
+                Job.lease_expires_at < now
+            )
+            .order_by(Job.lease_expires_at)
+            .limit(100)
+            .all()
+        )
+        reaped = []
+        for job in stale_jobs:
+            # Conditional, so two reapers never both claim a job; releasing
+            # the lease has the job queued once until a worker holds it again
+            claimed = db.query(Job).filter(
+                Job.id == job.id, Job.lease_owner.is_not(None), Job.lease_expires_at < now
+            ).update({
+                Job.lease_owner: None,
+                Job.lease_expires_at: None
+            }, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                continue
+            if job.status == JobStatus.CANCELLED:
+                logger.warning(f"Cancelled job {job.id} lost its worker, settling its files")
+                _fail_unfinished_files(db, job)
+                _delete_job_files(job.id)
+            else:
+                logger.warning(f"Job {job.id} lost its worker, requeueing it")
+                queue_job(job.id, job.file_count, tenant_id=job.tenant_id)
+            reaped.append(job.id)
+        return reaped
+    finally:
+        db.close()
+
+
+# Run by `celery beat`; on the fast lane so a bulk backlog can't delay it
+celery.conf.beat_schedule = {
+    "reap-stale-jobs": {
+        "task": reap_stale_jobs.name,
+        "schedule": LEASE_REAPER_INTERVAL_SECONDS,
+        "options": {"queue": FAST_LANE}
+    }
+}
+
+
+def _set_job_status(db, job: Job, job_status: JobStatus, **values) -> bool:
+    """
+    Store the job's new status only while it is PENDING or IN_PROGRESS, so a
+    cancel and a worker finishing the job can't overwrite each other's status.
+    False if the job was cancelled or finished meanwhile.
+    """
+    updated = db.query(Job).filter(
+        Job.id == job.id, Job.status.in_([JobStatus.PENDING, JobStatus.IN_PROGRESS])
+    ).update({
+        Job.status: job_status,
+        Job.version: Job.version + 1,
+        **{getattr(Job, column): value for column, value in values.items()}
+    }, synchronize_session=False)
+    db.commit()
+    if updated:
+        db.refresh(job)
+        cache_job_status(job)
+    return updated == 1
+
+
+def _acquire_lease(db, job_id: str, owner: str) -> bool:
+    """Take the job's lease when it is free, expired or already ours"""
+    now = datetime.utcnow()
+    acquired = db.query(Job).filter(
+        Job.id == job_id,
+        or_(Job.lease_owner.is_(None), Job.lease_owner == owner, Job.lease_expires_at < now)
+    ).update({
+        Job.lease_owner: owner,
+        Job.lease_expires_at: now + timedelta(seconds=JOB_LEASE_SECONDS)
+    }, synchronize_session=False)
+    db.commit()
+    return acquired == 1
+
+
+def _renew_lease(db, job_id: str, owner: str) -> bool:
+    renewed = db.query(Job).filter(Job.id == job_id, Job.lease_owner == owner).update({
+        Job.lease_expires_at: datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+    }, synchronize_session=False)
+    db.commit()
+    return renewed == 1
+
+
+def _release_lease(db, job_id: str, owner: str):
+    db.query(Job).filter(Job.id == job_id, Job.lease_owner == owner).update({
+        Job.lease_owner: None,
+        Job.lease_expires_at: None
+    }, synchronize_session=False)
+    db.commit()
+
+
+def _move_progress_counters(job, file_records, committed_statuses: dict):
+    """Apply the files' status changes to the job's counters, in the same transaction"""
+    deltas = {file_status: 0 for file_status in FileStatus}
+    for file_record in file_records:
+        deltas[committed_statuses[file_record.id]] -= 1
+        deltas[file_record.status] += 1
+        committed_statuses[file_record.id] = file_record.status
+    for file_status, column in PROGRESS_COUNTERS.items():
+        if deltas[file_status]:
+            setattr(job, column, getattr(Job, column) + deltas[file_status])
+
+
+def _fail_unfinished_files(db, job: Job):
+    """Fail the files of a cancelled job that never reached a final state, moving its counters"""
+    counts = dict(
+        db.query(File.status, func.count(File.id))
+        .filter(File.job_id == job.id, File.status.in_([FileStatus.PENDING, FileStatus.IN_PROGRESS]))
+        .group_by(File.status)
+        .all()
+    )
+    if counts:
+        db.query(File).filter(
+            File.job_id == job.id, File.status.in_([FileStatus.PENDING, FileStatus.IN_PROGRESS])
+        ).update({
+            File.status: FileStatus.FAILED,
+            File.error_message: JOB_CANCELLED_MESSAGE
+        })
+        job.in_progress_count = Job.in_progress_count - counts.get(FileStatus.IN_PROGRESS, 0)
+        job.failed_count = Job.failed_count + sum(counts.values())
+    job.version = Job.version + 1
+    db.commit()
+    # Reload, so the cached status is the one the cancel stored
+    db.refresh(job)
+    files = db.query(File).filter(File.job_id == job.id).all() if counts else None
+    cache_job_status(job, files)
+
+
+def _delete_job_files(job_id: str):
+    shutil.rmtree(f"/app/uploads/{job_id}", ignore_errors=True)
+    shutil.rmtree(f"/app/outputs/{job_id}", ignore_errors=True)
+
+
+def _tasks_key(job_id: str) -> str:
+    return f"{JOB_TASKS_KEY_PREFIX}{job_id}"
+
+
+def _should_retry(failure_kind: str, attempts: int) -> bool:
+    if failure_kind == FAILURE_PERMANENT:
+        return False
+    if failure_kind == FAILURE_TIMEOUT:
+        return attempts < CONVERSION_TIMEOUT_MAX_ATTEMPTS
+    return attempts < CONVERSION_MAX_ATTEMPTS
+
+
+def _retry_delay(attempts: int) -> float:
+    """Backoff before retrying a file that failed `attempts` times, with jitter"""
+    delay = min(CONVERSION_RETRY_MAX_DELAY_SECONDS, CONVERSION_RETRY_BASE_DELAY_SECONDS * 2 ** max(0, attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+
+def _plan_batches(job_id: str, files: List[File]) -> List[List[File]]:
+    """
+    Group the job's small files into batches for one LibreOffice run each;
+    every other file is a batch of its own
+    """
+    if CONVERSION_BATCH_MAX_BYTES <= 0:
+        return [[file_record] for file_record in files]
     
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for file_path in Path(output_dir).glob("*.pdf"):
-            zipf.write(file_path, file_path.name)
+    batches, batch, batch_bytes = [], [], 0
+    for file_record in files:
+        try:
+            size = os.path.getsize(f"/app/uploads/{job_id}/{file_record.filename}")
+        except OSError:
+            size = None
+        if size is None or size > CONVERSION_BATCH_MAX_BYTES:
+            batches.append([file_record])
+            continue
+        if batch and (batch_bytes + size > CONVERSION_BATCH_MAX_BYTES or
+                      len(batch) >= CONVERSION_BATCH_MAX_FILES):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(file_record)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _convert_files(job_id: str, filenames: List[str], profile_dir: str, validated: bool,
+                   timeout: float, file_timeouts: List[float]) -> List[Optional[ConversionFailure]]:
+    """
+    Convert files of a job using the given LibreOffice profile and
+    return why each one failed, None if it was converted. timeout bounds
+    the run of them all, file_timeouts each file converted on its own.
+
+    Quarantined documents fail right away without reaching LibreOffice.
+    """
+    conversions = [
+        (f"/app/uploads/{job_id}/{filename}", _output_path(job_id, filename))
+        for filename in filenames
+    ]
+    failures: List[Optional[ConversionFailure]] = []
+    admitted = []
+    admitted_timeouts = []
+    for conversion, file_timeout in zip(conversions, file_timeouts):
+        error = quarantined_error(conversion[0])
+        failures.append(ConversionFailure(FAILURE_PERMANENT, error) if error else None)
+        if not error:
+            admitted.append(conversion)
+            admitted_timeouts.append(file_timeout)
+    if len(admitted) > 1:
+        converted = convert_docx_batch_to_pdf(
+            admitted, profile_dir, validated=validated, timeout=timeout, file_timeouts=admitted_timeouts
+        )
+    elif admitted:
+        input_path, output_path = admitted[0]
+        # Ensure output directory exists
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        converted = [convert_docx_file(
+            input_path, output_path, profile_dir=profile_dir, validated=validated,
+            timeout=admitted_timeouts[0]
+        )]
+    else:
+        converted = []
     
-    logger.info(f"Created zip archive: {zip_path}")
+    results = iter(converted)
+    return [failure or next(results) for failure in failures]
+
+
+def _profile_dir(slot: int) -> str:
+    return f"{PROFILE_ROOT}/{os.getpid()}-{slot}"
+
+
+def _output_path(job_id: str, filename: str) -> str:
+    return f"/app/outputs/{job_id}/{filename.replace('.docx', '.pdf')}"
@@ -0,0 +1,56 @@
+import io
+import zipfile
+from typing import Iterable, Iterator, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _ZipStreamSink(io.RawIOBase):
+    """Unseekable sink that collects what ZipFile writes until drained"""
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def stream_zip(files: Iterable[Tuple[str, str]]) -> Iterator[bytes]:
+    """
+    Yield a ZIP archive of (file_path, archive_name) pairs as it is built.
+
+    Entries are stored uncompressed (PDFs are already compressed) and ZIP64
+    records are added automatically for large members and archives. Because
+    the sink is unseekable, sizes and CRCs go into data descriptors, so
+    nothing is ever written to disk.
+    """
+    sink = _ZipStreamSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED, allowZip64=True) as zipf:
+        for file_path, archive_name in files:
+            zinfo = zipfile.ZipInfo.from_file(file_path, archive_name)
+            zinfo.compress_type = zipfile.ZIP_STORED
+            with open(file_path, 'rb') as src, zipf.open(zinfo, 'w') as dest:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    data = sink.drain()
+    if data:
+        yield data